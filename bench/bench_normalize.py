@@ -0,0 +1,75 @@
+"""Time the normalization of large generated queries.
+
+    PYTHONPATH=. python bench/bench_normalize.py [repeats]
+
+from the top of the checkout (or with sunburnt installed).
+
+Wide queries OR together hundreds of clauses, as machine-generated
+queries often do; deep ones nest ANDs and ORs (and NOTs and boosts)
+inside one another. Each query is built afresh, and its frozen nodes
+forgotten, before every run, so that what's timed is normalizing it
+from scratch rather than looking up the remembered result.
+"""
+import sys, time
+
+from lxml.builder import E
+
+from sunburnt.schema import SolrSchema
+from sunburnt.search import LuceneQuery
+
+schema = SolrSchema(E.schema(
+    E.types(
+        E.fieldType({'name':'string', 'class':'solr.StrField'}),
+        E.fieldType({'name':'int', 'class':'solr.IntField'})),
+    E.fields(
+        E.field({'name':'id', 'type':'int'}),
+        E.field({'name':'tag', 'type':'string'})),
+    E.defaultSearchField('tag'),
+    E.uniqueKey('id')).getroottree())
+
+
+def Q(**kwargs):
+    q = LuceneQuery(schema)
+    q.add((), kwargs)
+    return q
+
+def wide(clauses):
+    q = Q(tag="tag0")
+    for i in range(1, clauses):
+        q = q | Q(tag="tag%d" % i) & Q(id=i)
+    return q
+
+def deep(depth):
+    q = Q(id=0)
+    for i in range(1, depth):
+        if i % 4 == 0:
+            q = ~q & Q(tag="tag%d" % i)
+        elif i % 4 == 1:
+            q = q ** 2 | Q(id=i)
+        elif i % 2:
+            q = q | Q(tag="tag%d" % i)
+        else:
+            q = Q(id=i) & q
+    return q
+
+def bench(make, size, repeats):
+    best = None
+    for i in range(repeats):
+        schema.query_nodes.clear()
+        q = make(size)
+        start = time.time()
+        q.normalize()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main(argv):
+    repeats = int(argv[1]) if len(argv) > 1 else 5
+    # (the deep queries stay within the recursion limit when serialized)
+    for name, make, sizes in (("wide", wide, (100, 500, 2000)),
+                              ("deep", deep, (50, 100, 200))):
+        for size in sizes:
+            print "%s %5d: %8.2fms" % (name, size, bench(make, size, repeats) * 1000)
+
+if __name__ == '__main__':
+    main(sys.argv)
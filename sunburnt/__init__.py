@@ -1,8 +1,11 @@
 from __future__ import absolute_import
 
+from .cache import QueryCache, ValidatorCache
+from .indexing import BufferedIndexer, BulkIndexer, BulkIndexError, RejectedDocumentsError
+from .search import Param
 from .strings import RawString
 from .sunburnt import SolrError, SolrInterface
 
 __version__ = '0.7'
 
-__all__ = ['RawString', 'SolrError', 'SolrInterface']
+__all__ = ['BufferedIndexer', 'BulkIndexer', 'BulkIndexError', 'Param', 'QueryCache', 'RawString', 'RejectedDocumentsError', 'SolrError', 'SolrInterface', 'ValidatorCache']
@@ -0,0 +1,221 @@
+"""Client-side caches of query responses.
+
+QueryCache holds the raw bodies of Solr's responses to queries, keyed on
+their parameters, so that repeated queries can be answered without a
+round trip to Solr. Responses are parsed afresh on each hit, so callers
+never share result objects.
+
+ValidatorCache holds responses along with their HTTP validators (ETag
+and Last-Modified), so that repeated queries can be sent as conditional
+requests, and the response reused if Solr says it hasn't changed.
+
+CountCache holds the numbers of results searches have been told about,
+so that a search and its clones needn't ask again.
+"""
+from __future__ import absolute_import
+
+import collections, threading, time
+
+
+class QueryCache(object):
+    """A least-recently-used cache of response bodies, holding at most
+    max_entries responses and (if max_bytes is given) at most max_bytes
+    of them in total. If ttl is given, responses are dropped once they
+    are that many seconds old.
+
+    A cache passed to SolrInterface is cleared whenever that interface
+    sends an update (an add, delete, commit, optimize or rollback), but
+    it knows nothing of updates made by anyone else, so without a ttl
+    it may go on returning results which Solr has since changed. Each
+    clear() starts a new generation; a response put with the generation
+    from before it was requested is dropped if the cache has been
+    cleared in the meantime, as it may predate the update.
+
+    It is safe to share between threads.
+    """
+    def __init__(self, max_entries=1000, max_bytes=None, ttl=None, clock=time.time):
+        if max_entries < 1:
+            raise ValueError("QueryCache needs room for at least one entry")
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = collections.OrderedDict()
+        self.bytes = 0
+        self.generation = 0
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """Return the body stored for key, or None."""
+        with self.lock:
+            try:
+                expires, body = self.entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return None
+            if expires is not None and expires <= self.clock():
+                self.bytes -= len(body)
+                self.misses += 1
+                return None
+            # Move it to the most recently used end.
+            self.entries[key] = expires, body
+            self.hits += 1
+            return body
+
+    def put(self, key, body, generation=None):
+        """Store body for key, unless generation is given and the cache
+        has been cleared since it was read."""
+        if self.max_bytes is not None and len(body) > self.max_bytes:
+            # Would push everything else out, and still not fit.
+            return
+        expires = None if self.ttl is None else self.clock() + self.ttl
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.bytes -= len(old[1])
+            self.entries[key] = expires, body
+            self.bytes += len(body)
+            while len(self.entries) > self.max_entries or \
+                    (self.max_bytes is not None and self.bytes > self.max_bytes):
+                old_key, (old_expires, old_body) = self.entries.popitem(last=False)
+                self.bytes -= len(old_body)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop every entry, as when the index has changed."""
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+            self.generation += 1
+            self.invalidations += 1
+
+    def stats(self):
+        """Return a dictionary of counts of hits, misses, evictions and
+        invalidations, and the current number of entries and bytes."""
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions,
+                    'invalidations': self.invalidations,
+                    'entries': len(self.entries), 'bytes': self.bytes}
+
+
+class ValidatorCache(object):
+    """Remembers, for up to max_entries query URLs, the last response
+    Solr sent with an ETag or Last-Modified header, so that the query
+    can be sent again as a conditional request. If Solr answers 304 Not
+    Modified, the stored body (and the response parsed from it, if it's
+    been parsed before) is used rather than transferring and parsing
+    the same response again.
+
+    This relies on Solr's HTTP caching being turned on, which it isn't
+    in the example solrconfig.xml (<httpCaching never304="true"/>, which
+    sends no validators at all); set never304="false", with
+    lastModifiedFrom and etagSeed, in the core's <requestDispatcher>.
+    Responses without validators aren't stored. It is safe to share
+    between threads.
+    """
+    def __init__(self, max_entries=1000):
+        if max_entries < 1:
+            raise ValueError("ValidatorCache needs room for at least one entry")
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, url):
+        """Return the ValidatedResponse stored for url, or None."""
+        with self.lock:
+            entry = self.entries.pop(url, None)
+            if entry is not None:
+                self.entries[url] = entry
+            return entry
+
+    def put(self, url, entry):
+        with self.lock:
+            self.entries.pop(url, None)
+            self.entries[url] = entry
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def record(self, revalidated):
+        with self.lock:
+            if revalidated:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        """Return a dictionary of counts of hits (responses reused after
+        a 304), misses, and the current number of entries."""
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'entries': len(self.entries)}
+
+
+class ValidatedResponse(object):
+    def __init__(self, body, etag=None, last_modified=None, parsed=None):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.parsed = parsed
+
+    def conditional_headers(self):
+        headers = {}
+        if self.etag is not None:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified is not None:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class CountCache(object):
+    """The numbers of results of up to max_entries searches, keyed on
+    their parameters, each good only for the connection generation it
+    was found in (see SolrConnection.update()). Entries from earlier
+    generations are dropped as soon as a count from a later one is put,
+    and a count from an earlier generation than the cache's isn't kept.
+    It is safe to share between threads.
+    """
+    def __init__(self, max_entries=100):
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+        self.generation = None
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, generation):
+        """Return the count stored for key in generation, or None."""
+        with self.lock:
+            if generation != self.generation:
+                return None
+            count = self.entries.pop(key, None)
+            if count is not None:
+                self.entries[key] = count
+            return count
+
+    def put(self, key, generation, count):
+        with self.lock:
+            if generation != self.generation:
+                if self.generation is not None and generation < self.generation:
+                    return
+                self.entries.clear()
+                self.generation = generation
+            self.entries.pop(key, None)
+            self.entries[key] = count
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
@@ -0,0 +1,90 @@
+"""Collecting query results into columns, one per field, rather than
+into a dictionary per document.
+
+Single-valued numeric fields are collected into typed arrays, using the
+array typecode their field class gives (see array_typecode in schema.py).
+If NumPy is installed, those become NumPy arrays, and date fields become
+datetime64 arrays. Every other field, and any field which is missing from
+some documents or has several values, is collected into a list, with None
+for documents which lack it.
+"""
+from __future__ import absolute_import
+
+import array, datetime
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .dates import utc
+
+
+class ColumnBuilder(object):
+    def __init__(self, schema):
+        self.schema = schema
+        self.columns = {}
+        self.rows = 0
+
+    def add_row(self, fields):
+        """Add a document, from an iterable of (name, value) pairs of
+        converted field values."""
+        columns = self.columns
+        row = self.rows
+        for name, value in fields:
+            try:
+                column = columns[name]
+            except KeyError:
+                column = columns[name] = self.new_column(name)
+            if len(column) != row:
+                column = self.as_list(name, row)
+            try:
+                column.append(value)
+            except (TypeError, OverflowError):
+                # A value the typed array can't hold, such as a tuple
+                # of several values.
+                column = self.as_list(name, row)
+                column.append(value)
+        self.rows = row + 1
+
+    def new_column(self, name):
+        typecode = getattr(self.schema.match_field(name), "array_typecode", None)
+        if name == "score":
+            typecode = "d"
+        if typecode is None or self.rows:
+            return [None] * self.rows
+        return array.array(typecode)
+
+    def as_list(self, name, rows):
+        """Turn a column into a list, padded with None up to rows."""
+        column = self.columns[name]
+        if isinstance(column, array.array):
+            column = column.tolist()
+        column.extend([None] * (rows - len(column)))
+        self.columns[name] = column
+        return column
+
+    def finish(self):
+        """Return the columns, as a dictionary keyed on field name."""
+        for name, column in self.columns.items():
+            if len(column) != self.rows:
+                column = self.as_list(name, self.rows)
+            if numpy is not None:
+                self.columns[name] = self.to_numpy(name, column)
+        return self.columns
+
+    def to_numpy(self, name, column):
+        if isinstance(column, array.array):
+            return numpy.array(column, dtype=column.typecode)
+        dtype = getattr(self.schema.match_field(name), "numpy_dtype", None)
+        if dtype is not None and all(isinstance(v, datetime.datetime) or v is None
+                                     for v in column):
+            # datetime64 has no timezone; values are in UTC.
+            return numpy.array([v and naive_utc(v) for v in column], dtype=dtype)
+        return column
+
+
+def naive_utc(dt):
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(utc).replace(tzinfo=None)
+    return dt
@@ -1,4 +1,5 @@
 import socket
+from StringIO import StringIO
 
 try:
     import requests
@@ -34,7 +35,12 @@ class RequestWrapper(object):
     def __init__(self, conn):
         self.conn = conn
 
-    def request(self, method, url, data=None, headers=None):
+    def request(self, method, url, data=None, headers=None, stream=False):
+        # httplib2 always reads the whole response; stream is accepted
+        # for compatibility, and the body is served from memory.
+        if data is not None and not isinstance(data, basestring):
+            # httplib2 can't send a streaming body, so collect it first
+            data = ''.join(data)
         response, content = self.conn.request(url, method=method, body=data, headers=headers)
         return ResponseWrapper(response, content)
 
@@ -46,5 +52,11 @@ class ResponseWrapper(object):
     """
     def __init__(self, response, content):
         self.status_code = response.status
+        # httplib2's response is a dictionary of (lower-cased) headers
+        self.headers = response if hasattr(response, 'get') else {}
         self.content = content
 
+    @property
+    def raw(self):
+        return StringIO(self.content)
+
@@ -0,0 +1,517 @@
+from __future__ import absolute_import
+
+from collections import OrderedDict
+from itertools import count, islice
+import Queue, threading, time
+
+from .schema import SolrDelete, SolrError
+
+
+class BulkIndexError(SolrError):
+    """Raised when some of the chunks sent by a BulkIndexer could not be
+    indexed. errors is a list of (chunk number, docs, exception) tuples,
+    ordered by chunk number."""
+    def __init__(self, errors):
+        self.errors = sorted(errors, key=lambda error: error[0])
+        chunk_number, _, e = self.errors[0]
+        super(BulkIndexError, self).__init__(
+            "%s update chunk(s) failed; first failure in chunk %s: %r" %
+            (len(self.errors), chunk_number, e))
+
+
+class RejectedDocumentsError(SolrError):
+    """Raised by add(..., isolate_errors=True) when some documents could
+    not be indexed; all the others have been. rejected is a list of
+    (doc, exception, body) tuples, where body is the text of Solr's error
+    response, or None if the document couldn't be serialized at all."""
+    def __init__(self, rejected):
+        self.rejected = rejected
+        doc, e, body = rejected[0]
+        super(RejectedDocumentsError, self).__init__(
+            "%s document(s) rejected; first failure: %r" % (len(rejected), body or e))
+
+
+class BulkIndexer(object):
+    """Add documents to Solr with several update requests in flight at
+    once. Documents are split into chunks and serialized in the calling
+    thread, while a pool of worker threads POSTs them, so serializing
+    chunk k+1 overlaps with the round trip for chunk k.
+
+    At most queue_size serialized chunks wait for a worker (by default,
+    one per worker); add() blocks when the queue is full. Failures are
+    collected per chunk and raised as a BulkIndexError from flush(),
+    commit() or close(). With isolate_errors=True, a chunk which Solr
+    rejects is split up until the documents at fault are found (see
+    bisect_update()), and only those are reported, one per error. Any
+    other keyword arguments (commitWithin etc.) are passed on with every
+    update request.
+
+    The http connection must be thread-safe; see sunburnt.prefetch.
+
+    with BulkIndexer(si, workers=4, chunk=500) as indexer:
+        indexer.add(docs)
+        indexer.commit()
+    """
+    def __init__(self, interface, workers=4, chunk=100, queue_size=None,
+                 stream=False, format=None, max_bytes=None, adaptive=False,
+                 isolate_errors=False, **kwargs):
+        if workers < 1:
+            raise ValueError("BulkIndexer needs at least one worker")
+        if isolate_errors and stream:
+            raise ValueError("isolate_errors can't be combined with streaming updates")
+        self.interface = interface
+        self.chunk = chunk
+        self.budget = make_byte_budget(max_bytes, adaptive, stream)
+        self.isolate_errors = isolate_errors
+        self.stream = stream
+        self.format = interface.update_format(format)
+        self.serializer = interface.schema.update_serializer(self.format)
+        self.kwargs = kwargs
+        self.queue = Queue.Queue(queue_size or workers)
+        self.errors = []
+        self.errors_lock = threading.Lock()
+        self.chunk_count = 0
+        self.threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=self.worker)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def add(self, docs):
+        if not self.threads:
+            raise ValueError("This BulkIndexer has been closed")
+        if hasattr(docs, "items") or not hasattr(docs, "__iter__"):
+            docs = [docs]
+        if self.budget is not None or self.isolate_errors:
+            self.add_serialized(docs)
+            return
+        for doc_chunk in grouper(docs, self.chunk):
+            chunk_number = self.chunk_count
+            self.chunk_count += 1
+            try:
+                update_message = self.interface.schema.make_update(
+                    doc_chunk, stream=self.stream, format=self.format)
+                if not self.stream:
+                    update_message = str(update_message)
+            except SolrError, e:
+                self.record_error(chunk_number, doc_chunk, e)
+                continue
+            self.queue.put((chunk_number, doc_chunk, update_message))
+
+    def add_serialized(self, docs):
+        # Documents are serialized individually, and the workers are
+        # given the pieces to join, so that they can be regrouped.
+        def on_error(doc, e):
+            # report the document against the chunk it would have joined
+            self.record_error(self.chunk_count, [doc], e)
+        if self.budget is not None:
+            chunks = byte_grouper(self.serializer, docs, self.budget, on_error)
+        else:
+            chunks = serialized_grouper(self.serializer, docs, self.chunk, on_error)
+        for doc_chunk, serialized_docs in chunks:
+            chunk_number = self.chunk_count
+            self.chunk_count += 1
+            self.queue.put((chunk_number, doc_chunk, serialized_docs))
+
+    def send_serialized(self, serialized_docs):
+        update_message = self.serializer.join(serialized_docs)
+        start = time.time()
+        self.interface.conn.update(update_message, format=self.format, **self.kwargs)
+        if self.budget is not None:
+            self.budget.observe(len(update_message), time.time() - start)
+
+    def worker(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                chunk_number, doc_chunk, update_message = item
+                try:
+                    if not isinstance(update_message, list):
+                        self.interface.conn.update(update_message,
+                                                   format=self.format, **self.kwargs)
+                    elif self.isolate_errors:
+                        for doc, e in bisect_update(self.send_serialized,
+                                                    doc_chunk, update_message):
+                            self.record_error(chunk_number, [doc], e)
+                    else:
+                        self.send_serialized(update_message)
+                except Exception, e:
+                    self.record_error(chunk_number, doc_chunk, e)
+            finally:
+                self.queue.task_done()
+
+    def record_error(self, chunk_number, doc_chunk, e):
+        with self.errors_lock:
+            self.errors.append((chunk_number, doc_chunk, e))
+
+    def flush(self):
+        """Wait until every chunk added so far has been sent, and raise
+        a BulkIndexError if any of them failed."""
+        self.queue.join()
+        with self.errors_lock:
+            errors, self.errors = self.errors, []
+        if errors:
+            raise BulkIndexError(errors)
+
+    def commit(self, *args, **kwargs):
+        self.flush()
+        self.interface.commit(*args, **kwargs)
+
+    def shutdown(self):
+        for thread in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def close(self):
+        self.shutdown()
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # Don't mask the original exception with our own errors.
+            self.shutdown()
+
+
+class BufferedIndexer(object):
+    """A write-behind buffer for updates. add() and delete() return as
+    soon as the change is buffered; a background thread sends buffered
+    changes to Solr once max_docs changes are waiting, once they amount
+    to max_bytes of serialized documents, or once the oldest has waited
+    max_age seconds, whichever comes first. Any threshold can be
+    disabled by passing None.
+
+    Changes are keyed on the schema's unique key, so if a document is
+    added or deleted more than once before the buffer is flushed, only
+    the last change is sent. Documents are serialized when they are
+    added, so invalid documents are reported straight away, and later
+    changes to an added object are not seen.
+
+    Any other keyword arguments (commitWithin etc.) are passed on with
+    every update request. Failures are collected and raised as a
+    BulkIndexError from the next add(), delete(), flush(), commit() or
+    close(); errors is a list of (flush number, docs, exception) tuples.
+
+    with si.buffered(max_age=5, commitWithin=10000) as buf:
+        buf.add(doc)
+    """
+    def __init__(self, interface, max_docs=1000, max_bytes=None, max_age=1.0,
+                 format=None, **kwargs):
+        self.interface = interface
+        self.schema = interface.schema
+        self.max_docs = max_docs
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.format = interface.update_format(format)
+        self.serializer = self.schema.update_serializer(self.format)
+        self.deleter = SolrDelete(self.schema)
+        self.kwargs = kwargs
+        self.pending = OrderedDict()
+        self.pending_bytes = 0
+        self.oldest = None
+        self.keys = count()
+        self.flush_count = 0
+        self.errors = []
+        self.closed = False
+        self.condition = threading.Condition()
+        self.send_lock = threading.Lock()
+        self.thread = threading.Thread(target=self.worker)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def add(self, docs):
+        self.check_open()
+        if hasattr(docs, "items") or not hasattr(docs, "__iter__"):
+            docs = [docs]
+        for doc in docs:
+            doc = self.serializer.doc_dict(doc)
+            serialized_doc = self.serializer.serialize_doc(doc)
+            self.buffer(self.doc_key(doc), ('add', doc, serialized_doc))
+
+    def delete(self, docs=None, queries=None):
+        self.check_open()
+        if docs is not None:
+            if not self.schema.unique_key:
+                raise SolrError("This schema has no unique key - you can only delete by query")
+            if hasattr(docs, "items") or not hasattr(docs, "__iter__"):
+                docs = [docs]
+            for doc in docs:
+                doc_id = self.deleter.doc_id_from_doc(doc).to_solr()
+                self.buffer(('id', doc_id), ('delete', doc, doc_id))
+        if queries is not None:
+            if not hasattr(queries, "__iter__"):
+                queries = [queries]
+            for query in queries:
+                # Deletes by query can't be merged with anything else.
+                self.buffer(('query', next(self.keys)), ('query', query, unicode(query)))
+
+    def doc_key(self, doc):
+        unique_key = self.schema.unique_key
+        if unique_key and doc.get(unique_key) is not None:
+            try:
+                return ('id', self.schema.field_serializer(unique_key)(doc[unique_key]))
+            except SolrError:
+                pass
+        return ('doc', next(self.keys))
+
+    def buffer(self, key, change):
+        with self.condition:
+            self.raise_errors()
+            # Move rewritten keys to the end, so that changes are sent in
+            # the order they were last made.
+            old_change = self.pending.pop(key, None)
+            if old_change is not None:
+                self.pending_bytes -= len(old_change[2])
+            self.pending[key] = change
+            self.pending_bytes += len(change[2])
+            if self.oldest is None:
+                # Wake the worker so it starts timing the oldest change
+                self.oldest = time.time()
+                self.condition.notify()
+            elif self.due():
+                self.condition.notify()
+
+    def due(self):
+        if not self.pending:
+            return False
+        return (self.max_docs is not None and len(self.pending) >= self.max_docs) \
+            or (self.max_bytes is not None and self.pending_bytes >= self.max_bytes) \
+            or (self.max_age is not None and time.time() - self.oldest >= self.max_age)
+
+    def wait_time(self):
+        if not self.pending or self.max_age is None:
+            return None
+        return max(0, self.oldest + self.max_age - time.time())
+
+    def worker(self):
+        while True:
+            with self.condition:
+                while not self.closed and not self.due():
+                    self.condition.wait(self.wait_time())
+                if self.closed:
+                    return
+            self.send_pending()
+
+    def send_pending(self):
+        # Hold send_lock from taking the changes until they're sent, so
+        # that two flushes can't overtake one another.
+        with self.send_lock:
+            with self.condition:
+                pending, self.pending = self.pending, OrderedDict()
+                self.pending_bytes = 0
+                self.oldest = None
+            if not pending:
+                return
+            flush_number = self.flush_count
+            self.flush_count += 1
+            run, kind = [], None
+            for change in pending.itervalues():
+                change_kind = 'add' if change[0] == 'add' else 'delete'
+                if run and change_kind != kind:
+                    self.send(flush_number, kind, run)
+                    run = []
+                run.append(change)
+                kind = change_kind
+            self.send(flush_number, kind, run)
+
+    def send(self, flush_number, kind, changes):
+        try:
+            if kind == 'add':
+                update_message = self.serializer.join(change[2] for change in changes)
+            else:
+                ids = [change[2] for change in changes if change[0] == 'delete']
+                queries = [change[2] for change in changes if change[0] == 'query']
+                update_message = str(self.schema.make_delete(ids or None, queries or None,
+                                                             format=self.format))
+            self.interface.conn.update(update_message, format=self.format, **self.kwargs)
+        except Exception, e:
+            with self.condition:
+                self.errors.append((flush_number, [change[1] for change in changes], e))
+
+    def raise_errors(self):
+        if self.errors:
+            errors, self.errors = self.errors, []
+            raise BulkIndexError(errors)
+
+    def check_open(self):
+        if self.closed:
+            raise ValueError("This BufferedIndexer has been closed")
+
+    def flush(self):
+        """Send everything buffered so far, and raise a BulkIndexError
+        if any changes since the last check have failed."""
+        self.send_pending()
+        with self.condition:
+            self.raise_errors()
+
+    def commit(self, *args, **kwargs):
+        self.flush()
+        self.interface.commit(*args, **kwargs)
+
+    def shutdown(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.thread.join()
+
+    def close(self):
+        if not self.closed:
+            self.shutdown()
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # Changes which were accepted should still be sent, but don't
+            # mask the original exception with our own errors.
+            try:
+                self.close()
+            except BulkIndexError:
+                pass
+
+
+def grouper(iterable, n):
+    "grouper('ABCDEFG', 3) --> [['ABC'], ['DEF'], ['G']]"
+    i = iter(iterable)
+    g = list(islice(i, 0, n))
+    while g:
+        yield g
+        g = list(islice(i, 0, n))
+
+
+def serialize_docs(serializer, docs, on_error=None):
+    """Serialize docs one at a time with serializer.serialize_doc(),
+    yielding (doc, serialized doc) pairs.
+
+    If on_error is given, it is called with (doc, exception) for any
+    document which can't be serialized, and the document is skipped."""
+    for doc in docs:
+        try:
+            serialized_doc = serializer.serialize_doc(doc)
+        except SolrError, e:
+            if on_error is None:
+                raise
+            on_error(doc, e)
+            continue
+        yield doc, serialized_doc
+
+
+def serialized_grouper(serializer, docs, n, on_error=None):
+    """Serialize docs (see serialize_docs()) in groups of n, yielding
+    (docs, serialized docs) pairs."""
+    for pairs in grouper(serialize_docs(serializer, docs, on_error), n):
+        doc_chunk, serialized_docs = zip(*pairs)
+        yield list(doc_chunk), list(serialized_docs)
+
+
+def byte_grouper(serializer, docs, budget, on_error=None):
+    """Serialize docs (see serialize_docs()), and group them so that each
+    group's serialized size stays within budget.size bytes. A document
+    which is larger than the budget on its own is put in a group by
+    itself. Yields (docs, serialized docs) pairs."""
+    doc_chunk, serialized_docs, size = [], [], 0
+    limit = budget.size
+    for doc, serialized_doc in serialize_docs(serializer, docs, on_error):
+        if serialized_docs and size + len(serialized_doc) > limit:
+            yield doc_chunk, serialized_docs
+            doc_chunk, serialized_docs, size = [], [], 0
+            limit = budget.size
+        doc_chunk.append(doc)
+        serialized_docs.append(serialized_doc)
+        size += len(serialized_doc)
+    if serialized_docs:
+        yield doc_chunk, serialized_docs
+
+
+def bisect_update(send, docs, serialized_docs):
+    """Send serialized_docs with send(). If Solr rejects them, split them
+    in half and send each half the same way, until the documents at
+    fault have been found; everything else gets indexed. Returns a list
+    of (doc, exception) for the rejected documents.
+
+    If k documents out of n are bad, this takes about 2k*log2(n) extra
+    requests, rather than n for sending them one at a time."""
+    try:
+        send(serialized_docs)
+        return []
+    except SolrError, e:
+        if len(docs) == 1:
+            return [(docs[0], e)]
+    middle = len(docs) // 2
+    return bisect_update(send, docs[:middle], serialized_docs[:middle]) \
+        + bisect_update(send, docs[middle:], serialized_docs[middle:])
+
+
+def solr_error_body(e):
+    """The text of Solr's response for an error raised by an update, if
+    there is one."""
+    response = e.args[0] if e.args else None
+    return getattr(response, "content", None)
+
+
+class ByteBudget(object):
+    """A fixed limit on the serialized size of each update request."""
+    def __init__(self, max_bytes):
+        if max_bytes <= 0:
+            raise ValueError("max_bytes must be a positive number")
+        self.max_bytes = self.size = int(max_bytes)
+
+    def observe(self, size, elapsed):
+        pass
+
+
+class AdaptiveByteBudget(ByteBudget):
+    """A limit on the size of each update request which adapts to how
+    quickly Solr is handling them. Starting from a fraction of max_bytes,
+    the budget grows while throughput (bytes per second) holds up as
+    requests get bigger, and is cut back when throughput falls away -
+    ie when Solr slows down. It never exceeds max_bytes, which should be
+    set within the server's request size limit."""
+    growth = 1.5
+    backoff = 0.5
+    # how far below the recent average throughput a request may fall
+    # before we start shrinking requests
+    tolerance = 0.8
+
+    def __init__(self, max_bytes, initial_bytes=None, min_bytes=None):
+        super(AdaptiveByteBudget, self).__init__(max_bytes)
+        self.min_bytes = min_bytes or max(1, self.max_bytes // 64)
+        self.size = initial_bytes or max(self.min_bytes, self.max_bytes // 8)
+        self.rate = None
+        self.lock = threading.Lock()
+
+    def observe(self, size, elapsed):
+        rate = float(size) / max(elapsed, 1e-6)
+        with self.lock:
+            if self.rate is None or rate >= self.rate * self.tolerance:
+                self.size = min(self.max_bytes, int(self.size * self.growth))
+            else:
+                self.size = max(self.min_bytes, int(self.size * self.backoff))
+            # a moving average, so one unusually slow or fast request
+            # doesn't dominate
+            self.rate = rate if self.rate is None else (self.rate + rate) / 2
+
+
+def make_byte_budget(max_bytes, adaptive=False, stream=False):
+    if not max_bytes:
+        if adaptive:
+            raise ValueError("adaptive chunking needs max_bytes")
+        return None
+    if stream:
+        raise ValueError("max_bytes can't be combined with streaming updates")
+    if adaptive:
+        return AdaptiveByteBudget(max_bytes)
+    return ByteBudget(max_bytes)
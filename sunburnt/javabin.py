@@ -0,0 +1,455 @@
+"""Encoding and decoding of javabin, Solr's native binary format (as
+written by org.apache.solr.common.util.JavaBinCodec, version 2).
+
+Solr's NamedLists are decoded as NamedList objects - lists of (name,
+value) pairs, which is also how the XML parser represents them - and
+result documents as dictionaries, inside a SolrDocumentList. Dates are
+decoded as timezone-aware UTC datetimes, and byte arrays as bytearrays.
+"""
+from __future__ import absolute_import
+
+import datetime, struct
+
+from .dates import utc
+
+VERSION = 2
+
+NULL = 0
+BOOL_TRUE = 1
+BOOL_FALSE = 2
+BYTE = 3
+SHORT = 4
+DOUBLE = 5
+INT = 6
+LONG = 7
+FLOAT = 8
+DATE = 9
+MAP = 10
+SOLRDOC = 11
+SOLRDOCLST = 12
+BYTEARR = 13
+ITERATOR = 14
+END = 15
+SOLRINPUTDOC = 16
+MAP_ENTRY_ITER = 17
+ENUM_FIELD_VALUE = 18
+MAP_ENTRY = 19
+
+# These types combine the tag and a size (or small value) in one byte
+STR = 1 << 5
+SINT = 2 << 5
+SLONG = 3 << 5
+ARR = 4 << 5
+ORDERED_MAP = 5 << 5
+NAMED_LST = 6 << 5
+EXTERN_STRING = 7 << 5
+
+_byte = struct.Struct('>b')
+_short = struct.Struct('>h')
+_int = struct.Struct('>i')
+_long = struct.Struct('>q')
+_float = struct.Struct('>f')
+_double = struct.Struct('>d')
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=utc)
+
+
+class NamedList(list):
+    """Solr's NamedList: an ordered list of (name, value) pairs, in
+    which names may repeat."""
+
+
+class SolrDocumentList(list):
+    """A list of result documents, with the numFound, start and maxScore
+    of the result they came from."""
+    def __init__(self, docs=(), numFound=None, start=0, maxScore=None):
+        super(SolrDocumentList, self).__init__(docs)
+        self.numFound = len(self) if numFound is None else numFound
+        self.start = start
+        self.maxScore = maxScore
+
+
+class InputDocument(NamedList):
+    """A document to be indexed, as a list of (field name, value) pairs;
+    multiple values for a field are given as a list."""
+
+
+def loads(data):
+    """Decode a javabin message. Raises ValueError if it is malformed."""
+    try:
+        return Decoder(data).decode()
+    except (IndexError, struct.error):
+        raise ValueError("Truncated javabin message")
+
+
+def dumps(value):
+    """Encode value as a javabin message."""
+    encoder = Encoder()
+    encoder.write(chr(VERSION))
+    encoder.write_value(value)
+    return encoder.getvalue()
+
+
+class Decoder(object):
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+        self.strings = []
+
+    def decode(self):
+        version = self.read_byte()
+        if version != VERSION:
+            raise ValueError("Unsupported javabin version %s" % version)
+        return self.read_value()
+
+    def read_byte(self):
+        b = ord(self.data[self.pos])
+        self.pos += 1
+        return b
+
+    def read_vint(self):
+        # 7 bits at a time, least significant first; the top bit of each
+        # byte says whether there is more to come.
+        result = shift = 0
+        while True:
+            b = self.read_byte()
+            result |= (b & 0x7f) << shift
+            if not b & 0x80:
+                return result
+            shift += 7
+
+    def read_size(self, tag):
+        size = tag & 0x1f
+        if size == 0x1f:
+            size += self.read_vint()
+        return size
+
+    def read_struct(self, s):
+        value = s.unpack_from(self.data, self.pos)[0]
+        self.pos += s.size
+        return value
+
+    def read_bytes(self, size):
+        value = self.data[self.pos:self.pos+size]
+        if len(value) != size:
+            raise ValueError("Truncated javabin message")
+        self.pos += size
+        return value
+
+    def read_value(self):
+        tag = ord(self.data[self.pos])
+        self.pos += 1
+        kind = tag & 0xe0
+        # Short strings and small ints make up most of a typical
+        # response, so they're handled inline.
+        if kind == STR and tag != 0x3f:
+            start = self.pos
+            self.pos = end = start + (tag & 0x1f)
+            if end > len(self.data):
+                raise ValueError("Truncated javabin message")
+            return unicode(self.data[start:end], 'utf-8')
+        elif kind == SINT and not tag & 0x10:
+            return tag & 0x0f
+        elif kind:
+            return self.sized_readers[tag >> 5](self, tag)
+        try:
+            reader = self.readers[tag]
+        except IndexError:
+            raise ValueError("Unknown javabin tag %s" % tag)
+        return reader(self, tag)
+
+    def read_null(self, tag):
+        return None
+
+    def read_true(self, tag):
+        return True
+
+    def read_false(self, tag):
+        return False
+
+    def read_byte_value(self, tag):
+        return self.read_struct(_byte)
+
+    def read_short(self, tag):
+        return self.read_struct(_short)
+
+    def read_double(self, tag):
+        return self.read_struct(_double)
+
+    def read_int(self, tag):
+        return self.read_struct(_int)
+
+    def read_long(self, tag):
+        return self.read_struct(_long)
+
+    def read_float(self, tag):
+        return shortest_float(self.read_struct(_float))
+
+    def read_date(self, tag):
+        return EPOCH + datetime.timedelta(milliseconds=self.read_struct(_long))
+
+    def read_map(self, tag):
+        size = self.read_vint()
+        d = {}
+        for i in xrange(size):
+            key = self.read_value()
+            d[key] = self.read_value()
+        return d
+
+    def read_solr_doc(self, tag):
+        # the fields follow as an ORDERED_MAP
+        size = self.read_size(self.read_byte())
+        doc = {}
+        for i in xrange(size):
+            name = self.read_value()
+            if isinstance(name, dict):
+                # a nested child document
+                doc.setdefault('_childDocuments_', []).append(name)
+                continue
+            doc[name] = self.read_value()
+        return doc
+
+    def read_solr_doc_list(self, tag):
+        numFound, start, maxScore = self.read_value()
+        return SolrDocumentList(self.read_value(), numFound, start, maxScore)
+
+    def read_byte_array(self, tag):
+        return bytearray(self.read_bytes(self.read_vint()))
+
+    def read_iterator(self, tag):
+        values = []
+        while ord(self.data[self.pos]) != END:
+            values.append(self.read_value())
+        self.pos += 1
+        return values
+
+    def read_end(self, tag):
+        raise ValueError("Unexpected end of javabin iterator")
+
+    def read_input_doc(self, tag):
+        size = self.read_vint()
+        self.read_value() # document boost
+        doc = InputDocument()
+        for i in xrange(size):
+            name = self.read_value()
+            if isinstance(name, float):
+                # a field boost
+                name = self.read_value()
+            doc.append((name, self.read_value()))
+        return doc
+
+    def read_map_entry_iter(self, tag):
+        raise ValueError("Unsupported javabin tag %s" % tag)
+
+    def read_enum_field_value(self, tag):
+        self.read_value() # the enum's ordinal
+        return self.read_value()
+
+    def read_map_entry(self, tag):
+        key = self.read_value()
+        return key, self.read_value()
+
+    readers = [read_null, read_true, read_false, read_byte_value, read_short,
+               read_double, read_int, read_long, read_float, read_date,
+               read_map, read_solr_doc, read_solr_doc_list, read_byte_array,
+               read_iterator, read_end, read_input_doc, read_map_entry_iter,
+               read_enum_field_value, read_map_entry]
+
+    def read_str(self, tag):
+        return unicode(self.read_bytes(self.read_size(tag)), 'utf-8')
+
+    def read_small_int(self, tag):
+        value = tag & 0x0f
+        if tag & 0x10:
+            value |= self.read_vint() << 4
+        return value
+
+    def read_array(self, tag):
+        return [self.read_value() for i in xrange(self.read_size(tag))]
+
+    def read_named_list(self, tag):
+        size = self.read_size(tag)
+        return NamedList((self.read_value(), self.read_value()) for i in xrange(size))
+
+    def read_extern_string(self, tag):
+        index = self.read_size(tag)
+        if index:
+            return self.strings[index - 1]
+        s = self.read_value()
+        self.strings.append(s)
+        return s
+
+    sized_readers = [None, read_str, read_small_int, read_small_int, read_array,
+                     read_named_list, read_named_list, read_extern_string]
+
+
+def shortest_float(value):
+    """Solr's floats are single precision; return the shortest double
+    which rounds to the same float, so that 1.1 comes back as 1.1 rather
+    than 1.100000023841858."""
+    for precision in (6, 7, 8):
+        shorter = float('%.*g' % (precision, value))
+        if _float.unpack(_float.pack(shorter))[0] == value:
+            return shorter
+    return value
+
+
+class Encoder(object):
+    """Writes values in javabin format. Strings are always written in
+    full rather than being externalized, so that separately encoded
+    values (eg documents) can be joined together."""
+    def __init__(self):
+        self.out = []
+        self.write = self.out.append
+
+    def getvalue(self):
+        return ''.join(self.out)
+
+    def write_vint(self, n):
+        while n > 0x7f:
+            self.write(chr((n & 0x7f) | 0x80))
+            n >>= 7
+        self.write(chr(n))
+
+    def write_tag(self, tag, size):
+        if tag & 0xe0:
+            if size < 0x1f:
+                self.write(chr(tag | size))
+            else:
+                self.write(chr(tag | 0x1f))
+                self.write_vint(size - 0x1f)
+        else:
+            self.write(chr(tag))
+            self.write_vint(size)
+
+    def write_small(self, tag, value):
+        if value >= 0x0f:
+            self.write(chr(tag | 0x10 | (value & 0x0f)))
+            self.write_vint(value >> 4)
+        else:
+            self.write(chr(tag | value))
+
+    def write_value(self, value):
+        # bool before int, since bools are ints too
+        if value is None:
+            self.write(chr(NULL))
+        elif value is True:
+            self.write(chr(BOOL_TRUE))
+        elif value is False:
+            self.write(chr(BOOL_FALSE))
+        elif isinstance(value, (int, long)):
+            self.write_integer(value)
+        elif isinstance(value, float):
+            self.write(chr(DOUBLE))
+            self.write(_double.pack(value))
+        elif isinstance(value, basestring):
+            self.write_str(value)
+        elif isinstance(value, bytearray):
+            self.write_tag(BYTEARR, len(value))
+            self.write(str(value))
+        elif isinstance(value, datetime.datetime):
+            self.write(chr(DATE))
+            self.write(_long.pack(datetime_to_millis(value)))
+        elif isinstance(value, InputDocument):
+            self.write_input_doc(value)
+        elif isinstance(value, NamedList):
+            self.write_tag(NAMED_LST, len(value))
+            for name, v in value:
+                self.write_value(name)
+                self.write_value(v)
+        elif isinstance(value, SolrDocumentList):
+            self.write(chr(SOLRDOCLST))
+            self.write_value([value.numFound, value.start, value.maxScore])
+            self.write_tag(ARR, len(value))
+            for doc in value:
+                self.write_solr_doc(doc)
+        elif isinstance(value, dict):
+            self.write_tag(MAP, len(value))
+            for k, v in value.iteritems():
+                self.write_value(k)
+                self.write_value(v)
+        elif isinstance(value, (list, tuple)):
+            self.write_tag(ARR, len(value))
+            for v in value:
+                self.write_value(v)
+        elif hasattr(value, "__iter__"):
+            self.write(chr(ITERATOR))
+            for v in value:
+                self.write_value(v)
+            self.write(chr(END))
+        else:
+            raise TypeError("Can't encode %s object as javabin" % type(value))
+
+    def write_integer(self, value):
+        if 0 < value <= 0x7fffffff:
+            self.write_small(SINT, value)
+        elif -0x80000000 <= value <= 0x7fffffff:
+            self.write(chr(INT))
+            self.write(_int.pack(value))
+        elif 0 < value < 1 << 56:
+            self.write_small(SLONG, value)
+        elif -1 << 63 <= value < 1 << 63:
+            self.write(chr(LONG))
+            self.write(_long.pack(value))
+        else:
+            raise ValueError("%s is too large for javabin" % value)
+
+    def write_str(self, value):
+        if isinstance(value, unicode):
+            value = value.encode('utf-8')
+        self.write_tag(STR, len(value))
+        self.write(value)
+
+    def write_solr_doc(self, doc):
+        self.write(chr(SOLRDOC))
+        self.write_tag(ORDERED_MAP, len(doc))
+        for name, value in doc.iteritems():
+            self.write_str(name)
+            self.write_value(value)
+
+    def write_input_doc(self, doc):
+        self.write_tag(SOLRINPUTDOC, len(doc))
+        self.write(chr(FLOAT))
+        self.write(_float.pack(1.0)) # document boost
+        for name, value in doc:
+            self.write_str(name)
+            self.write_value(value)
+
+
+def datetime_to_millis(dt):
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=utc)
+    delta = dt - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000 + delta.microseconds // 1000
+
+
+def encode_input_doc(doc):
+    """Encode one InputDocument, for joining into an update message with
+    update_message()."""
+    encoder = Encoder()
+    encoder.write_input_doc(doc)
+    return encoder.getvalue()
+
+
+def update_message(encoded_docs=(), delete_ids=(), delete_queries=()):
+    """Build an update request in the form Solr's
+    JavaBinUpdateRequestCodec reads, from documents already encoded with
+    encode_input_doc()."""
+    encoder = Encoder()
+    encoder.write(chr(VERSION))
+    # Solr expects the request parameters to come first.
+    entries = [("params", NamedList())]
+    if delete_ids:
+        entries.append(("delById", list(delete_ids)))
+    if delete_queries:
+        entries.append(("delByQ", list(delete_queries)))
+    encoder.write_tag(NAMED_LST, len(entries) + 1)
+    for name, value in entries:
+        encoder.write_str(name)
+        encoder.write_value(value)
+    encoder.write_str("docs")
+    encoder.write(chr(ITERATOR))
+    for encoded_doc in encoded_docs:
+        encoder.write(encoded_doc)
+    encoder.write(chr(END))
+    return encoder.getvalue()
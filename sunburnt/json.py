@@ -1,6 +1,6 @@
 from __future__ import absolute_import
 
-import json, math
+import collections, json, math
 
 from .schema import SolrResponse, SolrResult
 
@@ -12,6 +12,9 @@ class SunburntJSONEncoder(json.JSONEncoder):
         return super(SunburntJSONEncoder, self).encode(o)
         
     def default(self, obj):
+        if isinstance(obj, collections.Mapping):
+            # such as LazyDocument
+            return dict(obj)
         if hasattr(obj, 'isoformat'):
             return "%sZ" % (obj.replace(tzinfo=None).isoformat(), )
         if hasattr(obj, "strftime"):
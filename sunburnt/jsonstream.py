@@ -0,0 +1,115 @@
+"""Incremental reading of JSON from a file-like object.
+
+JSONStreamReader walks the structure of a JSON document as it is read,
+only decoding (with the json module's raw_decode) the values asked for,
+and holding no more of the input in memory than the value being decoded.
+"""
+from __future__ import absolute_import
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+WHITESPACE = ' \t\n\r'
+NUMBER_CHARS = '0123456789+-.eE'
+NUMBER_TYPES = (int, long, float)
+
+
+class JSONStreamReader(object):
+    def __init__(self, f, chunk_size=65536):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def fill(self, size=None):
+        """Read more input, dropping what has already been consumed.
+        Returns False at the end of the input."""
+        if self.eof:
+            return False
+        data = self.f.read(max(size or 0, self.chunk_size))
+        if not data:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Return the next character which isn't whitespace, without
+        consuming it, or '' at the end of the input."""
+        while True:
+            buf, pos = self.buf, self.pos
+            while pos < len(buf) and buf[pos] in WHITESPACE:
+                pos += 1
+            self.pos = pos
+            if pos < len(buf):
+                return buf[pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, chars):
+        c = self.peek()
+        if not c or c not in chars:
+            raise ValueError("Expected %s at offset %d of JSON stream, found %r"
+                             % (" or ".join(repr(ch) for ch in chars), self.pos, c))
+        self.pos += 1
+        return c
+
+    def read_value(self):
+        """Decode and return the next complete value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except ValueError:
+                # Incomplete, so read more. Reading at least as much
+                # again as is buffered keeps a long value from being
+                # decoded over and over.
+                if not self.fill(len(self.buf) - self.pos):
+                    raise
+                continue
+            # A number which runs up to the end of the buffer (or up to
+            # an exponent or fraction which is cut short) may carry on
+            # in the next chunk.
+            if isinstance(value, NUMBER_TYPES) and \
+                    (end == len(self.buf) or self.buf[end] in NUMBER_CHARS) and \
+                    self.fill(len(self.buf) - self.pos):
+                continue
+            self.pos = end
+            return value
+
+    def skip_value(self):
+        self.read_value()
+
+    def iter_object(self):
+        """Iterate over the keys of the object which comes next. The
+        caller must read (or skip) each key's value before asking for
+        the next key."""
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.read_value()
+            if not isinstance(key, basestring):
+                raise ValueError("Expected a string key in JSON stream, found %r" % (key,))
+            self.expect(':')
+            yield key
+            if self.expect(',}') == '}':
+                return
+
+    def iter_array(self):
+        """Iterate over the values in the array which comes next,
+        decoding each one as it is reached."""
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.read_value()
+            if self.expect(',]') == ']':
+                return
@@ -0,0 +1,165 @@
+"""Running searches and updates in background threads.
+
+PagePrefetcher and merge_iterators here, and BulkIndexer, fetch or post
+from several threads at once through the interface's one http
+connection, so it must be safe to use from several threads: a
+requests.Session is, an httplib2.Http is not.
+"""
+from __future__ import absolute_import
+
+import collections, Queue, sys, threading
+
+
+class PagePrefetcher(object):
+    """Iterate over the results of fetch(*args) for each args in pages,
+    in order, with the fetching done by background threads. Up to
+    lookahead pages are fetched (concurrently, with one worker per page
+    by default) ahead of the one the caller is waiting for, so that the
+    round trip for the next page overlaps with processing this one.
+
+    close() cancels the prefetch: pages not yet started are skipped and
+    the workers exit once any requests in flight have finished, without
+    the caller waiting for them. It's called automatically once the last
+    page has been returned, or if a fetch raises an exception, which is
+    re-raised in the calling thread. See the module docstring about
+    the http connection.
+    """
+    def __init__(self, fetch, pages, lookahead=1, workers=None):
+        if lookahead < 1:
+            raise ValueError("PagePrefetcher needs a lookahead of at least one page")
+        self.fetch = fetch
+        self.pages = iter(pages)
+        self.tasks = Queue.Queue()
+        self.pending = collections.deque()
+        self.closed = False
+        self.threads = []
+        for i in range(workers or lookahead):
+            thread = threading.Thread(target=self.worker)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+        for i in range(lookahead):
+            self.schedule()
+
+    def schedule(self):
+        for args in self.pages:
+            page = PrefetchedPage()
+            self.pending.append(page)
+            self.tasks.put((args, page))
+            return
+
+    def worker(self):
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                return
+            args, page = task
+            if not self.closed:
+                page.thread = threading.current_thread()
+                try:
+                    page.result = self.fetch(*args)
+                except Exception:
+                    page.error = sys.exc_info()
+            page.done.set()
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        if not self.pending:
+            self.close()
+            raise StopIteration
+        page = self.pending.popleft()
+        # Keep lookahead pages in flight behind this one.
+        self.schedule()
+        # (waiting with a timeout lets KeyboardInterrupt through)
+        while not page.done.wait(1):
+            if not any_alive([page.thread] if page.thread else self.threads):
+                self.close()
+                raise RuntimeError("prefetching thread exited without fetching a page")
+        if page.error is not None:
+            self.close()
+            raise page.error[0], page.error[1], page.error[2]
+        return page.result
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.pending.clear()
+        for thread in self.threads:
+            self.tasks.put(None)
+        self.threads = []
+
+
+class PrefetchedPage(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.thread = None
+        self.result = None
+        self.error = None
+
+
+def any_alive(threads):
+    # Exceptions are passed back to the caller, but a thread can still
+    # die without passing anything back (from a SystemExit, say); rather
+    # than wait forever for it, callers check now and then.
+    return any(thread.is_alive() for thread in threads)
+
+
+# Kinds of entry passed back by merge_iterators' threads
+ITEM, DONE, ERROR = object(), object(), object()
+
+def merge_iterators(iterators, queue_size=1000):
+    """Yield the items of several iterators, each of which is run in
+    its own thread, in the order they arrive. At most queue_size items
+    wait to be yielded. An exception raised by any of the iterators is
+    re-raised here, as it would be by PagePrefetcher. Closing the
+    generator stops the threads once they next produce an item."""
+    queue = Queue.Queue(queue_size)
+    cancelled = threading.Event()
+
+    def put(entry):
+        while not cancelled.is_set():
+            try:
+                queue.put(entry, timeout=0.1)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    def drain(iterator):
+        try:
+            for item in iterator:
+                if not put((ITEM, item)):
+                    return
+        except Exception:
+            put((ERROR, sys.exc_info()))
+        else:
+            put((DONE, None))
+
+    threads = []
+    for iterator in iterators:
+        thread = threading.Thread(target=drain, args=(iterator,))
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+    running = len(iterators)
+    try:
+        while running:
+            # (waiting with a timeout lets KeyboardInterrupt through)
+            try:
+                kind, value = queue.get(timeout=1)
+            except Queue.Empty:
+                # Threads put their last entry before they exit.
+                if queue.empty() and not any_alive(threads):
+                    raise RuntimeError("merged iterators' threads exited without finishing")
+                continue
+            if kind is ITEM:
+                yield value
+            elif kind is DONE:
+                running -= 1
+            else:
+                raise value[0], value[1], value[2]
+    finally:
+        cancelled.set()
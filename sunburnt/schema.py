@@ -1,9 +1,13 @@
 from __future__ import absolute_import
 
+import collections
+import copy
+import datetime
 import math
-import operator
+import threading
 import uuid
 import warnings
+import weakref
 
 from lxml.builder import E
 import lxml.etree
@@ -13,7 +17,10 @@ try:
 except ImportError:
     import json
 
+from . import javabin
+from .columns import ColumnBuilder
 from .dates import datetime_from_w3_datestring, utc
+from .jsonstream import JSONStreamReader
 from .strings import RawString, SolrString, WildcardString
 
 
@@ -114,13 +121,21 @@ def solr_point_factory(dimension):
 
 
 class SolrField(object):
-    def __init__(self, name, indexed=None, stored=None, required=False, multiValued=False, dynamic=False, **kwargs):
+    def __init__(self, name, indexed=None, stored=None, required=False, multiValued=False, dynamic=False, docValues=None, **kwargs):
         self.name = name
         if indexed is not None:
             self.indexed = indexed
         if stored is not None:
             self.stored = stored
         # By default, indexed & stored are taken from the class attribute
+        # (as is docValues, if the field type sets it)
+        if docValues is None:
+            docValues = getattr(self, "docValues", False)
+        self.doc_values = docValues
+        # Whether documents missing the field sort after (or before)
+        # the rest, whichever the direction of the sort
+        self.sort_missing = any(kwargs.get(k, getattr(self, k, False))
+                                for k in ("sortMissingLast", "sortMissingFirst"))
         self.multi_valued = multiValued
         self.required = required
         self.dynamic = dynamic
@@ -231,35 +246,45 @@ class SolrNumericalField(SolrField):
 
 class SolrShortField(SolrNumericalField):
     base_type = int
+    array_typecode = 'h'
     min = -(2**15)
     max = 2**15-1
 
 
 class SolrIntField(SolrNumericalField):
     base_type = int
+    array_typecode = 'i'
     min = -(2**31)
     max = 2**31-1
 
 
 class SolrLongField(SolrNumericalField):
     base_type = long
+    # only 32 bits on some platforms; columns fall back to lists then
+    array_typecode = 'l'
     min = -(2**63)
     max = 2**63-1
 
 
 class SolrFloatField(SolrNumericalField):
     base_type = float
+    # Solr's floats are only 32 bits, but they're read as Python floats,
+    # and narrowing those again would change the values.
+    array_typecode = 'd'
     max = (2.0-2.0**(-23)) * 2.0**127
     min = -max
 
 
 class SolrDoubleField(SolrNumericalField):
     base_type = float
+    array_typecode = 'd'
     max = (2.0-2.0**(-52)) * 2.0**1023
     min = -max
 
 
 class SolrDateField(SolrField):
+    numpy_dtype = 'datetime64[us]'
+
     def normalize(self, v):
         return solr_date(v)
 
@@ -404,7 +429,17 @@ class SolrSchema(object):
             if self.default_field_name else None
         self.unique_field = self.fields[self.unique_key] \
             if self.unique_key else None
+        self.required_field_names = sorted(name for name, field in self.fields.items()
+                                           if field.required)
         self.dynamic_field_cache = {}
+        self.field_serializers = {}
+        self.field_decoders = {}
+        self.attribute_plans = {}
+        # Frozen LuceneQuery nodes, by structure, while they're in use
+        self.query_nodes = weakref.WeakValueDictionary()
+        # Held while their normal forms and serializations are worked out
+        # (and remembered), since prefetching threads share them
+        self.query_lock = threading.RLock()
 
     def Q(self, *args, **kwargs):
         from .search import LuceneQuery
@@ -473,8 +508,9 @@ class SolrSchema(object):
             for k, v in attribs.items())
 
     def missing_fields(self, field_names):
-        return [name for name in set(self.fields.keys()) - set(field_names)
-                if self.fields[name].required]
+        # field_names may be a document dictionary, which is faster to check
+        return [name for name in self.required_field_names
+                if name not in field_names]
 
     def check_fields(self, field_names, required_atts=None):
         if isinstance(field_names, basestring):
@@ -499,8 +535,13 @@ class SolrSchema(object):
         except KeyError:
             for field in self.dynamic_fields:
                 if field.match(name):
-                    self.dynamic_field_cache[name] = field
-                    return field
+                    break
+            else:
+                # Remember misses too; most attribute names on an
+                # indexed object won't match anything.
+                field = None
+            self.dynamic_field_cache[name] = field
+            return field
 
     def match_field(self, name):
         try:
@@ -515,108 +556,401 @@ class SolrSchema(object):
             raise SolrError("No such field '%s' in current schema" % k)
         return field.instance_from_user_data(v)
 
-    def make_update(self, docs):
+    def attribute_plan(self, cls):
+        """Return the names of the fields which objects of class cls
+        provide through class-level attributes, methods or properties,
+        as a (tuple, frozenset) pair, or None if the class can't be
+        planned for. Plans are worked out once per class.
+
+        Attributes set on individual instances are not part of the plan;
+        object_to_dict() picks those up from the instance's __dict__.
+        Classes which compute attributes on the fly, with __getattr__ or
+        __getattribute__, can't be planned for; nor can classes which set
+        sunburnt_cache_attributes = False."""
+        try:
+            return self.attribute_plans[cls]
+        except KeyError:
+            pass
+        if not getattr(cls, 'sunburnt_cache_attributes', True) \
+                or hasattr(cls, '__getattr__') \
+                or getattr(cls, '__getattribute__', None) not in (None, object.__getattribute__):
+            plan = None
+        else:
+            field_names = [name for name in dir(cls) if self.match_field(name)]
+            plan = tuple(field_names), frozenset(field_names)
+        self.attribute_plans[cls] = plan
+        return plan
+
+    def field_serializer(self, name):
+        """Return a function which converts one user-supplied value for
+        the field called name into the string sent to Solr. These are
+        built once per field name and reused, so that serializing a
+        document doesn't have to match field names or build a
+        SolrFieldInstance for every value."""
+        try:
+            return self.field_serializers[name]
+        except KeyError:
+            field = self.match_field(name)
+            if not field:
+                raise SolrError("No such field '%s' in current schema" % name)
+            from_user_data, to_solr = field.from_user_data, field.to_solr
+            def serializer(value):
+                return to_solr(from_user_data(value))
+            self.field_serializers[name] = serializer
+            return serializer
+
+    def field_decoder(self, name):
+        """Return a function which converts one value of the field called
+        name, as found in a query result, into the value given back to
+        the user. Like field_serializer, these are built once per field
+        name and kept, in field_decoders. Plain string fields decode
+        with unicode, which the JSON parser skips altogether."""
+        try:
+            return self.field_decoders[name]
+        except KeyError:
+            field = self.match_field(name)
+            if field is None:
+                if name != "score":
+                    raise SolrError("unexpected field found in result (field name: %s)" % name)
+                decoder = float
+            elif type(field).from_solr == SolrUnicodeField.from_solr:
+                decoder = unicode
+            elif type(field).to_user_data == SolrField.to_user_data:
+                decoder = field.from_solr
+            else:
+                from_solr, to_user_data = field.from_solr, field.to_user_data
+                def decoder(value):
+                    return to_user_data(from_solr(value))
+            self.field_decoders[name] = decoder
+            return decoder
+
+    def make_update(self, docs, stream=False, format=None):
+        format = format or self.format
+        if format in ('json', 'javabin'):
+            if stream:
+                raise ValueError("Streaming updates are only supported in xml format")
+            if format == 'javabin':
+                return SolrJavabinUpdate(self, docs)
+            return SolrJSONUpdate(self, docs)
+        if stream:
+            return SolrStreamingUpdate(self, docs)
         return SolrUpdate(self, docs)
 
-    def make_delete(self, docs, query):
+    def update_serializer(self, format=None):
+        """Return an empty update message, whose serialize_doc() and
+        join() methods can be used to build messages a document at a
+        time."""
+        format = format or self.format
+        if format == 'json':
+            return SolrJSONUpdate(self)
+        if format == 'javabin':
+            return SolrJavabinUpdate(self)
+        return SolrUpdate(self)
+
+    def make_delete(self, docs, query, format=None):
+        format = format or self.format
+        if format == 'json':
+            return SolrJSONDelete(self, docs, query)
+        if format == 'javabin':
+            return SolrJavabinDelete(self, docs, query)
         return SolrDelete(self, docs, query)
 
-    def parse_response(self, msg):
+    def parse_response(self, msg, lazy=False, columnar=False):
+        """Parse a response. With lazy=True, the documents are
+        LazyDocuments, whose fields are converted as they're used. With
+        columnar=True, the result is a SolrColumnarResult."""
         if self.format == 'json':
-            return SolrResponse.from_json(self, msg)
+            return SolrResponse.from_json(self, msg, lazy, columnar)
+        if self.format == 'javabin':
+            return SolrResponse.from_javabin(self, msg, columnar)
         else:
-            return SolrResponse.from_xml(self, msg)
+            return SolrResponse.from_xml(self, msg, lazy, columnar)
+
+    def parse_response_stream(self, f, lazy=False):
+        """Parse a response from file-like object f, yielding documents
+        as they are read where the format allows."""
+        if self.format == 'json':
+            return SolrJSONStreamingResponse(self, f, lazy)
+        elif self.format == 'xml':
+            return SolrStreamingResponse(self, f, lazy)
+        return self.parse_response(f.read())
 
-    def parse_result_doc(self, doc, name=None):
+    def parse_result_doc(self, doc, name=None, lazy=False):
         if name is None:
             name = doc.attrib.get('name')
+        if doc.tag == 'doc' and lazy:
+            decoders = self.field_decoders
+            fields = {}
+            for node in doc:
+                name = node.get('name')
+                if name not in decoders:
+                    # Check the field exists now, rather than on access
+                    self.field_decoder(name)
+                if node.tag in ('arr', 'lst'):
+                    fields[name] = tuple(n.text or '' for n in node)
+                else:
+                    fields[name] = node.text or ''
+            return LazyDocument(self, fields, set(fields))
+        if doc.tag == 'doc':
+            decoders = self.field_decoders
+            parsed = {}
+            for node in doc:
+                name = node.get('name')
+                try:
+                    decoder = decoders[name]
+                except KeyError:
+                    decoder = self.field_decoder(name)
+                if node.tag in ('arr', 'lst'):
+                    parsed[name] = tuple(decoder(n.text or '') for n in node)
+                else:
+                    parsed[name] = decoder(node.text or '')
+            return parsed
         if doc.tag in ('lst', 'arr'):
-            values = [self.parse_result_doc(n, name) for n in doc.getchildren()]
-            return name, tuple(v[1] for v in values)
-        if doc.tag in 'doc':
-            return dict([self.parse_result_doc(n) for n in doc.getchildren()])
-        field_class = self.match_field(name)
-        if field_class is None and name == "score":
-            field_class = SolrScoreField()
-        elif field_class is None:
-            raise SolrError("unexpected field found in result (field name: %s)" % name)
-        return name, SolrFieldInstance.from_solr(field_class, doc.text or '').to_user_data()
-
-    def parse_result_doc_json(self, doc):
+            return name, tuple(self.parse_result_doc(n, name)[1] for n in doc)
+        return name, self.field_decoder(name)(doc.text or '')
+
+    def parse_result_fields(self, doc):
+        """Yield a (name, value) pair for each field of a <doc> element,
+        as parse_result_doc does without building the dictionary."""
+        decoders = self.field_decoders
+        for node in doc:
+            name = node.get('name')
+            try:
+                decoder = decoders[name]
+            except KeyError:
+                decoder = self.field_decoder(name)
+            if node.tag in ('arr', 'lst'):
+                yield name, tuple(decoder(n.text or '') for n in node)
+            else:
+                yield name, decoder(node.text or '')
+
+    def parse_result_doc_json(self, doc, lazy=False):
         # Note: for efficiency's sake this modifies the original dict
         # in place. This doesn't make much difference on 20 documents
         # but it does on 20,000
+        decoders = self.field_decoders
+        if lazy:
+            unconverted = set()
+            for name in doc:
+                try:
+                    decoder = decoders[name]
+                except KeyError:
+                    decoder = self.field_decoder(name)
+                if decoder is not unicode:
+                    unconverted.add(name)
+            return LazyDocument(self, doc, unconverted)
         for name, value in doc.viewitems():
-            field_class = self.match_field(name)
-            # If the field type is a string then we don't need to modify it
-            if isinstance(field_class, SolrUnicodeField):
+            try:
+                decoder = decoders[name]
+            except KeyError:
+                decoder = self.field_decoder(name)
+            # Strings come out of the JSON decoder as they are wanted
+            if decoder is unicode:
+                continue
+            if isinstance(value, list):
+                doc[name] = [decoder(v) for v in value]
+            else:
+                doc[name] = decoder(value)
+        return doc
+
+    def parse_result_doc_javabin(self, doc):
+        # javabin values arrive already typed. Binary and date values are
+        # kept as they are, and everything else goes through the same
+        # decoders as the other formats, so that all three give the same
+        # types. Like parse_result_doc_json this modifies doc in place.
+        decoders = self.field_decoders
+        for name, value in doc.iteritems():
+            try:
+                decoder = decoders[name]
+            except KeyError:
+                decoder = self.field_decoder(name)
+            if decoder is unicode:
                 continue
-            if field_class is None and name == "score":
-                field_class = SolrScoreField()
-            elif field_class is None:
-                raise SolrError("unexpected field found in result (field name: %s)" % name)
             if isinstance(value, list):
-                parsed_value = [SolrFieldInstance.from_solr(field_class, v).to_user_data() for v in value]
+                doc[name] = [self.javabin_value(decoder, v) for v in value]
             else:
-                parsed_value = SolrFieldInstance.from_solr(field_class, value).to_user_data()
-            doc[name] = parsed_value
+                doc[name] = self.javabin_value(decoder, value)
         return doc
 
+    @staticmethod
+    def javabin_value(decoder, value):
+        if isinstance(value, bytearray):
+            # binary fields come raw, not base64-encoded
+            return str(value)
+        if isinstance(value, datetime.datetime):
+            return value
+        return decoder(value)
+
 
 class SolrUpdate(object):
     ADD = E.add
     DOC = E.doc
     FIELD = E.field
 
-    def __init__(self, schema, docs):
+    def __init__(self, schema, docs=()):
         self.schema = schema
         self.xml = self.add(docs)
 
     def fields(self, name, values):
+        serializer = self.schema.field_serializer(name)
+        attrib = {'name':name}
         # values may be multivalued - so we treat that as the default case
         if not hasattr(values, "__iter__"):
             values = [values]
-        field_values = [self.schema.field_from_user_data(name, value) for value in values]
-        return [self.FIELD({'name':name}, field_value.to_solr())
-            for field_value in field_values]
+        return [self.FIELD(attrib, serializer(value)) for value in values]
 
     def doc(self, doc):
-        missing_fields = self.schema.missing_fields(doc.keys())
+        missing_fields = self.schema.missing_fields(doc)
         if missing_fields:
             raise SolrError("These required fields are unspecified:\n %s" %
                             missing_fields)
-        if not doc:
-            return self.DOC()
-        else:
-            return self.DOC(*reduce(operator.add,
-                                    [self.fields(name, values)
-                                     for name, values in doc.items()]))
+        fields = []
+        for name, values in doc.items():
+            fields.extend(self.fields(name, values))
+        return self.DOC(*fields)
 
     def add(self, docs):
         if hasattr(docs, "items") or not hasattr(docs, "__iter__"):
             # is a dictionary, or anything else except a list
             docs = [docs]
-        docs = [(doc if hasattr(doc, "items")
-                 else object_to_dict(doc, self.schema))
-                for doc in docs]
+        docs = [self.doc_dict(doc) for doc in docs]
         return self.ADD(*[self.doc(doc) for doc in docs])
 
+    def doc_dict(self, doc):
+        if hasattr(doc, "items"):
+            return doc
+        return object_to_dict(doc, self.schema)
+
+    def serialize_doc(self, doc):
+        """Serialize a single document, for assembling into a message
+        later with join()."""
+        return lxml.etree.tostring(self.doc(self.doc_dict(doc)), encoding='utf-8')
+
+    @staticmethod
+    def join(serialized_docs):
+        return "<add>%s</add>" % "".join(serialized_docs)
+
     def __str__(self):
         return lxml.etree.tostring(self.xml, encoding='utf-8')
 
 
+class SolrStreamingUpdate(SolrUpdate):
+    """An update message which is serialized incrementally with
+    lxml's xmlfile, one document at a time, instead of building the
+    tree for the whole batch up front.
+
+    Iterating over it yields the utf-8 encoded message in pieces, so
+    it can be handed straight to the HTTP layer as a streaming body;
+    it can be iterated more than once (eg. to retry a request).
+    Note that invalid documents will only be detected once
+    serialization reaches them."""
+    def __init__(self, schema, docs=()):
+        self.schema = schema
+        if hasattr(docs, "items") or not hasattr(docs, "__iter__"):
+            docs = [docs]
+        self.docs = docs
+
+    def __iter__(self):
+        out = _ChunkWriter()
+        with lxml.etree.xmlfile(out, encoding='utf-8', buffered=False) as xf:
+            with xf.element('add'):
+                for doc in self.docs:
+                    xf.write(self.doc(self.doc_dict(doc)))
+                    for chunk in out.drain():
+                        yield chunk
+        for chunk in out.drain():
+            yield chunk
+
+    def __str__(self):
+        return ''.join(self)
+
+
+class SolrJSONUpdate(SolrUpdate):
+    """An update message in Solr's JSON format, for posting to
+    /update/json. Documents are serialized straight to a list of
+    dictionaries, without building an XML tree."""
+    def __init__(self, schema, docs=()):
+        self.schema = schema
+        self.json = self.add(docs)
+
+    def fields(self, name, values):
+        serializer = self.schema.field_serializer(name)
+        if not hasattr(values, "__iter__"):
+            return serializer(values)
+        return [serializer(value) for value in values]
+
+    def doc(self, doc):
+        missing_fields = self.schema.missing_fields(doc)
+        if missing_fields:
+            raise SolrError("These required fields are unspecified:\n %s" %
+                            missing_fields)
+        return dict((name, self.fields(name, values))
+                    for name, values in doc.items())
+
+    def add(self, docs):
+        if hasattr(docs, "items") or not hasattr(docs, "__iter__"):
+            # is a dictionary, or anything else except a list
+            docs = [docs]
+        return [self.doc(self.doc_dict(doc)) for doc in docs]
+
+    def serialize_doc(self, doc):
+        return json.dumps(self.doc(self.doc_dict(doc)))
+
+    @staticmethod
+    def join(serialized_docs):
+        return "[%s]" % ",".join(serialized_docs)
+
+    def __str__(self):
+        return json.dumps(self.json)
+
+
+class SolrJavabinUpdate(SolrJSONUpdate):
+    """An update message in Solr's javabin format, for posting to
+    /update/javabin. Field values are sent as strings, as in the other
+    formats, and Solr converts them according to the schema."""
+    def serialize_doc(self, doc):
+        return javabin.encode_input_doc(
+            javabin.InputDocument(self.doc(self.doc_dict(doc)).items()))
+
+    @staticmethod
+    def join(serialized_docs):
+        return javabin.update_message(serialized_docs)
+
+    def __str__(self):
+        return self.join(javabin.encode_input_doc(javabin.InputDocument(doc.items()))
+                         for doc in self.json)
+
+
+class _ChunkWriter(object):
+    """File-like sink for xmlfile which collects written data until it
+    is drained."""
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        if data:
+            self.chunks.append(data)
+
+    def drain(self):
+        chunks, self.chunks = self.chunks, []
+        return chunks
+
+
 class SolrDelete(object):
     DELETE = E.delete
     ID = E.id
     QUERY = E.query
     def __init__(self, schema, docs=None, queries=None):
         self.schema = schema
+        self.xml = self.DELETE(*self.deletions(docs, queries))
+
+    def deletions(self, docs, queries):
         deletions = []
         if docs is not None:
             deletions += self.delete_docs(docs)
         if queries is not None:
             deletions += self.delete_queries(queries)
-        self.xml = self.DELETE(*deletions)
+        return deletions
 
     def delete_docs(self, docs):
         if not self.schema.unique_key:
@@ -661,6 +995,42 @@ class SolrDelete(object):
         return lxml.etree.tostring(self.xml, encoding='utf-8')
 
 
+class SolrJSONDelete(SolrDelete):
+    """A delete command in Solr's JSON format, for posting to
+    /update/json."""
+    def __init__(self, schema, docs=None, queries=None):
+        self.schema = schema
+        self.json = self.deletions(docs, queries)
+
+    def delete_docs(self, docs):
+        if not self.schema.unique_key:
+            raise SolrError("This schema has no unique key - you can only delete by query")
+        if hasattr(docs, "items") or not hasattr(docs, "__iter__"):
+            # docs is a dictionary, or an object which is not a list
+            docs = [docs]
+        return [{"id":self.doc_id_from_doc(doc).to_solr()} for doc in docs]
+
+    def delete_queries(self, queries):
+        if not hasattr(queries, "__iter__"):
+            queries = [queries]
+        return [{"query":unicode(query)} for query in queries]
+
+    def __str__(self):
+        # Solr expects one "delete" key per deletion within the same
+        # object, which we can't express with a dictionary.
+        return "{%s}" % ",".join('"delete":%s' % json.dumps(deletion)
+                                 for deletion in self.json)
+
+
+class SolrJavabinDelete(SolrJSONDelete):
+    """A delete command in Solr's javabin format, for posting to
+    /update/javabin."""
+    def __str__(self):
+        return javabin.update_message(
+            delete_ids=[deletion["id"] for deletion in self.json if "id" in deletion],
+            delete_queries=[deletion["query"] for deletion in self.json if "query" in deletion])
+
+
 class SolrFacetCounts(object):
     members= ["facet_dates", "facet_fields", "facet_queries", "facet_ranges"]
     def __init__(self, **kwargs):
@@ -694,27 +1064,42 @@ class SolrFacetCounts(object):
         return SolrFacetCounts(**facet_counts_dict)
 
 class SolrResponse(object):
+    lazy = False
+
     @classmethod
-    def from_xml(cls, schema, xmlmsg):
+    def from_xml(cls, schema, xmlmsg, lazy=False, columnar=False):
         self = cls()
         self.schema = schema
+        self.lazy = lazy
         self.original_xml = xmlmsg
         doc = lxml.etree.fromstring(xmlmsg)
-        details = dict(value_from_node(n) for n in
-                       doc.xpath("/response/lst[@name!='moreLikeThis']"))
-        details['responseHeader'] = dict(details['responseHeader'])
+        self.set_xml_header(doc.xpath("/response/lst[@name='responseHeader']")[0])
+        result_node = doc.xpath("/response/result")[0]
+        if columnar:
+            self.result = SolrColumnarResult.from_xml(schema, result_node)
+        else:
+            self.result = SolrResult.from_xml(schema, result_node, lazy)
+        self.set_xml_details(doc)
+        return self
+
+    def set_xml_header(self, node):
+        _, header = value_from_node(node)
+        header = dict(header)
         for attr in ["QTime", "params", "status"]:
-            setattr(self, attr, details['responseHeader'].get(attr))
+            setattr(self, attr, header.get(attr))
         if self.status != 0:
             raise ValueError("Response indicates an error")
-        result_node = doc.xpath("/response/result")[0]
-        self.result = SolrResult.from_xml(schema, result_node)
+
+    def set_xml_details(self, doc):
+        schema = self.schema
+        details = dict(value_from_node(n) for n in
+                       doc.xpath("/response/lst[@name!='moreLikeThis']"))
         self.facet_counts = SolrFacetCounts.from_response(details)
         self.highlighting = dict((k, dict(v))
                                  for k, v in details.get("highlighting", ()))
         more_like_these_nodes = \
             doc.xpath("/response/lst[@name='moreLikeThis']/result")
-        more_like_these_results = [SolrResult.from_xml(schema, node)
+        more_like_these_results = [SolrResult.from_xml(schema, node, self.lazy)
                                   for node in more_like_these_nodes]
         self.more_like_these = dict((n.name, n)
                                          for n in more_like_these_results)
@@ -730,23 +1115,38 @@ class SolrResponse(object):
         else:
             value = None
         self.interesting_terms = value
-        return self
+
+        # only there for queries with a cursorMark
+        cursorNodes = doc.xpath("/response/str[@name='nextCursorMark']")
+        self.next_cursor_mark = cursorNodes[0].text if cursorNodes else None
+        self.stats = stats_from_pairs(details.get("stats", ()))
 
     @classmethod
-    def from_json(cls, schema, jsonmsg):
+    def from_json(cls, schema, jsonmsg, lazy=False, columnar=False):
         self = cls()
         self.schema = schema
+        self.lazy = lazy
         self.original_json = jsonmsg
         doc = json.loads(jsonmsg)
-        details = doc['responseHeader']
+        self.set_json_header(doc['responseHeader'])
+        if columnar:
+            self.result = SolrColumnarResult.from_json(schema, doc['response'])
+        else:
+            self.result = SolrResult.from_json(schema, doc['response'], lazy)
+        self.set_json_details(doc)
+        return self
+
+    def set_json_header(self, details):
         for attr in ["QTime", "params", "status"]:
             setattr(self, attr, details.get(attr))
         if self.status != 0:
             raise ValueError("Response indicates an error")
-        self.result = SolrResult.from_json(schema, doc['response'])
+
+    def set_json_details(self, doc):
+        schema = self.schema
         self.facet_counts = SolrFacetCounts.from_response_json(doc)
         self.highlighting = doc.get("highlighting", {})
-        self.more_like_these = dict((k, SolrResult.from_json(schema, v))
+        self.more_like_these = dict((k, SolrResult.from_json(schema, v, self.lazy))
                 for (k, v) in doc.get('moreLikeThis', {}).viewitems())
         if len(self.more_like_these) == 1:
             self.more_like_this = self.more_like_these.values()[0]
@@ -758,8 +1158,54 @@ class SolrResponse(object):
             self.interesting_terms = interesting_terms.values()[0]
         else:
             self.interesting_terms = None
+        self.next_cursor_mark = doc.get('nextCursorMark')
+        self.stats = doc.get('stats', {}).get('stats_fields') or {}
+
+    @classmethod
+    def from_javabin(cls, schema, msg, columnar=False):
+        self = cls()
+        self.schema = schema
+        self.original_javabin = msg
+        details = dict(javabin.loads(msg))
+        details['responseHeader'] = dict(details['responseHeader'])
+        for attr in ["QTime", "params", "status"]:
+            setattr(self, attr, details['responseHeader'].get(attr))
+        if self.status != 0:
+            raise ValueError("Response indicates an error")
+        if columnar:
+            self.result = SolrColumnarResult.from_javabin(schema, details['response'])
+        else:
+            self.result = SolrResult.from_javabin(schema, details['response'])
+        # NamedLists decode to the same (name, value) pairs as the XML
+        # parser produces, so these are handled as for XML.
+        self.facet_counts = SolrFacetCounts.from_response(details)
+        self.highlighting = dict((k, dict(v))
+                                 for k, v in details.get("highlighting", ()))
+        self.more_like_these = dict((k, SolrResult.from_javabin(schema, v, k))
+                                    for k, v in details.get("moreLikeThis", ()))
+        if len(self.more_like_these) == 1:
+            self.more_like_this = self.more_like_these.values()[0]
+        else:
+            self.more_like_this = None
+        # can be computed by MoreLikeThisHandler
+        self.interesting_terms = details.get("interestingTerms")
+        self.next_cursor_mark = details.get("nextCursorMark")
+        self.stats = stats_from_pairs(details.get("stats", ()))
         return self
 
+    def copy(self):
+        """Return a copy which can be transformed (as SolrSearch.execute()
+        does to its results) without changing this response. The results
+        and their documents are copied; field values and the response's
+        other details are shared."""
+        response = copy.copy(self)
+        response.result = self.result.copy()
+        response.more_like_these = dict((k, v.copy())
+                                        for k, v in self.more_like_these.items())
+        if self.more_like_this is not None:
+            response.more_like_this = response.more_like_these.values()[0]
+        return response
+
     def __str__(self):
         return str(self.result)
 
@@ -770,25 +1216,179 @@ class SolrResponse(object):
         return self.result.docs[key]
 
 
+class SolrStreamingResponse(SolrResponse):
+    """A response which is parsed with iterparse as it is read, rather
+    than all at once. result.docs is an iterator, which yields each
+    document once its <doc> element has been read, discarding the
+    element afterwards; it can only be iterated over once.
+
+    The response header is read straight away. Facets, highlighting and
+    the other sections Solr writes after the documents are read when
+    first accessed; any documents not yet iterated over are parsed and
+    kept for the iterator then."""
+    streaming = True
+    lazy_attributes = ("facet_counts", "highlighting", "more_like_these",
+                       "more_like_this", "interesting_terms", "next_cursor_mark", "stats")
+
+    def __init__(self, schema, f, lazy=False):
+        self.schema = schema
+        self.lazy = lazy
+        self.source = f
+        self.events = lxml.etree.iterparse(f, events=('start', 'end'))
+        self.root = None
+        for event, elem in self.events:
+            if self.root is None:
+                self.root = elem
+            elif elem.getparent() is not self.root:
+                continue
+            elif event == 'end' and elem.get('name') == 'responseHeader':
+                self.set_xml_header(elem)
+            elif event == 'start' and elem.tag == 'result':
+                break
+        else:
+            raise SolrError("No result found in response")
+        self.result = SolrStreamingResult(schema, elem.attrib['name'],
+                                          elem.attrib['numFound'], elem.attrib['start'],
+                                          self.stream_docs(elem))
+
+    def stream_docs(self, result_node):
+        for event, elem in self.events:
+            if event != 'end':
+                continue
+            if elem.tag == 'doc' and elem.getparent() is result_node:
+                doc = self.schema.parse_result_doc(elem, lazy=self.lazy)
+                # Free the element, and any earlier siblings.
+                elem.clear()
+                while elem.getprevious() is not None:
+                    del result_node[0]
+                yield doc
+            elif elem is result_node:
+                return
+
+    def finish(self):
+        """Read the rest of the response, keeping any documents which
+        haven't been iterated over yet."""
+        if "facet_counts" in self.__dict__:
+            return
+        self.result.docs_stream.buffer()
+        for event, elem in self.events:
+            pass
+        self.set_xml_details(self.root)
+        self.close()
+
+    def close(self):
+        if hasattr(self.source, "close"):
+            self.source.close()
+
+    def __getattr__(self, name):
+        if name in self.lazy_attributes:
+            self.finish()
+            return self.__dict__[name]
+        raise AttributeError(name)
+
+    def __iter__(self):
+        return iter(self.result.docs)
+
+    def __len__(self):
+        raise TypeError("The length of a streamed response isn't known until it has been read")
+
+
+class SolrJSONStreamingResponse(SolrStreamingResponse):
+    """A streaming response in JSON. Everything up to the documents in
+    the main result is decoded straight away; the documents are then
+    decoded one at a time, as for SolrStreamingResponse."""
+    def __init__(self, schema, f, lazy=False):
+        self.schema = schema
+        self.lazy = lazy
+        self.source = f
+        self.reader = JSONStreamReader(f)
+        self.details = {}
+        self.sections = self.reader.iter_object()
+        for key in self.sections:
+            if key == 'responseHeader':
+                self.set_json_header(self.reader.read_value())
+            elif key == 'response':
+                break
+            else:
+                self.details[key] = self.reader.read_value()
+        else:
+            raise SolrError("No result found in response")
+        self.result = self.read_result()
+
+    def read_result(self):
+        result = {}
+        keys = self.reader.iter_object()
+        for key in keys:
+            if key == 'docs':
+                docs = self.stream_docs(keys)
+                break
+            result[key] = self.reader.read_value()
+        else:
+            docs = iter(())
+        return SolrStreamingResult(self.schema, 'response',
+                                   result.get('numFound', 0), result.get('start', 0),
+                                   docs)
+
+    def stream_docs(self, keys):
+        for doc in self.reader.iter_array():
+            yield self.schema.parse_result_doc_json(doc, self.lazy)
+        # Solr writes the docs last, but skip anything after them.
+        for key in keys:
+            self.reader.skip_value()
+
+    def finish(self):
+        if "facet_counts" in self.__dict__:
+            return
+        self.result.docs_stream.buffer()
+        for key in self.sections:
+            self.details[key] = self.reader.read_value()
+        if 'responseHeader' in self.details:
+            self.set_json_header(self.details.pop('responseHeader'))
+        self.set_json_details(self.details)
+        self.close()
+
+
+class DocumentStream(object):
+    """An iterator over documents as they are parsed from a response,
+    holding any which had to be read ahead."""
+    def __init__(self, docs):
+        self.docs = docs
+        self.buffered = collections.deque()
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        if self.buffered:
+            return self.buffered.popleft()
+        return next(self.docs)
+
+    def buffer(self):
+        self.buffered.extend(self.docs)
+
+
 class SolrResult(object):
     @classmethod
-    def from_xml(cls, schema, node):
+    def from_xml(cls, schema, node, lazy=False):
         self = cls()
         self.schema = schema
         self.name = node.attrib['name']
         self.numFound = int(node.attrib['numFound'])
         self.start = int(node.attrib['start'])
-        self.docs = [schema.parse_result_doc(n) for n in node.xpath("doc")]
+        self.docs = [schema.parse_result_doc(n, lazy=lazy) for n in node.xpath("doc")]
         return self
 
     @classmethod
-    def from_json(cls, schema, node):
+    def from_json(cls, schema, node, lazy=False):
         self = cls()
         self.schema = schema
         self.name = 'response'
         self.numFound = int(node['numFound'])
         self.start = int(node['start'])
         docs = node['docs']
+        if lazy:
+            self.docs = [schema.parse_result_doc_json(doc, lazy) for doc in docs]
+            return self
         for doc in docs:
             parsed_doc = schema.parse_result_doc_json(doc)
             # We're relying here on the fact that parse_result_doc_json
@@ -799,16 +1399,140 @@ class SolrResult(object):
         self.docs = docs
         return self
 
+    @classmethod
+    def from_javabin(cls, schema, doc_list, name='response'):
+        self = cls()
+        self.schema = schema
+        self.name = name
+        self.numFound = int(doc_list.numFound)
+        self.start = int(doc_list.start)
+        self.docs = [schema.parse_result_doc_javabin(doc) for doc in doc_list]
+        return self
+
+    def copy(self):
+        result = copy.copy(self)
+        result.docs = [dict(doc) for doc in self.docs]
+        return result
+
     def __str__(self):
         return "%(numFound)s results found, starting at #%(start)s\n\n" % self.__dict__ + str(self.docs)
 
 
+class SolrStreamingResult(SolrResult):
+    def __init__(self, schema, name, numFound, start, docs):
+        self.schema = schema
+        self.name = name
+        self.numFound = int(numFound)
+        self.start = int(start)
+        self.docs = self.docs_stream = DocumentStream(docs)
+
+
+class SolrColumnarResult(SolrResult):
+    """A result whose documents are collected into columns, one per
+    field, in the columns dictionary (see sunburnt.columns)."""
+    @classmethod
+    def from_xml(cls, schema, node):
+        builder = ColumnBuilder(schema)
+        for doc in node.iterchildren('doc'):
+            builder.add_row(schema.parse_result_fields(doc))
+        return cls.from_columns(schema, node.attrib['name'], node.attrib['numFound'],
+                                node.attrib['start'], builder)
+
+    @classmethod
+    def from_json(cls, schema, node):
+        builder = ColumnBuilder(schema)
+        for doc in node['docs']:
+            builder.add_row(schema.parse_result_doc_json(doc).iteritems())
+        return cls.from_columns(schema, 'response', node['numFound'], node['start'], builder)
+
+    @classmethod
+    def from_javabin(cls, schema, doc_list, name='response'):
+        builder = ColumnBuilder(schema)
+        for doc in doc_list:
+            builder.add_row(schema.parse_result_doc_javabin(doc).iteritems())
+        return cls.from_columns(schema, name, doc_list.numFound, doc_list.start, builder)
+
+    @classmethod
+    def from_columns(cls, schema, name, numFound, start, builder):
+        self = cls()
+        self.schema = schema
+        self.name = name
+        self.numFound = int(numFound)
+        self.start = int(start)
+        self.rows = builder.rows
+        self.columns = builder.finish()
+        return self
+
+    @property
+    def docs(self):
+        """The documents as dictionaries, rebuilt from the columns."""
+        docs = [{} for i in range(self.rows)]
+        for name, column in self.columns.iteritems():
+            for doc, value in zip(docs, column):
+                if value is not None:
+                    doc[name] = value
+        return docs
+
+
+class LazyDocument(collections.MutableMapping):
+    """A result document which keeps field values as Solr sent them,
+    converting each one the first time it's looked up (and keeping the
+    result). Apart from that, and from not being a subclass of dict, it
+    behaves like the dictionaries normally returned."""
+    def __init__(self, schema, fields, unconverted):
+        self.schema = schema
+        self.fields = fields
+        self.unconverted = unconverted
+
+    def __getitem__(self, name):
+        value = self.fields[name]
+        if name in self.unconverted:
+            decoder = self.schema.field_decoders[name]
+            if isinstance(value, (tuple, list)):
+                value = type(value)(decoder(v) for v in value)
+            else:
+                value = decoder(value)
+            self.fields[name] = value
+            self.unconverted.discard(name)
+        return value
+
+    def __setitem__(self, name, value):
+        self.fields[name] = value
+        self.unconverted.discard(name)
+
+    def __delitem__(self, name):
+        del self.fields[name]
+        self.unconverted.discard(name)
+
+    def __contains__(self, name):
+        return name in self.fields
+
+    def __iter__(self):
+        return iter(self.fields)
+
+    def __len__(self):
+        return len(self.fields)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
 def object_to_dict(o, schema):
-    # Get fields from schema
-    fields = schema.fields.keys()
-    # Check if any attributes defined on object match
-    # dynamic field patterns
-    fields.extend([f for f in dir(o) if schema.match_dynamic_field(f)])
+    plan = schema.attribute_plan(o.__class__)
+    if plan is None:
+        # Get fields from schema
+        fields = schema.fields.keys()
+        # Check if any attributes defined on object match
+        # dynamic field patterns
+        fields.extend([f for f in dir(o) if schema.match_dynamic_field(f)])
+    else:
+        # Fields provided by the class are planned in advance; we only
+        # need to look at attributes set on this particular instance.
+        fields, planned = plan
+        instance_fields = [f for f in getattr(o, '__dict__', ())
+                           if f not in planned and schema.match_field(f)]
+        if instance_fields:
+            fields = fields + tuple(instance_fields)
     d = {}
     for field in fields:
         value = get_attribute_or_callable(o, field)
@@ -829,6 +1553,14 @@ def get_attribute_or_callable(o, name):
         a = None
     return a
 
+def stats_from_pairs(stats):
+    """Turn the stats section of a response, as (name, value) pairs,
+    into a dictionary mapping each field to a dictionary of its
+    statistics (or None, for a field with no values)."""
+    return dict((field, dict(values) if values is not None else None)
+                for field, values in dict(stats).get("stats_fields") or ())
+
+
 def value_from_node(node):
     name = node.attrib.get('name')
     if node.tag in ('lst', 'arr'):
@@ -2,14 +2,28 @@ from __future__ import absolute_import
 
 import collections, copy, operator, re
 
-from .schema import solr_date, SolrError, SolrBooleanField, SolrUnicodeField, WildcardFieldInstance
-from .walktree import walk, event, leaf, exit
+from .cache import CountCache
+from .prefetch import PagePrefetcher, merge_iterators
+from .schema import solr_date, SolrError, SolrBooleanField, SolrDateField, SolrNumericalField, \
+    SolrUnicodeField, WildcardFieldInstance
 
 class LuceneQuery(object):
+    """A query, built up with add() and combined with &, |, ~ and **.
+
+    freeze() returns an immutable copy of a query, and the frozen copies
+    of queries with the same structure (and the same values) are the
+    same object, per schema, so a query's normalized form and
+    serialization are worked out once and then remembered by its frozen
+    copy, under the schema's query_lock. Queries freeze their subqueries
+    as they're combined, so changing a query afterwards doesn't change
+    the queries it's part of.
+    """
     default_term_re = re.compile(r'^\w+$')
+    frozen = False
     def __init__(self, schema, option_flag=None, original=None):
         self.schema = schema
         self.normalized = False
+        self._frozen = None
         if original is None:
             self.option_flag = option_flag
             self.terms = collections.defaultdict(set)
@@ -21,22 +35,79 @@ class LuceneQuery(object):
             self.boosts = []
         else:
             self.option_flag = original.option_flag
-            self.terms = copy.copy(original.terms)
-            self.phrases = copy.copy(original.phrases)
-            self.ranges = copy.copy(original.ranges)
-            self.subqueries = copy.copy(original.subqueries)
+            # The sets of values are copied too, so that adding to the
+            # copy doesn't add to the original.
+            self.terms = self.copy_term_dict(original.terms)
+            self.phrases = self.copy_term_dict(original.phrases)
+            self.ranges = set(original.ranges)
+            self.subqueries = list(original.subqueries)
             self._or = original._or
             self._and = original._and
             self._not = original._not
             self._pow = original._pow
-            self.boosts = copy.copy(original.boosts)
+            self.boosts = list(original.boosts)
+
+    @staticmethod
+    def copy_term_dict(terms):
+        return collections.defaultdict(set, ((k, set(v)) for k, v in terms.items()))
 
     def clone(self, **kwargs):
         q = LuceneQuery(self.schema, original=self)
         for k, v in kwargs.items():
             setattr(q, k, v)
+        if not kwargs:
+            # Same structure, so the same frozen copy
+            q._frozen = self.freeze() if self.frozen else self._frozen
         return q
 
+    def changed(self):
+        if self.frozen:
+            raise TypeError("A frozen query can't be changed; clone() it first")
+        self.normalized = False
+        self._frozen = None
+
+    def freeze(self):
+        """Return an immutable equivalent of this query. Freezing two
+        queries with the same structure and values (clones, say) gives
+        the same object, which remembers its normalized form and
+        serialization."""
+        if self.frozen:
+            return self
+        if self._frozen is None:
+            subqueries = tuple(q.freeze() for q in self.subqueries)
+            key = (self._and, self._or, self._not,
+                   False if self._pow is False else (type(self._pow), unicode(self._pow)),
+                   self.instance_key(self.terms), self.instance_key(self.phrases),
+                   frozenset((name, rel, tuple(id(v) for v in values))
+                             for name, rel, values in self.ranges),
+                   subqueries,
+                   tuple((tuple(sorted((k, repr(v)) for k, v in kwargs.items())), repr(score))
+                         for kwargs, score in self.boosts))
+            nodes = self.schema.query_nodes
+            node = nodes.get(key)
+            if node is None:
+                node = LuceneQuery(self.schema)
+                node.terms = dict((k, frozenset(v)) for k, v in self.terms.items())
+                node.phrases = dict((k, frozenset(v)) for k, v in self.phrases.items())
+                node.ranges = frozenset(self.ranges)
+                node.subqueries = subqueries
+                node._and, node._or, node._not, node._pow = \
+                    self._and, self._or, self._not, self._pow
+                node.boosts = tuple(self.boosts)
+                node.frozen = True
+                node.normal = None
+                node.strings = {}
+                node = nodes.setdefault(key, node)
+            self._frozen = node
+        return self._frozen
+
+    @staticmethod
+    def instance_key(terms):
+        # Values are told apart by identity, as they are in the sets of
+        # terms, rather than by how they're written: a value repeated in
+        # separately built subqueries is repeated in the query too.
+        return frozenset((name, id(v)) for name, values in terms.items() for v in values)
+
     def options(self):
         opts = {}
         s = unicode(self)
@@ -70,18 +141,17 @@ class LuceneQuery(object):
         print '%s%s' % (indentspace, '}')
 
     # Below, we sort all our value_sets - this is for predictability when testing.
-    def serialize_term_queries(self, terms):
+    def term_query_list(self, terms):
         s = []
         for name, value_set in terms.items():
-            if name:
-                field = self.schema.match_field(name)
-            else:
-                field = self.schema.default_field
             if name:
                 s += [u'%s:%s' % (name, value.to_query()) for value in value_set]
             else:
                 s += [value.to_query() for value in value_set]
-        return u' AND '.join(sorted(s))
+        return sorted(s)
+
+    def serialize_term_queries(self, terms):
+        return u' AND '.join(self.term_query_list(terms))
 
     range_query_templates = {
         "any": u"[* TO *]",
@@ -92,13 +162,18 @@ class LuceneQuery(object):
         "rangeexc": u"{%s TO %s}",
         "range": u"[%s TO %s]",
     }
-    def serialize_range_queries(self):
+    def range_query_list(self):
         s = []
         for name, rel, values in sorted(self.ranges):
+            if not any(isinstance(value, ParamInstance) for value in values):
+                values = sorted(values, key=lambda x: getattr(x, "value"))
             range_s = self.range_query_templates[rel] % \
-                tuple(value.to_query() for value in sorted(values, key=lambda x: getattr(x, "value")))
+                tuple(value.to_query() for value in values)
             s.append(u"%s:%s" % (name, range_s))
-        return u' AND '.join(s)
+        return s
+
+    def serialize_range_queries(self):
+        return u' AND '.join(self.range_query_list())
 
     def child_needs_parens(self, child):
         if len(child) == 1:
@@ -113,26 +188,54 @@ class LuceneQuery(object):
             return True
 
     def normalize(self):
-        # shortcut to avoid re-normalization no-ops
-        if self.normalized:
-            return self, False
-
-        changed = False
-        for path in walk(self, lambda q: q.subqueries, event(exit|leaf)):
-            if len(path) == 1:
-                # last time around, so:
-                break
-            this = path[-1]
-            obj = self.normalize_node(this)
-            obj.normalized = True
-            if obj != this:
-                siblings = path[-2].subqueries
-                i = siblings.index(this)
-                siblings[i] = obj
-                changed = True
+        """Return the normalized form of this query (frozen), and
+        whether it differs from the query.
+
+        Normalizing drops empty subqueries, hoists the contents of ANDs
+        within ANDs (and ORs within ORs) into their parent, cancels out
+        double negatives and removes ANDs and ORs with nothing but a
+        single subquery. It's done in one pass from the leaves up; see
+        PartialQuery.
+        """
+        query = self.freeze()
+        if query.normal is None:
+            with self.schema.query_lock:
+                if query.normal is None:
+                    self.normalize_node(query)
+        return query.normal, query.normal is not query
 
-        obj = self.normalize_node(self)
-        return obj, (changed or obj == self)
+    @staticmethod
+    def normalize_node(query):
+        # List the nodes still to be normalized, each after its
+        # subqueries, counting how many times each is used.
+        order = []
+        uses = collections.defaultdict(int)
+        seen = set()
+        stack = [(query, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if expanded:
+                order.append(node)
+                continue
+            if id(node) in seen:
+                continue
+            seen.add(id(node))
+            stack.append((node, True))
+            for q in node.subqueries:
+                if q.normal is None:
+                    uses[id(q)] += 1
+                    stack.append((q, False))
+        # Each node's contents can be hoisted into its parent without
+        # being frozen, unless it's shared between several parents.
+        partials = {}
+        for node in order:
+            partial = PartialQuery.from_node(node, partials)
+            if not isinstance(partial, PartialQuery):
+                # It reduced to one of its (normalized) subqueries.
+                node.normal = partial
+            elif node is query or uses[id(node)] > 1:
+                partial = partial.finish()
+            partials[id(node)] = partial
 
     @staticmethod
     def merge_term_dicts(args):
@@ -142,62 +245,26 @@ class LuceneQuery(object):
                 d[k].update(v)
         return dict((k, v) for k, v in d.items())
 
-    @staticmethod
-    def normalize_node(obj):
-        """ Normalize a query node provided all its sub-queries
-        are already normalized"""
-        # Recalculate terms/phrases/ranges/subqueries as appropriate given immediate subqueries
-        terms = [obj.terms]
-        phrases = [obj.phrases]
-        ranges = [obj.ranges]
-        subqueries = []
-
-        mutated = False
-        for s in obj.subqueries:
-            if not s:
-                mutated = True # we're dropping a subquery
-                continue # don't append
-            if (s._and and obj._and) or (s._or and obj._or):
-                # then hoist the contents up
-                terms.append(s.terms)
-                phrases.append(s.phrases)
-                ranges.append(s.ranges)
-                subqueries.extend(s.subqueries)
-                mutated = True
-            else: # just keep it unchanged
-                subqueries.append(s)
-
-        # and clone if there have been any changes
-        if mutated:
-            obj = obj.clone(terms = obj.merge_term_dicts(terms),
-                            phrases = obj.merge_term_dicts(phrases),
-                            ranges = reduce(operator.or_, ranges),
-                            subqueries = subqueries)
-
-        # having recalculated subqueries, there may be the opportunity for further normalization, if we have zero or one subqueries left
-        if not len(obj.subqueries):
-            if obj._not:
-                obj = obj.clone(_not=False, _and=True)
-            elif obj._pow:
-                obj = obj.clone(_pow=False)
-        elif len(obj.subqueries) == 1:
-            if obj._not and obj.subqueries[0]._not:
-                obj = obj.clone(subqueries=obj.subqueries[0].subqueries, _not=False, _and=True)
-            elif (obj._and or obj._or) and not obj.terms and not obj.phrases and not obj.ranges and not obj.boosts:
-                obj = obj.subqueries[0]
-        obj.normalized = True
-        return obj
-
     def __unicode__(self):
         return self.serialize_to_unicode(level=0, op=None)
 
     def serialize_to_unicode(self, level=0, op=None):
-        if not self.normalized:
-            self, _ = self.normalize()
+        query, _ = self.normalize()
+        # Only whether we're at the top level, or directly under an AND,
+        # changes how a query is written.
+        key = (0, None) if level == 0 else (1, op) if level == 1 else (2, None)
+        try:
+            return query.strings[key]
+        except KeyError:
+            with self.schema.query_lock:
+                if key not in query.strings:
+                    query.strings[key] = query.serialize_node(level, op)
+                return query.strings[key]
+
+    def serialize_node(self, level, op):
         if self.boosts:
             # Clone and rewrite to effect the boosts.
-            newself = self.clone()
-            newself.boosts = []
+            newself = self.clone(boosts=[])
             boost_queries = [self.Q(**kwargs)**boost_score
                              for kwargs, boost_score in self.boosts]
             newself = newself | (newself & reduce(operator.or_, boost_queries))
@@ -253,19 +320,19 @@ class LuceneQuery(object):
         q = LuceneQuery(self.schema)
         q._and = False
         q._or = True
-        q.subqueries = [self, other]
+        q.subqueries = [self.freeze(), other.freeze()]
         return q
 
     def __and__(self, other):
         q = LuceneQuery(self.schema)
-        q.subqueries = [self, other]
+        q.subqueries = [self.freeze(), other.freeze()]
         return q
 
     def __invert__(self):
         q = LuceneQuery(self.schema)
         q._and = False
         q._not = True
-        q.subqueries = [self]
+        q.subqueries = [self.freeze()]
         return q
 
     def __pow__(self, value):
@@ -274,17 +341,17 @@ class LuceneQuery(object):
         except ValueError:
             raise ValueError("Non-numeric value supplied for boost")
         q = LuceneQuery(self.schema)
-        q.subqueries = [self]
+        q.subqueries = [self.freeze()]
         q._and = False
         q._pow = value
         return q
 
     def add(self, args, kwargs):
-        self.normalized = False
+        self.changed()
         _args = []
         for arg in args:
             if isinstance(arg, LuceneQuery):
-                self.subqueries.append(arg)
+                self.subqueries.append(arg.freeze())
             else:
                 _args.append(arg)
         args = _args
@@ -315,6 +382,7 @@ class LuceneQuery(object):
         # We let people pass in a list of values to match.
         # This really only makes sense for text fields or
         # multivalued fields.
+        self.changed()
         if not hasattr(values, "__iter__"):
             values = [values]
         # We can only do a field_name == "*" if:
@@ -328,7 +396,7 @@ class LuceneQuery(object):
                 return
             else:
                 raise SolrError("If field_name is '*', then only '*' is permitted as the query")
-        insts = [field.instance_from_user_data(value) for value in values]
+        insts = [self.field_instance(field, field_name, value) for value in values]
         for inst in insts:
             if isinstance(field, SolrUnicodeField):
                 this_term_or_phrase = term_or_phrase or self.term_or_phrase(inst.value)
@@ -337,6 +405,7 @@ class LuceneQuery(object):
             getattr(self, this_term_or_phrase)[field_name].add(inst)
 
     def add_range(self, field_name, rel, value):
+        self.changed()
         field = self.schema.match_field(field_name)
         if isinstance(field, SolrBooleanField):
             raise ValueError("Cannot do a '%s' query on a bool field" % rel)
@@ -348,30 +417,183 @@ class LuceneQuery(object):
             except (AssertionError, TypeError):
                 raise SolrError("'%s__%s' argument must be a length-2 iterable"
                                  % (field_name, rel))
-            insts = tuple(sorted(field.instance_from_user_data(v) for v in value))
+            insts = tuple(self.field_instance(field, field_name, v) for v in value)
+            # The bounds of a prepared range can't be put in order until
+            # they're bound, so they're kept in the order given.
+            if not any(isinstance(inst, ParamInstance) for inst in insts):
+                insts = tuple(sorted(insts))
         elif rel == 'any':
             if value is not True:
                 raise SolrError("'%s__%s' argument must be True")
             insts = ()
         else:
-            insts = (field.instance_from_user_data(value),)
+            insts = (self.field_instance(field, field_name, value),)
         self.ranges.add((field_name, rel, insts))
 
+    def field_instance(self, field, field_name, value):
+        if isinstance(value, Param):
+            return ParamInstance(field_name, value.name)
+        return field.instance_from_user_data(value)
+
     def term_or_phrase(self, arg, force=None):
         return 'terms' if self.default_term_re.match(arg) else 'phrases'
 
     def add_boost(self, kwargs, boost_score):
+        self.changed()
         for k, v in kwargs.items():
             field = self.schema.match_field(k)
             if not field:
                 raise ValueError("%s is not a valid field name" % k)
             elif not field.indexed:
                 raise SolrError("Can't query on non-indexed field '%s'" % k)
-            value = field.instance_from_user_data(v)
+            value = self.field_instance(field, k, v)
         self.boosts.append((kwargs, boost_score))
 
 
 
+class PartialQuery(object):
+    """A query node part way through normalization, whose subqueries
+    have all been normalized.
+
+    Rather than merging the terms, phrases and ranges of each hoisted
+    subquery straight away, it keeps a list of their dictionaries (or
+    sets) to merge once, when it's finished, and its subqueries are kept
+    in a deque. Hoisting a PartialQuery into its parent takes over the
+    largest of its hoisted subqueries' lists and adds the rest to them,
+    so that normalizing a long chain of ORs (as reduce(operator.or_, ...)
+    builds) takes time in proportion to its length, not its square.
+    """
+    __slots__ = ('node', 'schema', 'terms', 'phrases', 'ranges', 'subqueries',
+                 '_and', '_or', '_not', '_pow', 'boosts', 'has_leaves', 'changed')
+
+    def __init__(self, node, terms, phrases, ranges, subqueries, has_leaves):
+        self.node = node
+        self.schema = node.schema
+        self.terms = terms
+        self.phrases = phrases
+        self.ranges = ranges
+        self.subqueries = subqueries
+        self._and, self._or, self._not, self._pow = \
+            node._and, node._or, node._not, node._pow
+        self.boosts = node.boosts
+        self.has_leaves = has_leaves
+        self.changed = False
+
+    @classmethod
+    def from_frozen(cls, node):
+        return cls(node, [node.terms], [node.phrases], [node.ranges],
+                   collections.deque(node.subqueries),
+                   bool(node.terms or node.phrases or node.ranges))
+
+    def __nonzero__(self):
+        return self.has_leaves or bool(self.subqueries)
+
+    def __len__(self):
+        return len(self.subqueries) + len(self.terms)
+
+    def absorb(self, other, at_start=False):
+        """Hoist other's contents into this query, its subqueries
+        going before or after this query's own."""
+        self.terms.extend(other.terms)
+        self.phrases.extend(other.phrases)
+        self.ranges.extend(other.ranges)
+        if at_start:
+            self.subqueries.extendleft(reversed(other.subqueries))
+        else:
+            self.subqueries.extend(other.subqueries)
+        self.has_leaves = self.has_leaves or other.has_leaves
+
+    @classmethod
+    def from_node(cls, node, partials):
+        """Normalize the frozen query node, given the normalized forms of
+        its subqueries (their normal attribute, or else their entry, by
+        id, in partials). Returns a PartialQuery, or a frozen query if
+        the node reduces to one of its subqueries."""
+        hoist = lambda s: (s._and and node._and) or (s._or and node._or)
+        children = []
+        changed = False
+        for q in node.subqueries:
+            s = q.normal if q.normal is not None else partials[id(q)]
+            if not s:
+                changed = True # we're dropping a subquery
+                continue
+            if hoist(s):
+                if not isinstance(s, PartialQuery):
+                    s = cls.from_frozen(s)
+                changed = True
+            elif isinstance(s, PartialQuery):
+                s = s.finish()
+            changed = changed or s is not q
+            children.append(s)
+        # Take over the lists of the largest hoisted subquery.
+        hoisted = [i for i, s in enumerate(children) if isinstance(s, PartialQuery)]
+        if hoisted:
+            largest = max(hoisted, key=lambda i: len(children[i]))
+            base = children[largest]
+            own = cls(node, base.terms, base.phrases, base.ranges, base.subqueries,
+                      base.has_leaves)
+            own.terms.append(node.terms)
+            own.phrases.append(node.phrases)
+            own.ranges.append(node.ranges)
+            own.has_leaves = own.has_leaves or bool(node.terms or node.phrases or node.ranges)
+            before, after = reversed(children[:largest]), children[largest+1:]
+        else:
+            own = cls(node, [node.terms], [node.phrases], [node.ranges],
+                      collections.deque(), bool(node.terms or node.phrases or node.ranges))
+            before, after = (), children
+        for s in before:
+            if isinstance(s, PartialQuery):
+                own.absorb(s, at_start=True)
+            else:
+                own.subqueries.appendleft(s)
+        for s in after:
+            if isinstance(s, PartialQuery):
+                own.absorb(s)
+            else:
+                own.subqueries.append(s)
+        own.changed = changed
+
+        # having recalculated subqueries, there may be the opportunity
+        # for further normalization, if we have zero or one subqueries left
+        if not own.subqueries:
+            if own._not:
+                own._not, own._and = False, True
+                own.changed = True
+            elif own._pow:
+                own._pow = False
+                own.changed = True
+        elif len(own.subqueries) == 1:
+            only = own.subqueries[0]
+            if own._not and only._not:
+                own.subqueries = collections.deque(only.subqueries)
+                own._not, own._and = False, True
+                own.changed = True
+            elif (own._and or own._or) and not own.has_leaves and not own.boosts:
+                return only
+        return own
+
+    def finish(self):
+        """Return the frozen query this normalizes to, and remember it
+        as the normal form of the node it came from."""
+        if not self.changed:
+            query = self.node
+        else:
+            query = LuceneQuery(self.schema)
+            query.terms = LuceneQuery.merge_term_dicts(self.terms)
+            query.phrases = LuceneQuery.merge_term_dicts(self.phrases)
+            query.ranges = set().union(*self.ranges)
+            query.subqueries = list(self.subqueries)
+            query._and, query._or, query._not, query._pow = \
+                self._and, self._or, self._not, self._pow
+            query.boosts = list(self.boosts)
+            query = query.freeze()
+        query.normalized = True
+        if query.normal is None:
+            query.normal = query
+        self.node.normal = query
+        return query
+
+
 class BaseSearch(object):
     """Base class for common search options management"""
     option_modules = ('query_obj', 'filter_obj', 'paginator',
@@ -501,6 +723,8 @@ class BaseSearch(object):
         return newself
 
     def transform_result(self, result, constructor):
+        if getattr(result, 'streaming', False):
+            return self.transform_streaming_result(result, constructor)
         if constructor is not dict:
             construct_docs = lambda docs: [constructor(**d) for d in docs]
             result.result.docs = construct_docs(result.result.docs)
@@ -514,43 +738,170 @@ class BaseSearch(object):
         else:
             if result.highlighting:
                 for d in result.result.docs:
-                    # if the unique key for a result doc is present in highlighting,
-                    # add the highlighting for that document into the result dict
-                    # (but don't override any existing content)
-                    # If unique key field is not a string field (eg int) then we need to
-                    # convert it to its solr representation
-                    unique_key = self.schema.fields[self.schema.unique_key].to_solr(d[self.schema.unique_key])
-                    if 'solr_highlights' not in d and \
-                           unique_key in result.highlighting:
-                        d['solr_highlights'] = result.highlighting[unique_key]
+                    self.add_highlighting(d, result.highlighting)
         return result
 
+    def transform_streaming_result(self, result, constructor):
+        # Documents are transformed as they are read. Highlighting and
+        # more-like-this results come after the documents in the
+        # response, so only wait for them if the query asked for them.
+        options = self.options()
+        docs = result.result.docs
+        if constructor is not dict:
+            result.result.docs = (constructor(**d) for d in docs)
+            if 'mlt' in options:
+                for key in result.more_like_these:
+                    result.more_like_these[key].docs = \
+                            [constructor(**d) for d in result.more_like_these[key].docs]
+        elif 'hl' in options:
+            result.result.docs = (self.add_highlighting(d, result.highlighting) for d in docs)
+        return result
+
+    def add_highlighting(self, d, highlighting):
+        # if the unique key for a result doc is present in highlighting,
+        # add the highlighting for that document into the result dict
+        # (but don't override any existing content)
+        # If unique key field is not a string field (eg int) then we need to
+        # convert it to its solr representation
+        unique_key = self.schema.fields[self.schema.unique_key].to_solr(d[self.schema.unique_key])
+        if 'solr_highlights' not in d and \
+               unique_key in highlighting:
+            d['solr_highlights'] = highlighting[unique_key]
+        return d
+
     def params(self):
         return params_from_dict(**self.options())
 
     ## methods to allow SolrSearch to be used with Django paginator ##
 
-    _count = None
     def count(self):
-        # get the total count for the current query without retrieving any results
-        # cache it, since it may be needed multiple times when used with django paginator
-        if self._count is None:
-            # are we already paginated? then we'll behave as if that's
-            # defined our result set already.
-            if self.paginator.rows is not None:
-                total_results = self.paginator.rows
-            else:
-                response = self.paginate(rows=0).execute()
-                total_results = response.result.numFound
-                if self.paginator.start is not None:
-                    total_results -= self.paginator.start
-            self._count = total_results
-        return self._count
+        # get the total count for the current query, without retrieving
+        # any results unless no page of this query (or of a clone which
+        # differs only in pagination or sort order) has been fetched yet.
+        # are we already paginated? then we'll behave as if that's
+        # defined our result set already.
+        if self.paginator.rows is not None:
+            return self.paginator.rows
+        total_results = self.known_count()
+        if total_results is None:
+            total_results = self.paginate(rows=0).execute().result.numFound
+        if self.paginator.start is not None:
+            total_results -= self.paginator.start
+        return total_results
 
     __len__ = count
 
+    def __nonzero__(self):
+        # Without this, truth testing would go through __len__ anyway;
+        # either way it costs at most a count, and no results.
+        return self.count() > 0
+
+    def count_key(self):
+        # Neither the window (nor the cursor) nor the order of the
+        # results changes how many there are.
+        return tuple((k, v) for k, v in self.params()
+                     if k not in ('start', 'rows', 'sort', 'cursorMark'))
+
+    def remember_count(self, response):
+        # self.counts (a CountCache) is shared with the search's clones,
+        # so that any of them can answer count() from a page another has
+        # fetched. Counts are only good until the interface next updates
+        # the index.
+        self.counts.put(self.count_key(), self.interface.conn.generation,
+                        response.result.numFound)
+
+    def known_count(self):
+        """Return the number of results remembered for this search, or
+        None if there isn't one from since the index was last updated."""
+        return self.counts.get(self.count_key(), self.interface.conn.generation)
+
+    def count_known(self):
+        return self.paginator.rows is not None or self.known_count() is not None
+
+    # Results fetched per request when iterating over a search
+    batch_size = 100
+
+    def __iter__(self):
+        return self.iterate()
+
+    def iterate(self, batch_size=None, prefetch=0):
+        """Yield each result of the query, fetching batch_size of them
+        (by default, self.batch_size) per request. If the search has
+        been paginated, only the results in that window are fetched.
+        With prefetch=k, up to k pages are fetched in the background
+        ahead of the one being read (see pages())."""
+        for response in self.pages(batch_size, prefetch):
+            for doc in response.result.docs:
+                yield doc
+
+    def pages(self, batch_size=None, prefetch=0):
+        """Yield the response for each successive page of up to
+        batch_size results, within any paginate() window.
+
+        With prefetch=k, once the first page has been fetched (and the
+        number of results is known), the following pages are fetched
+        by background threads, up to k pages ahead of the one being
+        read; closing the generator early cancels the rest. The http
+        connection must be thread-safe; see sunburnt.prefetch."""
+        batch_size = batch_size or self.batch_size
+        start = self.paginator.start or 0
+        remaining = self.paginator.rows
+        while remaining is None or remaining > 0:
+            rows = batch_size if remaining is None else min(batch_size, remaining)
+            response = self.fetch_page(start, rows)
+            yield response
+            fetched = len(response.result.docs)
+            start += fetched
+            if fetched < rows or start >= response.result.numFound:
+                return
+            if remaining is not None:
+                remaining -= fetched
+            if prefetch:
+                break
+        else:
+            return
+        end = response.result.numFound
+        if remaining is not None:
+            end = min(end, start + remaining)
+        windows = ((s, min(batch_size, end - s)) for s in xrange(start, end, batch_size))
+        prefetcher = PagePrefetcher(self.fetch_page, windows, prefetch)
+        try:
+            for response in prefetcher:
+                yield response
+        finally:
+            prefetcher.close()
+
+    def fetch_page(self, start, rows):
+        return self.paginate(start=start, rows=rows).execute()
+
+    def fetch_tail(self, first, last):
+        """Fetch the results from the first'th last up to (but not
+        including) the last'th last - so fetch_tail(3, 0) fetches the
+        last three - in one request, by sorting the query in reverse.
+        That's only possible if reversing the sort gives exactly the
+        reverse order (see SortOptions.reversible()); if it doesn't,
+        return None.
+        """
+        if not self.sorter.reversible():
+            return None
+        search = self.paginate(start=last, rows=max(first - last, 0))
+        search.sorter.reverse()
+        response = search.execute()
+        # Leave out any results from before the start of our window.
+        offset = self.paginator.start or 0
+        numFound = response.result.numFound
+        docs = response.result.docs[:max(numFound - offset - last, 0)]
+        docs.reverse()
+        response.result.docs = docs
+        response.result.start = numFound - last - len(docs)
+        return response
+
     def __getitem__(self, k):
         """Return a single result or slice of results from the query.
+        Negative indices and open-ended slices need the number of
+        results, which is fetched with a separate request unless it's
+        already known; but if the sort ends in the unique key, results
+        counted from the end are fetched by sorting in reverse instead.
         """
         # are we already paginated? if so, we'll apply this getitem to the
         # paginated result - else we'll apply it to the whole.
@@ -570,6 +921,17 @@ class BaseSearch(object):
                 s2 = k.start
                 inc = 1
 
+            if s1 is not None and operator.index(s1) < 0 and \
+                    (s2 is None or operator.index(s2) < 0) and not self.count_known():
+                # The slice is measured from the end, so try fetching it
+                # from the end, rather than counting the results first.
+                response = self.fetch_tail(-operator.index(s1) - inc,
+                                           0 if s2 is None else -operator.index(s2) - inc)
+                if response is not None:
+                    if step != 1:
+                        response.result.docs = response.result.docs[::step]
+                    return response
+
             if s1 is not None:
                 start = operator.index(s1)
                 if start < 0:
@@ -602,6 +964,12 @@ class BaseSearch(object):
         else:
             # if not a slice, a single result is being requested
             k = operator.index(k)
+            if k < 0 and not self.count_known():
+                response = self.fetch_tail(-k, -k - 1)
+                if response is not None:
+                    if not response.result.docs:
+                        raise IndexError("list index out of range")
+                    return response.result.docs[0]
             if k < 0:
                 k += self.count()
                 if k < 0:
@@ -622,10 +990,12 @@ class SolrSearch(BaseSearch):
         if original is None:
             self.more_like_this = MoreLikeThisOptions(self.schema)
             self._init_common_modules()
+            self.counts = CountCache()
         else:
             for opt in self.option_modules:
                 setattr(self, opt, getattr(original, opt).clone())
             self.result_constructor = original.result_constructor
+            self.counts = original.counts
 
     def options(self):
         options = super(SolrSearch, self).options()
@@ -633,12 +1003,130 @@ class SolrSearch(BaseSearch):
             options['q'] = '*:*' # search everything
         return options
 
-    def execute(self, constructor=None):
+    def execute(self, constructor=None, stream=False, lazy=False, columnar=False):
+        """Run the search. With stream=True, documents are parsed as the
+        response is read, and result.docs is an iterator. With lazy=True,
+        each document converts its fields from Solr's representation
+        when they're first used. With columnar=True, the documents are
+        collected into result.columns, one column per field, and no
+        constructor is applied."""
         if constructor is None:
             constructor = self.result_constructor
-        result = self.interface.search(**self.options())
+        result = self.interface.select(self.params(), stream=stream, lazy=lazy,
+                                       columnar=columnar)
+        if not stream:
+            self.remember_count(result)
+        if columnar:
+            return result
         return self.transform_result(result, constructor)
 
+    def iter_all(self, batch_size=100, constructor=None):
+        """Yield every document matching the search, fetching batch_size
+        at a time with Solr's cursorMark, which (unlike start and rows)
+        doesn't get slower the further through the results it is. The
+        unique key is added to the sort order if it isn't there already.
+        Needs Solr 4.7 or later."""
+        if self.paginator.start:
+            raise SolrError("iter_all() can't start from an offset")
+        search = self.paginate(rows=batch_size)
+        search.sorter.add_unique_key()
+        cursor = "*"
+        while True:
+            response = search.add_extra(cursorMark=cursor).execute(constructor)
+            for doc in response.result.docs:
+                yield doc
+            next_cursor = response.next_cursor_mark
+            if next_cursor is None:
+                raise SolrError("Solr didn't return a cursor (it needs to be 4.7 or later)")
+            if next_cursor == cursor or len(response.result.docs) < batch_size:
+                return
+            cursor = next_cursor
+
+    def export(self, fields=None, constructor=None):
+        """Return an iterator over every document matching the search,
+        fetched from Solr's /export handler, which streams the whole
+        result set in one response. Only the given fields (by default,
+        those from field_limit()) are returned. They and the fields
+        sorted on (by default, the unique key) must all have docValues.
+        Documents are parsed one at a time as the response arrives."""
+        if constructor is None:
+            constructor = self.result_constructor
+        search = self.clone()
+        if fields is not None:
+            if isinstance(fields, basestring):
+                fields = [fields]
+            search.field_limiter = FieldLimitOptions(self.schema)
+            search.field_limiter.fields.update(fields)
+        if not search.field_limiter.fields or search.field_limiter.all_fields \
+               or search.field_limiter.score:
+            raise SolrError("export() needs a list of fields to return (not all fields, or score)")
+        if not search.sorter.fields:
+            search.sorter.add_unique_key()
+        names = set(search.field_limiter.fields)
+        names.update(field for order, field in search.sorter.fields)
+        for name in sorted(names):
+            field = self.schema.match_field(name)
+            if field is None:
+                raise SolrError("No such field %s" % name)
+            if not field.doc_values:
+                raise SolrError("Field %s has no docValues, so can't be exported" % name)
+        response = self.interface.export(search.params())
+        return self.export_docs(response, constructor)
+
+    def export_docs(self, response, constructor):
+        try:
+            for doc in response:
+                yield doc if constructor is dict else constructor(**doc)
+        finally:
+            response.close()
+
+    def partition(self, partitions, field=None):
+        """Split the search into at most partitions searches, filtered
+        on disjoint ranges of field, which together cover every document
+        with a value for it. field must be numeric or a date; it can be
+        left out if the unique key is, but string keys (UUIDs, say)
+        can't be split into ranges, so then it has to be given. The
+        ranges are of equal width, between the smallest and largest
+        values, which are found with a stats query.
+        """
+        if field is None:
+            field = self.schema.unique_key
+            if not isinstance(self.schema.unique_field, (SolrNumericalField, SolrDateField)):
+                raise SolrError("Can't partition on the unique key (%s), which isn't numeric "
+                                "or a date; give a numeric or date field to partition on" % field)
+        field_class = self.schema.match_field(field)
+        if not isinstance(field_class, (SolrNumericalField, SolrDateField)):
+            raise SolrError("Can only partition on a numeric or date field (not %s)" % field)
+        response = self.paginate(rows=0).add_extra(**{"stats": True, "stats.field": field}).execute()
+        stats = response.stats.get(field)
+        if not stats or stats.get("min") is None:
+            return [self]
+        decode = self.schema.field_decoder(field)
+        low, high = decode(stats["min"]), decode(stats["max"])
+        bounds = []
+        for i in range(1, partitions):
+            bound = low + (high - low) * i / partitions
+            if bound > (bounds[-1] if bounds else low):
+                bounds.append(bound)
+        searches = []
+        for lower, upper in zip([None] + bounds, bounds + [None]):
+            limits = {}
+            if lower is not None:
+                limits[field + "__gte"] = lower
+            if upper is not None:
+                limits[field + "__lt"] = upper
+            searches.append(self.filter(**limits) if limits else self)
+        return searches
+
+    def export_parallel(self, partitions=4, field=None, batch_size=1000, constructor=None):
+        """Yield every document matching the search, as iter_all() does,
+        but splitting the search into partitions (see partition()) which
+        are fetched concurrently, each by its own thread. Documents come
+        back in no particular order. The http connection must be
+        thread-safe; see sunburnt.prefetch."""
+        return merge_iterators([search.iter_all(batch_size, constructor)
+                                for search in self.partition(partitions, field)])
+
 
 class MltSolrSearch(BaseSearch):
     """Manage parameters to build a MoreLikeThisHandler query"""
@@ -662,11 +1150,13 @@ class MltSolrSearch(BaseSearch):
             self.url = url
             self.more_like_this = MoreLikeThisHandlerOptions(self.schema)
             self._init_common_modules()
+            self.counts = CountCache()
         else:
             self.content = original.content
             self.url = original.url
             for opt in self.option_modules:
                 setattr(self, opt, getattr(original, opt).clone())
+            self.counts = original.counts
 
     def query(self, *args, **kwargs):
         if self.content is not None or self.url is not None:
@@ -706,9 +1196,141 @@ class MltSolrSearch(BaseSearch):
 
     def execute(self, constructor=dict):
         result = self.interface.mlt_search(content=self.content, **self.options())
+        self.remember_count(result)
         return self.transform_result(result, constructor)
 
 
+class Param(object):
+    """A placeholder for a value in a search, to be given when the
+    search, once prepared with SolrInterface.prepare(), is bound:
+
+        >>> find = si.prepare(si.query(title=Param("title")).paginate(rows=Param("rows")))
+        >>> find.bind(title="Jaws", rows=10).execute()
+
+    Params can stand in for the values of query, filter, exclude and
+    facet_query terms and ranges, boosts, paginate()'s start and rows,
+    and add_extra() options.
+    """
+    # Params are written into the prepared search's parameters as these
+    # markers; a query's marker also names the field its value is for.
+    marker_re = re.compile(u"\ufdd0([^\ufdd1\ufdd2]*)(?:\ufdd2([^\ufdd1]*))?\ufdd1")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return "Param(%r)" % self.name
+
+    def __unicode__(self):
+        return u"\ufdd0%s\ufdd1" % self.name
+
+
+class ParamInstance(object):
+    """Stands in for a SolrFieldInstance in a query, for a Param."""
+    def __init__(self, field_name, name):
+        self.field_name = field_name
+        self.name = name
+        self.value = u"\ufdd0%s\ufdd2%s\ufdd1" % (name, field_name or u"")
+
+    def __eq__(self, other):
+        return isinstance(other, ParamInstance) and self.value == other.value
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.value)
+
+    def to_query(self):
+        return self.value
+
+
+class PreparedSearch(object):
+    """A SolrSearch with Params in place of some of its values, from
+    SolrInterface.prepare(). The search's parameters are worked out
+    once, when it's prepared, so binding values to it only has to
+    convert and escape each value and splice it in, without checking
+    and normalizing the query again.
+    """
+    def __init__(self, search):
+        if not isinstance(search, SolrSearch):
+            raise TypeError("Only a SolrSearch can be prepared")
+        self.search = search
+        self.schema = search.schema
+        # Each parameter is either its (utf-8) value, or a list which
+        # alternates literal pieces of the value with the slots to be
+        # filled in, which are keyed on (param name, field name, option).
+        self.template = []
+        self.converters = {}
+        for k, v in search.params():
+            parts = Param.marker_re.split(v.decode('utf-8'))
+            if len(parts) == 1:
+                self.template.append((k, v))
+                continue
+            pieces = []
+            for i in range(0, len(parts) - 1, 3):
+                literal, name, field_name = parts[i:i+3]
+                slot = (name, field_name, k if field_name is None else None)
+                if slot not in self.converters:
+                    self.converters[slot] = self.converter(k, field_name)
+                pieces += [literal.encode('utf-8'), slot]
+            pieces.append(parts[-1].encode('utf-8'))
+            self.template.append((k, pieces))
+        self.names = set(name for name, field_name, k in self.converters)
+
+    def converter(self, k, field_name):
+        if field_name is None:
+            if k == 'start':
+                return lambda v: param_value(PaginateOptions.check_start(int(v)))
+            elif k == 'rows':
+                return lambda v: param_value(PaginateOptions.check_rows(int(v)))
+            return param_value
+        if field_name:
+            field = self.schema.match_field(field_name)
+        else:
+            field = self.schema.default_field
+        return lambda v: field.instance_from_user_data(v).to_query().encode('utf-8')
+
+    def bind(self, **values):
+        """Return a BoundSearch with the values given for each Param."""
+        if set(values) != self.names:
+            unknown = set(values) - self.names
+            if unknown:
+                raise SolrError("No such Param in the prepared search: %s"
+                                % ", ".join(sorted(unknown)))
+            raise SolrError("No value given for Param: %s"
+                            % ", ".join(sorted(self.names - set(values))))
+        bound = dict((slot, convert(values[slot[0]]))
+                     for slot, convert in self.converters.items())
+        params = []
+        for k, pieces in self.template:
+            if not isinstance(pieces, str):
+                pieces = "".join(bound[p] if i % 2 else p for i, p in enumerate(pieces))
+            params.append((k, pieces))
+        return BoundSearch(self.search, params)
+
+
+class BoundSearch(object):
+    """A PreparedSearch with values bound to its Params."""
+    def __init__(self, search, params):
+        self.search = search
+        self.bound_params = params
+
+    def params(self):
+        return list(self.bound_params)
+
+    def execute(self, constructor=None, stream=False, lazy=False, columnar=False):
+        """Run the search, as SolrSearch.execute() does."""
+        search = self.search
+        if constructor is None:
+            constructor = search.result_constructor
+        result = search.interface.select(self.params(), stream=stream, lazy=lazy,
+                                         columnar=columnar)
+        if columnar:
+            return result
+        return search.transform_result(result, constructor)
+
+
 class Options(object):
     def clone(self):
         return self.__class__(self.schema, self)
@@ -774,7 +1396,8 @@ class FilterOptions(object):
         if original is None:
             self.filters = []
         else:
-            self.filters = [copy.copy(f) for f in original.filters]
+            # (frozen, so they can be shared)
+            self.filters = list(original.filters)
 
     def clone(self):
         return self.__class__(self.schema, self)
@@ -782,7 +1405,7 @@ class FilterOptions(object):
     def add(self, *args, **kwargs):
         fq_filter = LuceneQuery(self.schema)
         fq_filter.add(*args, **kwargs)
-        self.filters.append(fq_filter)
+        self.filters.append(fq_filter.freeze())
 
     def options(self):
         if self.filters:
@@ -1055,14 +1678,26 @@ class PaginateOptions(Options):
 
     def update(self, start, rows):
         if start is not None:
-            if start < 0:
-                raise SolrError("paginator start index must be 0 or greater")
+            if not isinstance(start, Param):
+                start = self.check_start(start)
             self.start = start
         if rows is not None:
-            if rows < 0:
-                raise SolrError("paginator rows must be 0 or greater")
+            if not isinstance(rows, Param):
+                rows = self.check_rows(rows)
             self.rows = rows
 
+    @staticmethod
+    def check_start(start):
+        if start < 0:
+            raise SolrError("paginator start index must be 0 or greater")
+        return start
+
+    @staticmethod
+    def check_rows(rows):
+        if rows < 0:
+            raise SolrError("paginator rows must be 0 or greater")
+        return rows
+
     def options(self):
         opts = {}
         if self.start is not None:
@@ -1101,6 +1736,37 @@ class SortOptions(Options):
                 raise SolrError("Cannot sort on an un-indexed field")
         self.fields.append([order, field])
 
+    def add_unique_key(self):
+        """Make sure the sort ends with the schema's unique key, if it
+        doesn't sort on it already, so that no two documents tie."""
+        unique_key = self.schema.unique_key
+        if not unique_key:
+            raise SolrError("Schema has no unique key to sort on")
+        if not any(field == unique_key for order, field in self.fields):
+            self.update(unique_key)
+
+    def reversible(self):
+        """Whether reverse() reverses the order of the results exactly.
+        The sort has to reach the unique key, so that no two documents
+        tie, and every field before it has to be in every document:
+        documents missing a field with sortMissingLast or
+        sortMissingFirst stay at the same end whichever way it's sorted.
+        """
+        unique_key = self.schema.unique_key
+        for order, field in self.fields:
+            if field == unique_key:
+                return True
+            if field != 'score':
+                f = self.schema.match_field(field)
+                if not f.required or f.sort_missing:
+                    return False
+        return False
+
+    def reverse(self):
+        """Reverse the direction of every field sorted on."""
+        self.fields = [["desc" if order == "asc" else "asc", field]
+                       for order, field in self.fields]
+
     def options(self):
         if self.fields:
             return {"sort":", ".join("%s %s" % (field, order) for order, field in self.fields)}
@@ -1151,10 +1817,11 @@ class FacetQueryOptions(Options):
         if original is None:
             self.queries = []
         else:
-            self.queries = [q.clone() for q in original.queries]
+            # (frozen, so they can be shared)
+            self.queries = list(original.queries)
 
     def update(self, query):
-        self.queries.append(query)
+        self.queries.append(query.freeze())
 
     def options(self):
         if self.queries:
@@ -1188,10 +1855,13 @@ def params_from_dict(**kwargs):
         if not hasattr(vs, "__iter__"):
             vs = [vs]
         for v in vs:
-            if isinstance(v, bool):
-                v = u"true" if v else u"false"
-            else:
-                v = unicode(v)
-            v = v.encode('utf-8')
-            utf8_params.append((k, v))
+            utf8_params.append((k, param_value(v)))
     return sorted(utf8_params)
+
+
+def param_value(v):
+    if isinstance(v, bool):
+        v = u"true" if v else u"false"
+    else:
+        v = unicode(v)
+    return v.encode('utf-8')
@@ -3,13 +3,16 @@ from __future__ import absolute_import
 from os import path
 from lxml import etree
 import cStringIO as StringIO
-from itertools import islice
 import shutil, tempfile, time, urllib, urlparse
 import warnings
 
+from .cache import ValidatedResponse
 from .http import ConnectionError, wrap_http_connection
-from .schema import SolrSchema, SolrError
-from .search import LuceneQuery, MltSolrSearch, SolrSearch, params_from_dict
+from .indexing import BufferedIndexer, BulkIndexer, RejectedDocumentsError, \
+    bisect_update, byte_grouper, grouper, make_byte_budget, serialized_grouper, \
+    solr_error_body
+from .schema import SolrJSONStreamingResponse, SolrSchema, SolrError
+from .search import LuceneQuery, MltSolrSearch, PreparedSearch, SolrSearch, params_from_dict
 
 MAX_LENGTH_GET_URL = 2048
 # Jetty default is 4096; Tomcat default is 8192; picking 2048 to be conservative.
@@ -17,7 +20,8 @@ MAX_LENGTH_GET_URL = 2048
 class SolrConnection(object):
     readable = True
     writeable = True
-    def __init__(self, url, http_connection, mode, retry_timeout, max_length_get_url, format):
+    def __init__(self, url, http_connection, mode, retry_timeout, max_length_get_url, format,
+                 cache=None, validator_cache=None):
         self.http_connection = wrap_http_connection(http_connection)
         if mode == 'r':
             self.writeable = False
@@ -25,11 +29,19 @@ class SolrConnection(object):
             self.readable = False
         self.url = url.rstrip("/") + "/"
         self.update_url = self.url + "update/"
+        self.update_json_url = self.url + "update/json"
+        self.update_javabin_url = self.url + "update/javabin"
         self.select_url = self.url + "select/"
+        self.export_url = self.url + "export"
         self.mlt_url = self.url + "mlt/"
         self.retry_timeout = retry_timeout
         self.max_length_get_url = max_length_get_url
         self.format = format
+        self.cache = cache
+        self.validator_cache = validator_cache
+        # Counts the updates sent, so that anything remembered from
+        # before one can be recognized as out of date.
+        self.generation = 0
 
     def request(self, *args, **kwargs):
         try:
@@ -55,20 +67,38 @@ class SolrConnection(object):
     def rollback(self):
         self.update("<rollback/>")
 
-    def update(self, update_doc, **kwargs):
+    update_content_types = {
+        'xml': "text/xml; charset=utf-8",
+        'json': "application/json; charset=utf-8",
+        'javabin': "application/javabin",
+    }
+
+    def update(self, update_doc, format='xml', **kwargs):
         if not self.writeable:
             raise TypeError("This Solr instance is only for reading")
         body = update_doc
         if body:
-            headers = {"Content-Type":"text/xml; charset=utf-8"}
+            headers = {"Content-Type":self.update_content_types[format]}
         else:
             headers = {}
-        url = self.url_for_update(**kwargs)
-        response = self.request('POST', url, data=body, headers=headers)
+        url = self.url_for_update(format=format, **kwargs)
+        try:
+            response = self.request('POST', url, data=body, headers=headers)
+        finally:
+            # Even a failed update may have changed the index.
+            self.generation += 1
+            if self.cache is not None:
+                self.cache.clear()
         if response.status_code != 200:
             raise SolrError(response)
 
-    def url_for_update(self, commit=None, commitWithin=None, softCommit=None, optimize=None, waitSearcher=None, expungeDeletes=None, maxSegments=None):
+    def url_for_update(self, format='xml', commit=None, commitWithin=None, softCommit=None, optimize=None, waitSearcher=None, expungeDeletes=None, maxSegments=None):
+        if format == 'json':
+            update_url = self.update_json_url
+        elif format == 'javabin':
+            update_url = self.update_javabin_url
+        else:
+            update_url = self.update_url
         extra_params = {}
         if commit is not None:
             extra_params['commit'] = "true" if commit else "false"
@@ -99,32 +129,96 @@ class SolrConnection(object):
         if 'maxSegments' in extra_params and 'optimize' not in extra_params:
             raise ValueError("Can't do maxSegments without optimize")
         if extra_params:
-            return "%s?%s" % (self.update_url, urllib.urlencode(sorted(extra_params.items())))
+            return "%s?%s" % (update_url, urllib.urlencode(sorted(extra_params.items())))
         else:
-            return self.update_url
-
-    def select(self, params):
+            return update_url
+
+    def select(self, params, stream=False, parse=None):
+        """Run a query, returning the body of Solr's response, or if
+        parse is given, the result of calling it on the body. With
+        stream=True, return a file-like object from which the response
+        can be read as it arrives instead. Unless streaming, the cache
+        (if there is one) is checked first."""
+        if self.format in ('json', 'javabin'):
+            params.append(('wt', self.format))
+        if stream:
+            return self.query(self.select_url, params, stream)
+        if self.cache is None:
+            return self.query(self.select_url, params, parse=parse)
+        # A cache may be shared between interfaces to different cores.
+        key = (self.select_url, tuple(params))
+        body = self.cache.get(key)
+        if body is None:
+            # If an update clears the cache while this is in flight, the
+            # response may be from before it, so isn't kept.
+            generation = self.cache.generation
+            body = self.query(self.select_url, params)
+            self.cache.put(key, body, generation)
+        return body if parse is None else parse(body)
+
+    def export(self, params):
+        """Run a query against the /export handler, returning a
+        file-like object from which its response, in JSON, can be read
+        as it arrives."""
+        return self.query(self.export_url, params + [('wt', 'json')], stream=True)
+
+    def query(self, base_url, params, stream=False, parse=None):
         if not self.readable:
             raise TypeError("This Solr instance is only for writing")
-        if self.format == 'json':
-            params.append(('wt', 'json'))
         qs = urllib.urlencode(params)
-        url = "%s?%s" % (self.select_url, qs)
+        url = "%s?%s" % (base_url, qs)
         if len(url) > self.max_length_get_url:
             warnings.warn("Long query URL encountered - POSTing instead of "
                 "GETting. This query will not be cached at the HTTP layer")
-            url = self.select_url
+            url = base_url
             method = 'POST'
             kwargs = {
                 'data': qs,
                 'headers': {"Content-Type": "application/x-www-form-urlencoded"}}
         else:
+            if not stream and self.validator_cache is not None:
+                return self.conditional_get(url, parse)
             method = 'GET'
             kwargs = {}
+        if stream:
+            kwargs['stream'] = True
         response = self.request(method, url, **kwargs)
         if response.status_code != 200:
             raise SolrError(response)
-        return response.content
+        if stream:
+            raw = response.raw
+            if hasattr(raw, 'decode_content'):
+                # have urllib3 undo any gzip encoding
+                raw.decode_content = True
+            return raw
+        return response.content if parse is None else parse(response.content)
+
+    def conditional_get(self, url, parse=None):
+        # Revalidate the response we last had for this url, if any,
+        # and reuse it if Solr says it's unchanged. A parsed response
+        # is kept pristine, and callers get copies of it.
+        entry = self.validator_cache.get(url)
+        headers = entry.conditional_headers() if entry is not None else {}
+        response = self.request('GET', url, headers=headers)
+        if response.status_code == 304 and entry is not None:
+            self.validator_cache.record(True)
+            if parse is None:
+                return entry.body
+            if entry.parsed is None:
+                entry.parsed = parse(entry.body)
+            return entry.parsed.copy()
+        if response.status_code != 200:
+            raise SolrError(response)
+        self.validator_cache.record(False)
+        body = response.content
+        parsed = None if parse is None else parse(body)
+        etag = response.headers.get('etag')
+        last_modified = response.headers.get('last-modified')
+        if etag is not None or last_modified is not None:
+            self.validator_cache.put(url, ValidatedResponse(body, etag, last_modified, parsed))
+            if parsed is not None:
+                parsed = parsed.copy()
+        return body if parse is None else parsed
 
     def mlt(self, params, content=None):
         """Perform a MoreLikeThis query using the content specified
@@ -155,15 +249,19 @@ class SolrConnection(object):
 
 
 class SolrInterface(object):
+    allowed_formats = ('xml', 'json', 'javabin')
 
     def __init__(self, url, schemadoc=None, http_connection=None, mode='', retry_timeout=-1,
-            max_length_get_url=MAX_LENGTH_GET_URL, format='xml'):
-        self.conn = SolrConnection(url, http_connection, mode, retry_timeout, max_length_get_url, format)
+            max_length_get_url=MAX_LENGTH_GET_URL, format='xml', cache=None,
+            validator_cache=None):
+        self.conn = SolrConnection(url, http_connection, mode, retry_timeout, max_length_get_url, format,
+                                   cache, validator_cache)
+        self.cache = cache
+        self.validator_cache = validator_cache
         self.schemadoc = schemadoc
-        allowed_formats = ('xml', 'json')
-        if format not in allowed_formats:
+        if format not in self.allowed_formats:
             raise ValueError("Unsupported format '%s': allowed are %s" %
-                    (format, ','.join(allowed_formats)))
+                    (format, ','.join(self.allowed_formats)))
         self.format = format
         self.file_cache = {}
         self.init_schema()
@@ -243,22 +341,86 @@ class SolrInterface(object):
             schemadoc = self.get_parsed_schema_file_with_xincludes('schema.xml')
         self.schema = SolrSchema(schemadoc, format=self.format)
 
-    def add(self, docs, chunk=100, **kwargs):
+    def add(self, docs, chunk=100, stream=False, format=None, workers=None,
+            max_bytes=None, adaptive=False, isolate_errors=False, **kwargs):
+        format = self.update_format(format)
         if hasattr(docs, "items") or not hasattr(docs, "__iter__"):
             docs = [docs]
+        if workers:
+            # keep several update requests in flight at once
+            with BulkIndexer(self, workers=workers, chunk=chunk, stream=stream,
+                             format=format, max_bytes=max_bytes, adaptive=adaptive,
+                             isolate_errors=isolate_errors, **kwargs) as indexer:
+                indexer.add(docs)
+            return
+        if isolate_errors and stream:
+            raise ValueError("isolate_errors can't be combined with streaming updates")
+        budget = make_byte_budget(max_bytes, adaptive, stream)
+        if budget is not None or isolate_errors:
+            self.add_serialized(docs, chunk, budget, isolate_errors, format, **kwargs)
+            return
         # to avoid making messages too large, we break the message every
         # chunk docs.
         for doc_chunk in grouper(docs, chunk):
-            update_message = self.schema.make_update(doc_chunk)
-            self.conn.update(str(update_message), **kwargs)
+            update_message = self.schema.make_update(doc_chunk, stream=stream, format=format)
+            if stream:
+                # the message is sent as it is serialized, one document
+                # at a time, rather than being built up as a string first.
+                self.conn.update(update_message, format=format, **kwargs)
+            else:
+                self.conn.update(str(update_message), format=format, **kwargs)
+
+    def add_serialized(self, docs, chunk, budget, isolate_errors, format, **kwargs):
+        # Documents are serialized individually and then joined into
+        # messages, so that they can be regrouped by size, or split up
+        # to find the ones Solr won't accept.
+        serializer = self.schema.update_serializer(format)
+        def send(serialized_docs):
+            update_message = serializer.join(serialized_docs)
+            start = time.time()
+            self.conn.update(update_message, format=format, **kwargs)
+            if budget is not None:
+                budget.observe(len(update_message), time.time() - start)
+        rejected = []
+        on_error = None
+        if isolate_errors:
+            on_error = lambda doc, e: rejected.append((doc, e, None))
+        if budget is not None:
+            chunks = byte_grouper(serializer, docs, budget, on_error)
+        else:
+            chunks = serialized_grouper(serializer, docs, chunk, on_error)
+        for doc_chunk, serialized_docs in chunks:
+            if isolate_errors:
+                rejected.extend((doc, e, solr_error_body(e)) for doc, e in
+                                bisect_update(send, doc_chunk, serialized_docs))
+            else:
+                send(serialized_docs)
+        if rejected:
+            raise RejectedDocumentsError(rejected)
 
-    def delete(self, docs=None, queries=None, **kwargs):
+    def delete(self, docs=None, queries=None, format=None, **kwargs):
+        format = self.update_format(format)
         if not docs and not queries:
             raise SolrError("No docs or query specified for deletion")
         elif docs is not None and (hasattr(docs, "items") or not hasattr(docs, "__iter__")):
             docs = [docs]
-        delete_message = self.schema.make_delete(docs, queries)
-        self.conn.update(str(delete_message), **kwargs)
+        delete_message = self.schema.make_delete(docs, queries, format=format)
+        self.conn.update(str(delete_message), format=format, **kwargs)
+
+    def buffered(self, max_docs=1000, max_bytes=None, max_age=1.0, format=None, **kwargs):
+        """Return a BufferedIndexer, which collects adds and deletes and
+        sends them to Solr in the background."""
+        return BufferedIndexer(self, max_docs=max_docs, max_bytes=max_bytes,
+                               max_age=max_age, format=format, **kwargs)
+
+    def update_format(self, format=None):
+        # Updates are sent in the interface's format unless overridden
+        if format is None:
+            return self.format
+        if format not in self.allowed_formats:
+            raise ValueError("Unsupported format '%s': allowed are %s" %
+                    (format, ','.join(self.allowed_formats)))
+        return format
 
     def commit(self, *args, **kwargs):
         self.conn.commit(*args, **kwargs)
@@ -274,8 +436,32 @@ class SolrInterface(object):
         self.delete(queries=self.Q(**{"*":"*"}))
 
     def search(self, **kwargs):
-        params = params_from_dict(**kwargs)
-        return self.schema.parse_response(self.conn.select(params))
+        return self.select(params_from_dict(**kwargs))
+
+    def select(self, params, stream=False, lazy=False, columnar=False):
+        """Run a query from a list of (name, value) parameters. With
+        stream=True, the response is parsed as it is read, and
+        result.docs is an iterator (see SolrStreamingResponse). With
+        lazy=True, the documents are LazyDocuments. With columnar=True,
+        the result is a SolrColumnarResult."""
+        if columnar and (stream or lazy):
+            raise ValueError("Columnar results can't be streamed or lazy")
+        if lazy and self.format == 'javabin':
+            # javabin values arrive already typed, so there'd be nothing
+            # left to put off converting.
+            raise ValueError("javabin results can't be lazy")
+        if stream:
+            return self.schema.parse_response_stream(self.conn.select(params, stream=True), lazy)
+        if lazy or columnar:
+            return self.schema.parse_response(self.conn.select(params), lazy, columnar)
+        # Eagerly parsed responses can be reused after a conditional GET
+        return self.conn.select(params, parse=self.schema.parse_response)
+
+    def export(self, params):
+        """Run a query from a list of (name, value) parameters against
+        Solr's /export handler, returning a SolrJSONStreamingResponse
+        whatever the interface's format."""
+        return SolrJSONStreamingResponse(self.schema, self.conn.export(params))
 
     def query(self, *args, **kwargs):
         q = SolrSearch(self)
@@ -284,6 +470,14 @@ class SolrInterface(object):
         else:
             return q
 
+    def prepare(self, search):
+        """Prepare a search with Params in place of some of its values,
+        returning a PreparedSearch. Its fields and options are checked
+        and its query normalized just once, here; each call to its
+        bind(**values) only converts, escapes and fills in the values.
+        """
+        return PreparedSearch(search)
+
     def mlt_search(self, content=None, **kwargs):
         params = params_from_dict(**kwargs)
         return self.schema.parse_response(self.conn.mlt(params, content=content))
@@ -310,12 +504,3 @@ class SolrInterface(object):
         q = LuceneQuery(self.schema)
         q.add(args, kwargs)
         return q
-
-
-def grouper(iterable, n):
-    "grouper('ABCDEFG', 3) --> [['ABC'], ['DEF'], ['G']]"
-    i = iter(iterable)
-    g = list(islice(i, 0, n))
-    while g:
-        yield g
-        g = list(islice(i, 0, n))
@@ -0,0 +1,94 @@
+from __future__ import absolute_import
+
+from .cache import CountCache, QueryCache
+
+from nose.tools import assert_equal
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 0
+    def __call__(self):
+        return self.now
+
+
+def test_lru_eviction():
+    cache = QueryCache(max_entries=2)
+    cache.put('a', 'A')
+    cache.put('b', 'B')
+    assert_equal(cache.get('a'), 'A')
+    cache.put('c', 'C')
+    # b was the least recently used
+    assert_equal(cache.get('b'), None)
+    assert_equal(cache.get('a'), 'A')
+    assert_equal(cache.get('c'), 'C')
+    assert_equal(cache.stats()['evictions'], 1)
+
+def test_byte_bound():
+    cache = QueryCache(max_bytes=10)
+    cache.put('a', 'x' * 4)
+    cache.put('b', 'x' * 4)
+    cache.put('c', 'x' * 4)
+    assert_equal(len(cache), 2)
+    assert_equal(cache.bytes, 8)
+    assert_equal(cache.get('a'), None)
+    # Too big to cache at all
+    cache.put('d', 'x' * 11)
+    assert_equal(cache.get('d'), None)
+    assert_equal(len(cache), 2)
+    # Replacing an entry doesn't count it twice
+    cache.put('b', 'x' * 6)
+    assert_equal(cache.bytes, 10)
+    assert_equal(len(cache), 2)
+
+def test_ttl():
+    clock = Clock()
+    cache = QueryCache(ttl=10, clock=clock)
+    cache.put('a', 'A')
+    clock.now = 9
+    assert_equal(cache.get('a'), 'A')
+    clock.now = 10
+    assert_equal(cache.get('a'), None)
+    assert_equal(len(cache), 0)
+    assert_equal(cache.bytes, 0)
+
+def test_stats():
+    cache = QueryCache()
+    cache.put('a', 'AAA')
+    cache.get('a')
+    cache.get('b')
+    cache.clear()
+    assert_equal(cache.get('a'), None)
+    assert_equal(cache.stats(), {'hits': 1, 'misses': 2, 'evictions': 0,
+                                 'invalidations': 1, 'entries': 0, 'bytes': 0})
+
+def test_generations():
+    cache = QueryCache()
+    generation = cache.generation
+    cache.put('a', 'A', generation)
+    assert_equal(cache.get('a'), 'A')
+    # A response read before the cache was cleared isn't stored after it
+    cache.clear()
+    cache.put('b', 'B', generation)
+    assert_equal(cache.get('b'), None)
+    cache.put('b', 'B', cache.generation)
+    assert_equal(cache.get('b'), 'B')
+
+def test_count_cache():
+    counts = CountCache(max_entries=2)
+    counts.put('a', 0, 1)
+    counts.put('b', 0, 2)
+    assert_equal(counts.get('a', 0), 1)
+    counts.put('c', 0, 3)
+    # b was the least recently used
+    assert_equal(counts.get('b', 0), None)
+    assert_equal(len(counts), 2)
+    # Counts are only good for their own generation, and those from
+    # earlier ones are dropped once a later one is put
+    assert_equal(counts.get('a', 1), None)
+    counts.put('a', 1, 4)
+    assert_equal(len(counts), 1)
+    assert_equal(counts.get('a', 1), 4)
+    counts.put('c', 0, 3)
+    assert_equal(counts.get('c', 0), None)
+    assert_equal(len(counts), 1)
@@ -0,0 +1,96 @@
+from __future__ import absolute_import
+
+import array, datetime
+
+from .columns import ColumnBuilder, numpy
+from .dates import utc
+from .schema import SolrSchema
+from .sunburnt import SolrInterface
+
+from .test_sunburnt import MockResponse, PaginationMockConnection, schema_string
+from .test_schema import json_streaming_response, streaming_response, good_schema
+
+from cStringIO import StringIO
+from nose.plugins.skip import SkipTest
+from nose.tools import assert_equal
+
+
+def build(rows, schema_text=schema_string):
+    builder = ColumnBuilder(SolrSchema(StringIO(schema_text)))
+    for row in rows:
+        builder.add_row(row.items())
+    return builder.finish()
+
+
+def test_typed_columns():
+    # Floats are kept at the precision they're read with, as in rows.
+    columns = build([{"int_field": 1, "float_field": 7.99, "string_field": u"a"},
+                     {"int_field": 2, "float_field": 2.5, "string_field": u"b"}])
+    assert_equal(list(columns["int_field"]), [1, 2])
+    assert_equal(list(columns["float_field"]), [7.99, 2.5])
+    assert_equal(columns["string_field"], [u"a", u"b"])
+    if numpy is None:
+        assert_equal(columns["int_field"], array.array('i', [1, 2]))
+        assert_equal(columns["float_field"], array.array('d', [7.99, 2.5]))
+    else:
+        assert_equal(columns["int_field"].dtype, numpy.int32)
+        assert_equal(columns["float_field"].dtype, numpy.float64)
+
+
+def test_irregular_columns():
+    # Missing values, and values typed arrays can't hold, turn the
+    # column into a list.
+    columns = build([{"int_field": 1, "long_field": 1, "sint_field": 1},
+                     {"int_field": 2, "sint_field": (1, 2)},
+                     {"int_field": 3, "long_field": 3, "double_field": 3.0},
+                     {"int_field": 4}])
+    assert_equal(list(columns["int_field"]), [1, 2, 3, 4])
+    assert_equal(columns["long_field"], [1, None, 3, None])
+    assert_equal(columns["sint_field"], [1, (1, 2), None, None])
+    assert_equal(columns["double_field"], [None, None, 3.0, None])
+
+
+def test_date_columns():
+    dates = [datetime.datetime(2012, 1, 1, tzinfo=utc), None]
+    columns = build([{"int_field": 1, "date_field": dates[0]}, {"int_field": 2}])
+    if numpy is None:
+        assert_equal(columns["date_field"], dates)
+    else:
+        assert_equal(columns["date_field"].dtype, numpy.dtype('datetime64[us]'))
+        assert_equal(columns["date_field"][0], numpy.datetime64('2012-01-01T00:00:00'))
+
+
+def test_numpy_conversion():
+    if numpy is None:
+        raise SkipTest("NumPy is not installed")
+    columns = build([{"long_field": 1 << 40, "double_field": 0.1}])
+    assert_equal(columns["long_field"].dtype, numpy.dtype('l'))
+    assert_equal(columns["long_field"][0], 1 << 40)
+    assert_equal(columns["double_field"][0], 0.1)
+
+
+def check_columnar_response(format, response_text):
+    s = SolrSchema(StringIO(good_schema), format=format)
+    rows = s.parse_response(response_text).result.docs
+    result = s.parse_response(response_text, columnar=True).result
+    assert_equal(result.numFound, 3)
+    assert_equal(list(result.columns["int_field"]), [1, 2, 3])
+    assert_equal(result.docs, rows)
+
+def test_columnar_responses():
+    yield check_columnar_response, 'xml', streaming_response
+    yield check_columnar_response, 'json', json_streaming_response
+
+
+def test_columnar_query():
+    si = SolrInterface("http://test.example.com/", http_connection=PaginationMockConnection())
+    response = si.query("*").execute(columnar=True)
+    assert_equal(list(response.result.columns["int_field"]), range(10))
+    assert_equal(response.result.columns["string_field"],
+                 [s for _, s in MockResponse.mock_doc_seeds])
+    try:
+        si.query("*").execute(columnar=True, stream=True)
+    except ValueError:
+        pass
+    else:
+        assert False
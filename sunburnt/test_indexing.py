@@ -0,0 +1,249 @@
+from __future__ import absolute_import
+
+from .indexing import AdaptiveByteBudget, BufferedIndexer, BulkIndexer, BulkIndexError, \
+    ByteBudget, RejectedDocumentsError, byte_grouper, grouper
+from .schema import SolrError
+from .sunburnt import SolrInterface
+
+from .test_sunburnt import MockConnection
+
+from nose.tools import assert_equal
+
+import time
+
+
+class UpdateMockConnection(MockConnection):
+    """Accepts updates, failing any which contain a poisoned document"""
+    poison = '<field name="text_field">poison</field>'
+
+    def _handle_request(self, uri_obj, params, method, body, headers):
+        if method == 'POST' and uri_obj.path.endswith('/update/'):
+            self.tracking_dict['attempts'] = self.tracking_dict.get('attempts', 0) + 1
+            if self.poison in body:
+                return self.MockStatus(400), 'bad document'
+            self.tracking_dict.setdefault('bodies', []).append(body)
+            return self.MockStatus(200), ''
+
+
+def make_docs(n, poisoned=()):
+    return [{"int_field":i, "string_field":"s",
+             "text_field":"poison" if i in poisoned else "text"}
+            for i in range(n)]
+
+
+def test_grouper():
+    assert_equal(list(grouper('ABCDEFG', 3)), [list('ABC'), list('DEF'), list('G')])
+    assert_equal(list(grouper([], 3)), [])
+
+
+def test_bulk_indexer_sends_every_chunk():
+    d = {}
+    si = SolrInterface("http://test.example.com/", http_connection=UpdateMockConnection(d))
+    with BulkIndexer(si, workers=3, chunk=2) as indexer:
+        indexer.add(make_docs(9))
+    bodies = d['bodies']
+    assert_equal(len(bodies), 5)
+    for i in range(9):
+        assert_equal(sum(body.count('<field name="int_field">%s</field>' % i)
+                         for body in bodies), 1)
+
+
+def test_add_with_workers():
+    d = {}
+    si = SolrInterface("http://test.example.com/", http_connection=UpdateMockConnection(d))
+    si.add(make_docs(10), chunk=3, workers=2)
+    assert_equal(len(d['bodies']), 4)
+
+
+def test_bulk_indexer_reports_failed_chunks_in_order():
+    d = {}
+    si = SolrInterface("http://test.example.com/", http_connection=UpdateMockConnection(d))
+    indexer = BulkIndexer(si, workers=4, chunk=2)
+    # chunks 1 and 3 fail on the server, chunk 4 can't be serialized
+    docs = make_docs(8, poisoned=(3, 6)) + [{"int_field":9}]
+    indexer.add(docs)
+    try:
+        indexer.close()
+    except BulkIndexError, e:
+        assert_equal([chunk_number for chunk_number, _, _ in e.errors], [1, 3, 4])
+        assert_equal([doc["int_field"] for doc in e.errors[0][1]], [2, 3])
+        assert isinstance(e.errors[2][2], SolrError)
+    else:
+        assert False
+    assert_equal(len(d['bodies']), 2)
+
+
+def test_bulk_indexer_refuses_adds_after_close():
+    si = SolrInterface("http://test.example.com/", http_connection=UpdateMockConnection())
+    indexer = BulkIndexer(si, workers=1)
+    indexer.close()
+    try:
+        indexer.add(make_docs(1))
+    except ValueError:
+        pass
+    else:
+        assert False
+
+
+def test_byte_grouper_respects_budget():
+    si = SolrInterface("http://test.example.com/", http_connection=UpdateMockConnection())
+    serializer = si.schema.update_serializer()
+    docs = make_docs(10)
+    doc_size = len(serializer.serialize_doc(docs[0]))
+    groups = list(byte_grouper(serializer, docs, ByteBudget(doc_size * 3)))
+    assert_equal([len(doc_chunk) for doc_chunk, _ in groups], [3, 3, 3, 1])
+    for doc_chunk, serialized_docs in groups:
+        assert_equal(str(serializer.join(serialized_docs)),
+                     str(si.schema.make_update(doc_chunk)))
+    # A document bigger than the budget goes on its own
+    groups = list(byte_grouper(serializer, docs[:2], ByteBudget(1)))
+    assert_equal([len(doc_chunk) for doc_chunk, _ in groups], [1, 1])
+
+
+def test_byte_grouper_reports_unserializable_docs():
+    si = SolrInterface("http://test.example.com/", http_connection=UpdateMockConnection())
+    serializer = si.schema.update_serializer()
+    errors = []
+    docs = make_docs(2) + [{"int_field":9}]
+    groups = list(byte_grouper(serializer, docs, ByteBudget(10000),
+                               lambda doc, e: errors.append(doc)))
+    assert_equal([len(doc_chunk) for doc_chunk, _ in groups], [2])
+    assert_equal(errors, [{"int_field":9}])
+
+
+def test_adaptive_byte_budget():
+    budget = AdaptiveByteBudget(8000)
+    assert_equal(budget.size, 1000)
+    # throughput holds up as requests grow, so keep growing up to the ceiling
+    for i in range(10):
+        budget.observe(budget.size, budget.size / 1000.0)
+    assert_equal(budget.size, 8000)
+    # Solr slows down, so back off
+    budget.observe(budget.size, budget.size / 100.0)
+    assert_equal(budget.size, 4000)
+    # and keep backing off while throughput keeps falling, down to the floor
+    for i in range(5):
+        budget.observe(budget.size, 10.0)
+    assert_equal(budget.size, budget.min_bytes)
+
+
+def test_add_with_max_bytes():
+    d = {}
+    si = SolrInterface("http://test.example.com/", http_connection=UpdateMockConnection(d))
+    doc_size = len(si.schema.update_serializer().serialize_doc(make_docs(1)[0]))
+    si.add(make_docs(10), max_bytes=doc_size * 4 + 20)
+    assert_equal(len(d['bodies']), 3)
+    d.clear()
+    si.add(make_docs(10), max_bytes=doc_size * 4 + 20, workers=2)
+    assert_equal(len(d['bodies']), 3)
+    for kwargs in ({"adaptive":True}, {"max_bytes":1000, "stream":True}):
+        try:
+            si.add(make_docs(1), **kwargs)
+        except ValueError:
+            pass
+        else:
+            assert False
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_buffered_last_write_wins():
+    d = {}
+    si = SolrInterface("http://test.example.com/", http_connection=UpdateMockConnection(d))
+    with si.buffered(max_docs=None, max_age=None) as buf:
+        assert isinstance(buf, BufferedIndexer)
+        buf.add(make_docs(3))
+        buf.delete(1)
+        buf.add({"int_field":0, "string_field":"s", "text_field":"changed"})
+        assert 'bodies' not in d
+    # Changes are sent in the order they were last made, with
+    # consecutive changes of the same kind sent together
+    bodies = d['bodies']
+    assert_equal(len(bodies), 3)
+    assert '<field name="int_field">2</field>' in bodies[0]
+    assert_equal(bodies[1], '<delete><id>1</id></delete>')
+    assert '<field name="text_field">changed</field>' in bodies[2]
+    assert_equal(sum(body.count('<doc>') for body in bodies), 2)
+
+
+def test_buffered_flushes_in_background():
+    d = {}
+    si = SolrInterface("http://test.example.com/", http_connection=UpdateMockConnection(d))
+    buf = si.buffered(max_docs=3, max_age=None, commitWithin=5000)
+    buf.add(make_docs(2))
+    assert 'bodies' not in d
+    buf.add(make_docs(3)[2])
+    assert wait_for(lambda: len(d.get('bodies', [])) == 1)
+    assert_equal(d['params']['commitWithin'], ['5000'])
+    buf.close()
+    assert_equal(len(d['bodies']), 1)
+    # and on age
+    buf = si.buffered(max_docs=None, max_age=0.05)
+    buf.add(make_docs(1))
+    assert wait_for(lambda: len(d['bodies']) == 2)
+    buf.close()
+
+
+def test_buffered_reports_errors():
+    si = SolrInterface("http://test.example.com/", http_connection=UpdateMockConnection())
+    buf = si.buffered(max_docs=None, max_age=None)
+    # Invalid documents are rejected straight away
+    try:
+        buf.add({"int_field":1})
+    except SolrError:
+        pass
+    else:
+        assert False
+    buf.add(make_docs(2, poisoned=(1,)))
+    try:
+        buf.flush()
+    except BulkIndexError, e:
+        assert_equal(len(e.errors), 1)
+        assert_equal(len(e.errors[0][1]), 2)
+    else:
+        assert False
+    buf.close()
+    try:
+        buf.add(make_docs(1))
+    except ValueError:
+        pass
+    else:
+        assert False
+
+
+def test_add_isolating_errors():
+    d = {}
+    si = SolrInterface("http://test.example.com/", http_connection=UpdateMockConnection(d))
+    docs = make_docs(16, poisoned=(3, 12)) + [{"int_field":99}]
+    try:
+        si.add(docs, chunk=8, isolate_errors=True)
+    except RejectedDocumentsError, e:
+        assert_equal([doc["int_field"] for doc, _, _ in e.rejected], [3, 12, 99])
+        assert_equal([body for _, _, body in e.rejected], ["bad document", "bad document", None])
+    else:
+        assert False
+    # everything else got indexed, once
+    for i in range(16):
+        if i not in (3, 12):
+            assert_equal(sum(body.count('<field name="int_field">%s</field>' % i)
+                             for body in d['bodies']), 1)
+    # each chunk of 8 with one bad document takes 1 + 2*log2(8) requests
+    assert_equal(d['attempts'], 14)
+
+
+def test_bulk_indexer_isolating_errors():
+    d = {}
+    si = SolrInterface("http://test.example.com/", http_connection=UpdateMockConnection(d))
+    try:
+        si.add(make_docs(16, poisoned=(3, 12)), chunk=8, workers=2, isolate_errors=True)
+    except BulkIndexError, e:
+        assert_equal([(chunk_number, [doc["int_field"] for doc in docs])
+                      for chunk_number, docs, _ in e.errors], [(0, [3]), (1, [12])])
+    else:
+        assert False
+    assert_equal(sum(body.count('<doc>') for body in d['bodies']), 14)
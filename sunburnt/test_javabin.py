@@ -0,0 +1,213 @@
+from __future__ import absolute_import
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from StringIO import StringIO
+
+import datetime, urlparse, uuid
+
+from .dates import utc
+from .javabin import dumps, loads, encode_input_doc, update_message, \
+    InputDocument, NamedList, SolrDocumentList
+from .schema import SolrResponse, SolrSchema
+from .sunburnt import SolrInterface
+
+from .test_sunburnt import MockConnection
+
+from nose.tools import assert_equal
+
+
+# Values with their encodings as written by Solr's JavaBinCodec
+known_encodings = [
+    (None, '\x00'),
+    (True, '\x01'),
+    (False, '\x02'),
+    (1, '\x41'),
+    (15, '\x5f\x00'),
+    (300, '\x5c\x12'),
+    (0, '\x06\x00\x00\x00\x00'),
+    (-1, '\x06\xff\xff\xff\xff'),
+    (1 << 40, '\x70\x80\x80\x80\x80\x80\x02'),
+    (-(1 << 40), '\x07\xff\xff\xff\x00\x00\x00\x00\x00'),
+    (1.5, '\x05?\xf8\x00\x00\x00\x00\x00\x00'),
+    (u"a", '\x21a'),
+    (u"\xe9", '\x22\xc3\xa9'),
+    (u"x" * 40, '\x3f\x09' + "x" * 40),
+    ([1, u"a"], '\x82\x41\x21a'),
+    (NamedList([(u"a", 1)]), '\xc1\x21a\x41'),
+    ({u"a": 1}, '\x0a\x01\x21a\x41'),
+    (bytearray("ab"), '\x0d\x02ab'),
+    (datetime.datetime(2012, 1, 1, tzinfo=utc), '\x09\x00\x00\x01\x34\x96\x90\xd0\x00'),
+]
+
+def check_known_encoding(value, encoding):
+    assert_equal(dumps(value), '\x02' + encoding)
+    decoded = loads('\x02' + encoding)
+    assert_equal(decoded, value)
+    assert_equal(type(decoded), type(value))
+
+def test_known_encodings():
+    for value, encoding in known_encodings:
+        yield check_known_encoding, value, encoding
+
+
+def test_decode_types_solr_writes():
+    # byte, short, long, float, iterators and externalized strings
+    assert_equal(loads('\x02\x03\xff'), -1)
+    assert_equal(loads('\x02\x04\x01\x00'), 256)
+    assert_equal(loads('\x02\x07\x00\x00\x00\x00\x00\x00\x00\x05'), 5)
+    # floats come back as the shortest equivalent double
+    assert_equal(loads('\x02\x08?\x8c\xcc\xcd'), 1.1)
+    assert_equal(loads('\x02\x0e\x41\x42\x0f'), [1, 2])
+    assert_equal(loads('\x02\x82\xe0\x21a\xe1'), [u"a", u"a"])
+
+
+def test_malformed_messages():
+    for msg in ('\x01\x00', '\x02\x25ab', '\x02\x82\x41', '\x02\x1f'):
+        try:
+            loads(msg)
+        except ValueError:
+            pass
+        else:
+            assert False, msg
+
+
+def test_document_list_round_trip():
+    docs = SolrDocumentList([{u"id": 1, u"name": [u"a", u"b"]}], 10, 5, 1.5)
+    decoded = loads(dumps(NamedList([(u"response", docs)])))[0][1]
+    assert_equal(list(decoded), list(docs))
+    assert_equal((decoded.numFound, decoded.start, decoded.maxScore), (10, 5, 1.5))
+
+
+def test_update_message():
+    doc = InputDocument([(u"id", u"1"), (u"name", [u"a", u"b"])])
+    msg = loads(update_message([encode_input_doc(doc)] * 2, delete_queries=[u"id:2"]))
+    assert_equal(msg, [(u"params", []), (u"delByQ", [u"id:2"]), (u"docs", [doc, doc])])
+
+
+class JavabinMockConnection(MockConnection):
+    def _handle_request(self, uri_obj, params, method, body, headers):
+        if method == 'POST' and uri_obj.path.endswith('/update/javabin'):
+            return self.MockStatus(200), ''
+        if method == 'GET' and uri_obj.path.endswith('/select/'):
+            docs = SolrDocumentList([{u"int_field": 1, u"string_field": [u"one"],
+                                      u"date_field": datetime.datetime(2012, 1, 1, tzinfo=utc),
+                                      u"score": 1.5}],
+                                    numFound=1, maxScore=1.5)
+            return self.MockStatus(200), dumps(NamedList([
+                (u"responseHeader", NamedList([(u"status", 0), (u"QTime", 1)])),
+                (u"response", docs),
+                (u"facet_counts", NamedList([
+                    (u"facet_queries", NamedList()),
+                    (u"facet_fields", NamedList([
+                        (u"string_field", NamedList([(u"one", 1)]))]))]))]))
+
+
+def test_javabin_interface():
+    d = {}
+    si = SolrInterface("http://test.example.com/",
+                       http_connection=JavabinMockConnection(d), format='javabin')
+    response = si.query(int_field=1).facet_by("string_field").execute()
+    assert_equal(d['params']['wt'], ['javabin'])
+    assert_equal(response.result.numFound, 1)
+    assert_equal(response.result.docs, [{"int_field": 1, "string_field": [u"one"],
+                                         "date_field": datetime.datetime(2012, 1, 1, tzinfo=utc),
+                                         "score": 1.5}])
+    assert_equal(response.facet_counts.facet_fields, {"string_field": [("one", 1)]})
+    # javabin documents are always converted as they're read
+    for stream in (False, True):
+        try:
+            si.query(int_field=1).execute(lazy=True, stream=stream)
+        except ValueError:
+            pass
+        else:
+            assert False
+
+    si.add({"int_field": 1, "text_field": "a", "string_field": ["b", "c"]}, commitWithin=1000)
+    assert_equal(urlparse.urlparse(d['url']).path, '/update/javabin')
+    assert_equal(d['params']['commitWithin'], ['1000'])
+    assert_equal(d['headers']['Content-Type'], "application/javabin")
+    params, docs = loads(d['body'])
+    assert_equal(sorted(docs[1][0]),
+                 [(u"int_field", u"1"), (u"string_field", [u"b", u"c"]), (u"text_field", u"a")])
+    si.delete(queries=si.Q(int_field=1))
+    assert_equal(loads(d['body']), [(u"params", []), (u"delByQ", [u"int_field:1"]), (u"docs", [])])
+
+
+typed_schema_string = \
+"""<schema name="typed" version="1.1">
+  <types>
+    <fieldType name="uuid" class="solr.UUIDField"/>
+    <fieldType name="string" class="solr.StrField"/>
+    <fieldType name="int" class="solr.TrieIntField"/>
+    <fieldType name="double" class="solr.TrieDoubleField"/>
+    <fieldType name="boolean" class="solr.BoolField"/>
+    <fieldType name="date" class="solr.TrieDateField"/>
+    <fieldType name="binary" class="solr.BinaryField"/>
+  </types>
+  <fields>
+    <field name="id" type="uuid"/>
+    <field name="name" type="string" multiValued="true"/>
+    <field name="count" type="int"/>
+    <field name="price" type="double"/>
+    <field name="in_stock" type="boolean"/>
+    <field name="added" type="date"/>
+    <field name="data" type="binary"/>
+  </fields>
+  <uniqueKey>id</uniqueKey>
+</schema>"""
+
+typed_doc = {
+    "id": uuid.UUID("12980286-591b-40c6-aa08-b4393f4c5dc2"),
+    "name": [u"a", u"b"],
+    "count": 3,
+    "price": 1.5,
+    "in_stock": True,
+    "added": datetime.datetime(2012, 1, 1, tzinfo=utc),
+    "data": "\x00\x01",
+    "score": 0.5,
+}
+
+typed_xml = """<response>
+<lst name="responseHeader"><int name="status">0</int><int name="QTime">1</int></lst>
+<result name="response" numFound="1" start="0"><doc>
+<str name="id">12980286-591b-40c6-aa08-b4393f4c5dc2</str>
+<arr name="name"><str>a</str><str>b</str></arr>
+<int name="count">3</int>
+<double name="price">1.5</double>
+<bool name="in_stock">true</bool>
+<date name="added">2012-01-01T00:00:00Z</date>
+<str name="data">AAE=</str>
+<float name="score">0.5</float>
+</doc></result></response>"""
+
+typed_json = """{"responseHeader": {"status": 0, "QTime": 1},
+"response": {"numFound": 1, "start": 0, "docs": [{
+"id": "12980286-591b-40c6-aa08-b4393f4c5dc2", "name": ["a", "b"],
+"count": 3, "price": 1.5, "in_stock": true, "added": "2012-01-01T00:00:00Z",
+"data": "AAE=", "score": 0.5}]}}"""
+
+typed_javabin = dumps(NamedList([
+    (u"responseHeader", NamedList([(u"status", 0), (u"QTime", 1)])),
+    (u"response", SolrDocumentList([{
+    u"id": u"12980286-591b-40c6-aa08-b4393f4c5dc2", u"name": [u"a", u"b"],
+    u"count": 3, u"price": 1.5, u"in_stock": True,
+    u"added": datetime.datetime(2012, 1, 1, tzinfo=utc),
+    u"data": bytearray("\x00\x01"), u"score": 0.5}], numFound=1))]))
+
+def check_typed_response(response):
+    doc, = response.result.docs
+    # (multiple values come in a tuple from XML, and a list otherwise)
+    doc["name"] = list(doc["name"])
+    assert_equal(doc, typed_doc)
+    for name, value in typed_doc.items():
+        assert_equal(type(doc[name]), type(value))
+
+def test_formats_decode_alike():
+    # The same document comes back with the same types over each format
+    schema = SolrSchema(StringIO(typed_schema_string))
+    for response in (SolrResponse.from_xml(schema, typed_xml),
+                     SolrResponse.from_json(schema, typed_json),
+                     SolrResponse.from_javabin(schema, typed_javabin)):
+        yield check_typed_response, response
@@ -0,0 +1,54 @@
+from __future__ import absolute_import
+
+import json
+from StringIO import StringIO
+
+from .jsonstream import JSONStreamReader
+
+from nose.tools import assert_equal
+
+
+document = {u"a": [1, 2.5, u"caf\xe9", None, True], u"b": {u"c": 12345678},
+            u"d": [], u"e": {}, u"f": u"x" * 100}
+
+def read_all(reader):
+    out = {}
+    for key in reader.iter_object():
+        if isinstance(document[key], list):
+            out[key] = list(reader.iter_array())
+        else:
+            out[key] = reader.read_value()
+    return out
+
+def check_chunk_size(text, chunk_size):
+    reader = JSONStreamReader(StringIO(text), chunk_size=chunk_size)
+    assert_equal(read_all(reader), document)
+    assert_equal(reader.peek(), '')
+
+def test_chunk_boundaries():
+    # Values split across reads, at every possible point
+    for text in (json.dumps(document), json.dumps(document, indent=2)):
+        for chunk_size in (1, 2, 3, 7, 64, 65536):
+            yield check_chunk_size, text, chunk_size
+
+
+def test_bounded_buffer():
+    docs = [{"id": i, "text": "x" * 50} for i in range(1000)]
+    reader = JSONStreamReader(StringIO(json.dumps(docs)), chunk_size=256)
+    longest = 0
+    for n, doc in enumerate(reader.iter_array()):
+        assert_equal(doc["id"], n)
+        longest = max(longest, len(reader.buf))
+    assert_equal(n, 999)
+    assert longest < 1024, longest
+
+
+def test_malformed_streams():
+    for text in ('{"a" 1}', '{"a": 1', '[1 2]', '{1: 2}', '{"a": [1, }'):
+        reader = JSONStreamReader(StringIO(text), chunk_size=2)
+        try:
+            read_all(reader) if text.startswith('{') else list(reader.iter_array())
+        except (ValueError, KeyError):
+            pass
+        else:
+            assert False, text
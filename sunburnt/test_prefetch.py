@@ -0,0 +1,130 @@
+from __future__ import absolute_import
+
+import threading, time
+
+from .prefetch import PagePrefetcher, merge_iterators
+
+from nose.tools import assert_equal
+
+
+class Fetcher(object):
+    def __init__(self, fail_on=None):
+        self.started = []
+        self.lock = threading.Lock()
+        self.fail_on = fail_on
+
+    def __call__(self, n):
+        with self.lock:
+            self.started.append(n)
+        if n == self.fail_on:
+            raise ValueError(n)
+        return n * 10
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_pages_in_order():
+    fetcher = Fetcher()
+    pages = list(PagePrefetcher(fetcher, [(n,) for n in range(20)], lookahead=3))
+    assert_equal(pages, [n * 10 for n in range(20)])
+    assert_equal(sorted(fetcher.started), range(20))
+
+
+def test_lookahead_is_bounded():
+    fetcher = Fetcher()
+    prefetcher = PagePrefetcher(fetcher, [(n,) for n in range(20)], lookahead=3)
+    wait_for(lambda: len(fetcher.started) == 3)
+    time.sleep(0.05)
+    assert_equal(sorted(fetcher.started), [0, 1, 2])
+    assert_equal(prefetcher.next(), 0)
+    wait_for(lambda: len(fetcher.started) == 4)
+    prefetcher.close()
+
+
+def test_close_cancels():
+    entered, release = threading.Event(), threading.Event()
+    fetcher = Fetcher()
+    def slow_fetch(n):
+        entered.set()
+        release.wait()
+        return fetcher(n)
+    # With one worker, page 0 is in flight when the prefetcher is
+    # closed and page 1 is waiting; page 1 is never fetched.
+    prefetcher = PagePrefetcher(slow_fetch, [(n,) for n in range(20)], lookahead=2, workers=1)
+    entered.wait(5)
+    prefetcher.close()
+    release.set()
+    wait_for(lambda: fetcher.started)
+    time.sleep(0.05)
+    assert_equal(fetcher.started, [0])
+    assert_equal(list(prefetcher), [])
+
+
+def test_errors_are_raised():
+    fetcher = Fetcher(fail_on=2)
+    prefetcher = PagePrefetcher(fetcher, [(n,) for n in range(20)], lookahead=2)
+    assert_equal([prefetcher.next(), prefetcher.next()], [0, 10])
+    try:
+        prefetcher.next()
+    except ValueError:
+        pass
+    else:
+        assert False
+    assert prefetcher.closed
+
+
+def test_merge_iterators():
+    merged = merge_iterators([iter(range(0, 50)), iter(range(50, 100)), iter([])], queue_size=5)
+    assert_equal(sorted(merged), range(100))
+
+
+def test_merge_iterators_errors():
+    def failing():
+        yield 1
+        raise ValueError("from the worker")
+    try:
+        list(merge_iterators([failing(), iter(range(10))]))
+    except ValueError, e:
+        assert_equal(e.args, ("from the worker",))
+    else:
+        assert False
+
+
+def test_dead_threads():
+    # Threads which exit without passing back an exception don't leave
+    # the caller waiting forever.
+    def exit(n):
+        raise SystemExit
+    def exiting():
+        exit(0)
+        yield
+    for iterator in [merge_iterators([exiting(), iter(range(10))]),
+                     PagePrefetcher(exit, [(0,)], workers=2)]:
+        try:
+            list(iterator)
+        except RuntimeError:
+            pass
+        else:
+            assert False
+
+
+def test_merge_iterators_close():
+    produced = []
+    def endless():
+        n = 0
+        while True:
+            produced.append(n)
+            yield n
+            n += 1
+    merged = merge_iterators([endless()], queue_size=2)
+    assert_equal(merged.next(), 0)
+    merged.close()
+    time.sleep(0.3)
+    count = len(produced)
+    time.sleep(0.2)
+    assert_equal(len(produced), count)
@@ -2,6 +2,7 @@ from __future__ import absolute_import
 
 import cStringIO as StringIO
 import datetime
+import json
 import uuid
 
 try:
@@ -11,7 +12,9 @@ except ImportError:
     HAS_MX_DATETIME = False
 import pytz
 
-from .schema import solr_date, SolrSchema, SolrError, SolrUpdate, SolrDelete
+from .schema import solr_date, SolrSchema, SolrError, SolrUpdate, SolrStreamingUpdate, SolrDelete, \
+    SolrJSONUpdate, SolrJSONDelete, LazyDocument, object_to_dict
+from . import json as sunburnt_json
 from .search import LuceneQuery
 
 debug = False
@@ -121,6 +124,32 @@ class TestReadingSchema(object):
                          ('boolean_field', True, u'true'),
                          ('location_field', 'POINT (30 10)', 'POINT (30 10)')):
             assert self.s.field_from_user_data(k, v).to_solr() == v2
+            assert self.s.field_serializer(k)(v) == v2
+
+    def test_field_serializers_are_reused(self):
+        assert self.s.field_serializer('int_field') is self.s.field_serializer('int_field')
+        try:
+            self.s.field_serializer('text_field2')
+        except SolrError:
+            pass
+        else:
+            assert False
+
+    def test_field_decoders(self):
+        for k, v, v2 in (('int_field', '1', 1),
+                         ('text_field', 'a', u'a'),
+                         ('boolean_field', 'true', True),
+                         ('score', '1.5', 1.5)):
+            decoder = self.s.field_decoder(k)
+            assert decoder(v) == v2
+            assert type(decoder(v)) == type(v2)
+            assert self.s.field_decoder(k) is decoder
+        try:
+            self.s.field_decoder('text_field2')
+        except SolrError:
+            pass
+        else:
+            assert False
 
     def test_missing_fields(self):
         assert set(self.s.missing_fields([])) \
@@ -128,6 +157,7 @@ class TestReadingSchema(object):
         assert set(self.s.missing_fields(['boolean_field'])) \
             == set(['int_field', 'text_field'])
         assert set(self.s.missing_fields(['int_field'])) == set(['text_field'])
+        assert self.s.missing_fields({'int_field':1, 'text_field':'a'}) == []
 
     def test_serialize_value_list_fails_with_bad_field_name(self):
         try:
@@ -318,6 +348,97 @@ def test_update_serialization():
     for obj, xml_string in update_docs:
         yield check_update_serialization, s, obj, xml_string
 
+dynamic_schema = \
+"""<schema name="timetric" version="1.1">
+  <types>
+    <fieldType name="string" class="solr.StrField" sortMissingLast="true" omitNorms="true"/>
+    <fieldType name="sint" class="solr.SortableIntField" sortMissingLast="true" omitNorms="true"/>
+  </types>
+  <fields>
+    <field name="int_field" required="true" type="sint"/>
+    <dynamicField name="*_t" type="string"/>
+  </fields>
+  <uniqueKey>int_field</uniqueKey>
+ </schema>
+"""
+
+class Planned(object):
+    int_field = 1
+    title_t = "a"
+
+    def author_t(self):
+        return "b"
+
+
+class PerInstance(Planned):
+    sunburnt_cache_attributes = False
+
+
+class ComputedAttributes(object):
+    def __getattr__(self, name):
+        if name in ("int_field", "title_t"):
+            return name
+        raise AttributeError(name)
+
+
+def test_attribute_plans():
+    s = SolrSchema(StringIO.StringIO(dynamic_schema))
+    plan = s.attribute_plan(Planned)
+    assert plan[0] == ('author_t', 'int_field', 'title_t')
+    assert s.attribute_plan(Planned) is plan
+    # attributes set on instances are found as well as the class's
+    o = Planned()
+    o.subtitle_t = "c"
+    assert object_to_dict(o, s) == \
+        {"int_field":1, "title_t":"a", "author_t":"b", "subtitle_t":"c"}
+    assert object_to_dict(Planned(), s) == \
+        {"int_field":1, "title_t":"a", "author_t":"b"}
+    assert s.attribute_plan(PerInstance) is None
+    assert s.attribute_plan(ComputedAttributes) is None
+    assert object_to_dict(ComputedAttributes(), s) == {"int_field":"int_field"}
+    # misses are remembered too
+    assert s.match_dynamic_field("__class__") is None
+    assert "__class__" in s.dynamic_field_cache
+
+def check_streaming_update_serialization(s, obj, xml_string):
+    update = SolrStreamingUpdate(s, obj)
+    assert str(update) == xml_string
+    # A streamed message can be serialized more than once (eg on retry)
+    assert ''.join(update) == xml_string
+
+def test_streaming_update_serialization():
+    s = SolrSchema(StringIO.StringIO(good_schema))
+    for obj, xml_string in update_docs:
+        yield check_streaming_update_serialization, s, obj, xml_string
+
+def test_streaming_update_yields_per_document():
+    s = SolrSchema(StringIO.StringIO(good_schema))
+    docs = [{"int_field":i, "text_field":"a"} for i in range(3)]
+    chunks = list(SolrStreamingUpdate(s, docs))
+    assert chunks[0] == "<add>"
+    assert chunks[-1] == "</add>"
+    assert len(chunks) == 5
+
+json_update_docs = [
+    ({"int_field":1, "text_field":"a"},
+     [{"int_field":"1", "text_field":"a"}]),
+    ({"int_field":1, "text_field":["a", "b"]},
+     [{"int_field":"1", "text_field":["a", "b"]}]),
+    ([D(1, "a"), {"int_field":2, "text_field":"b", "boolean_field":False}],
+     [{"int_field":"1", "text_field":"a"},
+      {"int_field":"2", "text_field":"b", "boolean_field":"false"}]),
+    (D_with_callables(1, "a b", True),
+     [{"int_field":"1", "text_field":"a b"}]),
+    ]
+
+def check_json_update_serialization(s, obj, json_docs):
+    assert json.loads(str(SolrJSONUpdate(s, obj))) == json_docs
+
+def test_json_update_serialization():
+    s = SolrSchema(StringIO.StringIO(good_schema))
+    for obj, json_docs in json_update_docs:
+        yield check_json_update_serialization, s, obj, json_docs
+
 bad_updates = [
     # Dictionary containing bad field name
     {"int_field":1, "text_field":"a", "my_arse":True},
@@ -328,17 +449,31 @@ bad_updates = [
     ]
 
 def check_broken_updates(s, obj):
+    for update_class in (SolrUpdate, SolrJSONUpdate):
+        try:
+            update_class(s, obj)
+        except SolrError:
+            pass
+        else:
+            assert False
+
+def test_bad_updates():
+    s = SolrSchema(StringIO.StringIO(good_schema))
+    for obj in bad_updates:
+        yield check_broken_updates, s, obj
+
+def check_broken_streaming_updates(s, obj):
     try:
-        SolrUpdate(s, obj)
+        str(SolrStreamingUpdate(s, obj))
     except SolrError:
         pass
     else:
         assert False
 
-def test_bad_updates():
+def test_bad_streaming_updates():
     s = SolrSchema(StringIO.StringIO(good_schema))
     for obj in bad_updates:
-        yield check_broken_updates, s, obj
+        yield check_broken_streaming_updates, s, obj
 
 
 delete_docs = [
@@ -380,6 +515,26 @@ def test_delete_docs():
         yield check_delete_docs, s, doc, xml_string
 
 
+json_delete_docs = [
+    ("1",
+     """{"delete":{"id": "1"}}"""),
+    (["0", {"int_field":1, "text_field":"a"}, D(2, "b"), 3],
+     """{"delete":{"id": "0"},"delete":{"id": "1"},"delete":{"id": "2"},"delete":{"id": "3"}}"""),
+    ]
+
+def check_json_delete_docs(s, doc, json_string):
+    assert str(SolrJSONDelete(s, docs=doc)) == json_string
+
+def test_json_delete_docs():
+    s = SolrSchema(StringIO.StringIO(good_schema))
+    for doc, json_string in json_delete_docs:
+        yield check_json_delete_docs, s, doc, json_string
+
+def test_json_delete_queries():
+    s = SolrSchema(StringIO.StringIO(good_schema))
+    delete = SolrJSONDelete(s, docs=[1], queries=[s.Q("search1"), s.Q(int_field=3)])
+    assert str(delete) == """{"delete":{"id": "1"},"delete":{"query": "search1"},"delete":{"query": "int_field:3"}}"""
+
 delete_queries = [
     ([(["search"], {})],
      """<delete><query>search</query></delete>"""),
@@ -481,3 +636,124 @@ def test_uuid_data_understood_ok():
     solr_data = "12980286-591b-40c6-aa08-b4393a6d13b3"
     uuid_field = s.match_field("id")
     assert uuid_field.from_solr(solr_data) == uuid.UUID("12980286-591b-40c6-aa08-b4393a6d13b3")
+    # and in JSON results, where plain strings are left alone
+    assert s.parse_result_doc_json({u"id": solr_data}) == \
+        {u"id": uuid.UUID("12980286-591b-40c6-aa08-b4393a6d13b3")}
+
+
+streaming_response = """<?xml version="1.0" encoding="UTF-8"?>
+<response>
+<lst name="responseHeader"><int name="status">0</int><int name="QTime">1</int></lst>
+<result name="response" numFound="3" start="0">
+<doc><int name="int_field">1</int><arr name="text_field"><str>one</str></arr></doc>
+<doc><int name="int_field">2</int><arr name="text_field"><str>two</str></arr></doc>
+<doc><int name="int_field">3</int><arr name="text_field"><str>three</str></arr></doc>
+</result>
+<lst name="facet_counts">
+<lst name="facet_queries"/>
+<lst name="facet_fields"><lst name="text_field"><int name="one">1</int></lst></lst>
+</lst>
+</response>"""
+
+def test_streaming_response():
+    s = SolrSchema(StringIO.StringIO(good_schema))
+    response = s.parse_response_stream(StringIO.StringIO(streaming_response))
+    assert response.QTime == 1
+    assert response.result.numFound == 3
+    assert response.result.docs.next() == {"int_field": 1, "text_field": (u"one",)}
+    # Reading the facets reads the rest of the response, keeping the
+    # remaining documents for the iterator.
+    assert response.facet_counts.facet_fields == {"text_field": [("one", 1)]}
+    assert [d["int_field"] for d in response] == [2, 3]
+    assert list(response) == []
+
+def test_streaming_response_matches_parsed_response():
+    s = SolrSchema(StringIO.StringIO(good_schema))
+    response = s.parse_response(streaming_response)
+    streamed = s.parse_response_stream(StringIO.StringIO(streaming_response))
+    assert list(streamed) == response.result.docs
+    assert streamed.facet_counts.facet_fields == response.facet_counts.facet_fields
+    assert streamed.highlighting == response.highlighting == {}
+
+def test_streaming_response_error():
+    s = SolrSchema(StringIO.StringIO(good_schema))
+    msg = streaming_response.replace('<int name="status">0</int>', '<int name="status">1</int>')
+    try:
+        s.parse_response_stream(StringIO.StringIO(msg))
+    except ValueError:
+        pass
+    else:
+        assert False
+
+
+def test_lazy_documents():
+    s = SolrSchema(StringIO.StringIO(good_schema))
+    response = s.parse_response(streaming_response)
+    lazy_response = s.parse_response(streaming_response, lazy=True)
+    doc = lazy_response.result.docs[0]
+    assert isinstance(doc, LazyDocument)
+    assert doc.unconverted == set(["int_field", "text_field"])
+    assert doc["int_field"] == 1
+    assert doc.unconverted == set(["text_field"])
+    assert "boolean_field" not in doc
+    assert doc.get("boolean_field") is None
+    assert lazy_response.result.docs == response.result.docs
+    assert dict(lazy_response.result.docs[1]) == response.result.docs[1]
+    doc["boolean_field"] = True
+    del doc["int_field"]
+    assert doc == {"text_field": (u"one",), "boolean_field": True}
+    assert sunburnt_json.loads(sunburnt_json.dumps(lazy_response)) == \
+        [{"text_field": ["one"], "boolean_field": True}] + \
+        sunburnt_json.loads(sunburnt_json.dumps(response))[1:]
+
+def test_lazy_documents_check_field_names():
+    s = SolrSchema(StringIO.StringIO(good_schema))
+    try:
+        s.parse_response(streaming_response.replace("int_field", "no_field"), lazy=True)
+    except SolrError:
+        pass
+    else:
+        assert False
+
+
+json_streaming_response = """{
+"responseHeader":{"status":0,"QTime":1},
+"response":{"numFound":3,"start":0,"docs":[
+  {"int_field":1,"text_field":["one"]},
+  {"int_field":2,"text_field":["two"]},
+  {"int_field":3,"text_field":["three"]}]
+},
+"facet_counts":{"facet_queries":{},"facet_fields":{"text_field":["one",1]}},
+"highlighting":{"1":{"text_field":["<em>one</em>"]}}}"""
+
+def test_json_streaming_response():
+    s = SolrSchema(StringIO.StringIO(good_schema), format='json')
+    response = s.parse_response(json_streaming_response)
+    streamed = s.parse_response_stream(StringIO.StringIO(json_streaming_response))
+    assert streamed.QTime == 1
+    assert streamed.result.numFound == 3
+    assert streamed.result.docs.next() == response.result.docs[0]
+    assert streamed.facet_counts.facet_fields == {"text_field": [("one", 1)]}
+    assert streamed.highlighting == response.highlighting
+    assert list(streamed) == response.result.docs[1:]
+
+def test_json_streaming_response_error():
+    s = SolrSchema(StringIO.StringIO(good_schema), format='json')
+    msg = json_streaming_response.replace('"status":0', '"status":1')
+    try:
+        s.parse_response_stream(StringIO.StringIO(msg))
+    except ValueError:
+        pass
+    else:
+        assert False
+
+def test_lazy_json_documents():
+    s = SolrSchema(StringIO.StringIO(good_schema), format='json')
+    response = s.parse_response(json_streaming_response)
+    lazy_response = s.parse_response(json_streaming_response, lazy=True)
+    doc = lazy_response.result.docs[0]
+    # strings are already as they should be
+    assert doc.unconverted == set(["int_field"])
+    assert lazy_response.result.docs == response.result.docs
+    streamed = s.parse_response_stream(StringIO.StringIO(json_streaming_response), lazy=True)
+    assert [d["int_field"] for d in streamed] == [1, 2, 3]
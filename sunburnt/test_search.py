@@ -5,7 +5,7 @@ try:
 except ImportError:
     from StringIO import StringIO
 
-import datetime
+import datetime, operator
 
 from lxml.builder import E
 from lxml.etree import tostring
@@ -16,7 +16,7 @@ except ImportError:
     HAS_MX_DATETIME = False
 
 from .schema import solr_date, SolrSchema, SolrError
-from .search import SolrSearch, MltSolrSearch, PaginateOptions, SortOptions, FieldLimitOptions, \
+from .search import SolrSearch, MltSolrSearch, Param, PreparedSearch, PaginateOptions, SortOptions, FieldLimitOptions, \
                     FacetOptions, FacetRangeOptions, HighlightOptions, MoreLikeThisOptions, params_from_dict
 from .strings import RawString
 from .sunburnt import SolrInterface
@@ -558,6 +558,162 @@ def test_complex_boolean_queries():
         yield check_complex_boolean_query, solr_search, query, output
 
 
+# How queries are written once normalized, pinned. Boosting a query
+# rewrites it around its normal form, and its subqueries keep theirs: up
+# to 0.6, the rewrite normalized them again, which could hoist a cancelled
+# double negative that the first pass left alone (the NOT query below was
+# written "(*:* AND NOT int_field:3 AND text_field:a AND text_field:c)").
+normalized_queries = (
+    (lambda q: q.query(~~q.Q(int_field=3) & q.Q(text_field="a")),
+     [('q', u'text_field:a AND int_field:3')]),
+    (lambda q: q.query(q.Q(text_field="e") & (~~q.Q(int_field=3) & q.Q(text_field="a"))).boost_relevancy(2, text_field="b"),
+     [('q', u'(int_field:3 AND text_field:a AND text_field:e) OR (int_field:3 AND text_field:a AND text_field:e AND text_field:b^2)')]),
+    (lambda q: q.query(~((~~q.Q(int_field=3) & q.Q(text_field="a")) & q.Q(text_field="c"))).boost_relevancy(2, text_field="b"),
+     [('q', u'((*:* AND NOT text_field:a AND text_field:c AND int_field:3)) OR ((*:* AND NOT text_field:a AND text_field:c AND int_field:3) AND text_field:b^2)')]),
+    (lambda q: q.query(~~(q.Q(text_field="b") & q.Q(text_field="b")) ** 0.5).boost_relevancy(2, text_field="a"),
+     [('q', u'(text_field:b AND text_field:b)^0.5 OR ((text_field:b AND text_field:b)^0.5 AND text_field:a^2)')]),
+    (lambda q: q.query(~~(q.Q(text_field="d") | q.Q(text_field="e"))).boost_relevancy(2, text_field="a"),
+     [('q', u'text_field:d OR text_field:e OR ((text_field:d OR text_field:e) AND text_field:a^2)')]),
+    (lambda q: q.query((q.Q(text_field="a") | q.Q(text_field="b")) & (q.Q(text_field="a") | q.Q(text_field="b"))),
+     [('q', u'(text_field:a OR text_field:b) AND (text_field:a OR text_field:b)')]),
+)
+
+def test_normalized_queries():
+    solr_search = SolrSearch(interface)
+    for query, output in normalized_queries:
+        yield check_complex_boolean_query, solr_search, query, output
+
+
+def test_clone_independence():
+    # Extending a search doesn't change the one it was made from
+    base = SolrSearch(interface).query(text_field="a").filter(text_field="b")
+    extended = base.query(text_field="c").filter(text_field="d")
+    check_equal_with_debug(base.params(),
+                           [('fq', u'text_field:b'), ('q', u'text_field:a')])
+    check_equal_with_debug(extended.params(),
+                           [('fq', u'text_field:b'), ('fq', u'text_field:d'),
+                            ('q', u'text_field:a AND text_field:c')])
+
+def test_frozen_queries():
+    solr_search = SolrSearch(interface)
+    q1 = solr_search.Q("blah") | solr_search.Q(int_field=3)
+    q2 = q1.clone()
+    frozen = q1.freeze()
+    # The same structure gives the same frozen query
+    assert q2.freeze() is frozen
+    assert (q1 & q2).subqueries[0] is (q2 & q1).subqueries[0]
+    # which remembers its normalized form and serialization
+    normal, changed = frozen.normalize()
+    assert not changed
+    assert normal is frozen
+    assert_equal(unicode(q1), u'blah OR int_field:3')
+    assert_equal(frozen.strings, {(0, None): u'blah OR int_field:3'})
+    # Frozen queries can't be changed
+    try:
+        frozen.add(["more"], {})
+    except TypeError:
+        pass
+    else:
+        assert False
+    # but the query they were frozen from can, without changing them,
+    # or the queries they're part of.
+    combined = ~q1
+    q1.add(["more"], {})
+    assert q1.freeze() is not frozen
+    assert_equal(unicode(q1), u'more OR blah OR int_field:3')
+    assert_equal(unicode(frozen), u'blah OR int_field:3')
+    assert_equal(unicode(combined), u'NOT (blah OR int_field:3)')
+
+def test_repeated_clauses():
+    # Clauses built separately are kept, even when they're written the
+    # same way, as they always have been; the same clause combined with
+    # itself is written once.
+    solr_search = SolrSearch(interface)
+    q = solr_search.Q(text_field="d")
+    for query, output in [
+            (solr_search.Q(text_field="d") & solr_search.Q(text_field="d"),
+             u'text_field:d AND text_field:d'),
+            (solr_search.Q(text_field="d") | solr_search.Q(text_field="d"),
+             u'text_field:d OR text_field:d'),
+            (solr_search.Q(int_field=1, text_field="a") & solr_search.Q(int_field=1, text_field="a"),
+             u'int_field:1 AND int_field:1 AND text_field:a AND text_field:a'),
+            (q & q, u'text_field:d'),
+            (q & q.clone(), u'text_field:d'),
+            ]:
+        yield check_equal_with_debug, unicode(query), output
+    assert solr_search.Q(text_field="d").freeze() is not q.freeze()
+
+
+def test_normalize_long_queries():
+    solr_search = SolrSearch(interface)
+    clauses = [solr_search.Q(int_field=i) for i in range(500)]
+    q = reduce(operator.or_, clauses)
+    assert_equal(unicode(q), u" OR ".join(u"int_field:%d" % i for i in range(500)))
+    # Shared subqueries, double negatives, and ANDs within ANDs
+    shared = solr_search.Q("a") | solr_search.Q("b")
+    q = (shared & (solr_search.Q("c") & shared)) & solr_search.Q("d")
+    assert_equal(unicode(q), u"c AND d AND (a OR b) AND (a OR b)")
+    normal, changed = q.normalize()
+    assert changed
+    assert normal.subqueries[0] is normal.subqueries[1] is shared.freeze()
+    assert_equal(unicode(~~shared & solr_search.Q("c")), u"c AND (a OR b)")
+
+
+prepared_search_data = (
+    (lambda s: s.query(text_field=Param("t")),
+     {"t": "hello world"},
+     lambda s: s.query(text_field="hello world")),
+    (lambda s: s.query(Param("t")).filter(text_field="fixed"),
+     {"t": "AND"},
+     lambda s: s.query("AND").filter(text_field="fixed")),
+    (lambda s: s.query(s.Q(string_field=Param("a")) | s.Q(string_field=Param("b"))),
+     {"a": "a:b", "b": "c*"},
+     lambda s: s.query(s.Q(string_field="a:b") | s.Q(string_field="c*"))),
+    (lambda s: s.query(int_field__range=(Param("lo"), Param("hi"))).filter(date_field__lt=Param("d")),
+     {"lo": 3, "hi": 7, "d": datetime.datetime(2009, 1, 1)},
+     lambda s: s.query(int_field__range=(3, 7)).filter(date_field__lt=datetime.datetime(2009, 1, 1))),
+    (lambda s: s.exclude(int_field=Param("n")).facet_query(int_field__gt=Param("n")),
+     {"n": "5"},
+     lambda s: s.exclude(int_field=5).facet_query(int_field__gt=5)),
+    (lambda s: s.query(text_field="a").boost_relevancy(4, int_field=Param("n")),
+     {"n": 5},
+     lambda s: s.query(text_field="a").boost_relevancy(4, int_field=5)),
+    (lambda s: s.paginate(start=Param("start"), rows=Param("rows")).add_extra(defType=Param("t")),
+     {"start": 20, "rows": 10, "t": "edismax"},
+     lambda s: s.paginate(start=20, rows=10).add_extra(defType="edismax")),
+)
+
+def check_prepared_search(prepare, values, search):
+    solr_search = SolrSearch(interface)
+    prepared = PreparedSearch(prepare(solr_search))
+    check_equal_with_debug(prepared.bind(**values).params(), search(solr_search).params())
+
+def test_prepared_search():
+    for prepare, values, search in prepared_search_data:
+        yield check_prepared_search, prepare, values, search
+
+bad_bind_data = (
+    {"n": 1},
+    {"n": 1, "rows": 10, "other": 2},
+    {"n": 1, "rows": -1},
+    {"n": "one", "rows": 10},
+)
+
+def check_bad_bind(values):
+    solr_search = SolrSearch(interface)
+    prepared = PreparedSearch(solr_search.query(int_field=Param("n")).paginate(rows=Param("rows")))
+    try:
+        prepared.bind(**values)
+    except (SolrError, ValueError):
+        pass
+    else:
+        assert False
+
+def test_bad_bind():
+    for values in bad_bind_data:
+        yield check_bad_bind, values
+
+
 param_encode_data = (
     ({"int":3, "string":"string", "unicode":u"unicode"},
      [("int", "3"), ("string", "string"), ("unicode", "unicode")]),
@@ -639,6 +795,22 @@ def test_transform_result():
     for highlighting, constructor, solr_highlights in solr_highlights_data:
         yield check_transform_results, highlighting, constructor, solr_highlights
 
+def test_streaming_highlighting():
+    q = highlighting_interface.query('zero').highlight('string_field')
+    docs = list(q.execute(stream=True))
+    assert_equal(docs[0]['solr_highlights'], {'string_field': ['zero']})
+
+def test_lazy_highlighting():
+    q = highlighting_interface.query('zero').highlight('string_field')
+    docs = q.execute(lazy=True).result.docs
+    assert_equal(docs[0]['solr_highlights'], {'string_field': ['zero']})
+
+def test_prepared_execute():
+    prepared = highlighting_interface.prepare(
+        highlighting_interface.query(Param("q")).highlight('string_field'))
+    docs = prepared.bind(q="zero").execute().result.docs
+    assert_equal(docs[0]['solr_highlights'], {'string_field': ['zero']})
+
 #Test More Like This results
 class MltMockResponse(MockResponse):
 
@@ -5,11 +5,13 @@ try:
 except ImportError:
     from StringIO import StringIO
 
-import cgi, datetime, urlparse
+import cgi, datetime, json, re, urlparse
 
 from lxml.builder import E
-from lxml.etree import tostring
+from lxml.etree import fromstring, tostring
 
+from .cache import QueryCache, ValidatorCache
+from .schema import SolrError
 from .sunburnt import SolrInterface
 
 from nose.tools import assert_equal, assert_in
@@ -36,7 +38,7 @@ schema_string = \
     <field name="string_field" required="true" type="string" multiValued="true"/>
     <field name="text_field" required="true" type="text"/>
     <field name="boolean_field" required="false" type="boolean"/>
-    <field name="int_field" required="true" type="int"/>
+    <field name="int_field" required="true" type="int" docValues="true"/>
     <field name="sint_field" type="sint"/>
     <field name="long_field" type="long"/>
     <field name="slong_field" type="slong"/>
@@ -251,6 +253,326 @@ def test_index_pagination():
             yield check_index_pagination, p_args, a, s, e
 
 
+class CountingPaginationMockConnection(PaginationMockConnection):
+    def _handle_request(self, uri_obj, params, method, body, headers):
+        self.tracking_dict.setdefault('requests', []).append(
+            (int(params.get("start", [0])[0]), int(params.get("rows", [10])[0])))
+        return super(CountingPaginationMockConnection, self)._handle_request(
+            uri_obj, params, method, body, headers)
+
+
+class SortingMockConnection(CountingPaginationMockConnection):
+    """Serves the mock docs in ascending or descending int_field order."""
+    def _handle_request(self, uri_obj, params, method, body, headers):
+        sort = params.get("sort", ["int_field asc"])[0]
+        response = super(SortingMockConnection, self)._handle_request(
+            uri_obj, params, method, body, headers)
+        if sort == "int_field desc":
+            status, content = response
+            start = int(params.get("start", [0])[0])
+            rows = int(params.get("rows", [10])[0])
+            response = MockResponse(start, rows)
+            response.mock_docs = MockResponse.mock_docs[::-1]
+            return status, response.xml_response()
+        return response
+
+def check_tail_slice(p_args, a, s):
+    d = {}
+    si = SolrInterface("http://test.example.com/", http_connection=SortingMockConnection(d))
+    search = si.query("*").sort_by("int_field").paginate(*p_args)
+    assert_equal([doc['int_field'] for doc in search[s]], a[s])
+    assert_equal(len(d['requests']), 1)
+
+def check_tail_index(p_args, a, k):
+    d = {}
+    si = SolrInterface("http://test.example.com/", http_connection=SortingMockConnection(d))
+    search = si.query("*").sort_by("int_field").paginate(*p_args)
+    try:
+        value = search[k]['int_field']
+    except IndexError:
+        value = IndexError
+    try:
+        expected = a[k]
+    except IndexError:
+        expected = IndexError
+    assert_equal(value, expected)
+    assert_equal(len(d['requests']), 1)
+
+def test_tail_pagination():
+    # Results counted from the end of a search sorted on the unique key
+    # are fetched in one request, sorted in reverse.
+    for p_args, a in (((None, None), range(10)), ((3, None), range(3, 10))):
+        for s in (slice(-3, None), slice(-5, -1), slice(-1, -5, -1),
+                  slice(None, -4, -1), slice(-8, None, 3), slice(-100, -90),
+                  slice(-100, None), slice(-1, -100, -2)):
+            yield check_tail_slice, p_args, a, s
+        for k in (-1, -4, -7, -10, -11):
+            yield check_tail_index, p_args, a, k
+
+def test_tail_pagination_missing_values():
+    # Documents missing sint_field sort last both ways round, so sorting
+    # in reverse wouldn't give the last results; they're counted instead.
+    d = {}
+    si = SolrInterface("http://test.example.com/", http_connection=SortingMockConnection(d))
+    search = si.query("*").sort_by("sint_field").sort_by("int_field")
+    assert not search.sorter.reversible()
+    assert_equal(search[-1]['int_field'], 9)
+    assert_equal(d['requests'], [(0, 0), (9, 1)])
+    assert_equal([doc['int_field'] for doc in search[-3:]], [7, 8, 9])
+    assert_equal(d['requests'][2:], [(7, 3)])
+    # and so are those of a search sorted first on a required field
+    # which has sortMissingLast set.
+    assert not si.query("*").sort_by("text_field").sort_by("int_field").sorter.reversible()
+    assert si.query("*").sort_by("-int_field").sort_by("sint_field").sorter.reversible()
+
+def test_shared_count():
+    d = {}
+    si = SolrInterface("http://test.example.com/", http_connection=SortingMockConnection(d))
+    search = si.query("*")
+    # Any page of the query tells its clones how many results there are
+    assert_equal(len(search.paginate(rows=3).execute()), 3)
+    assert_equal(search.count(), 10)
+    assert_equal(search.paginate(start=4).count(), 6)
+    assert_equal(search.sort_by("-int_field").count(), 10)
+    assert_equal([doc['int_field'] for doc in search[-2:]], [8, 9])
+    assert_equal(search[-1]['int_field'], 9)
+    assert_equal(len(d['requests']), 3)
+    # Unlike a different query
+    assert_equal(search.query(int_field=3).count(), 10)
+    assert_equal(len(d['requests']), 4)
+
+iteration_tests = (
+    ((None, None), 3, range(0, 10), [(0, 3), (3, 3), (6, 3), (9, 3)]),
+    ((None, None), 5, range(0, 10), [(0, 5), (5, 5)]),
+    ((None, None), None, range(0, 10), [(0, 100)]),
+    ((2, 6), 4, range(2, 8), [(2, 4), (6, 2)]),
+    ((8, None), 4, range(8, 10), [(8, 4)]),
+    ((None, 0), 4, [], []),
+)
+
+def check_iteration(p_args, batch_size, a, requests):
+    d = {}
+    si = SolrInterface("http://test.example.com/", http_connection=CountingPaginationMockConnection(d))
+    q = si.query("*").paginate(*p_args)
+    if batch_size is None:
+        docs = [doc['int_field'] for doc in q]
+    else:
+        docs = [doc['int_field'] for doc in q.iterate(batch_size=batch_size)]
+    assert_equal(docs, a)
+    assert_equal(d.get('requests', []), requests)
+
+def test_iteration():
+    for p_args, batch_size, a, requests in iteration_tests:
+        yield check_iteration, p_args, batch_size, a, requests
+
+def test_list_search():
+    # list() asks for the search's length first, which costs a count
+    # (and no results) unless the count is known already; truth testing
+    # does the same.
+    for p_args, requests in [((None, None), [(0, 0), (0, 100)]),
+                             ((2, None), [(2, 0), (2, 100)]),
+                             ((2, 6), [(2, 6)])]:
+        d = {}
+        si = SolrInterface("http://test.example.com/", http_connection=CountingPaginationMockConnection(d))
+        search = si.query("*").paginate(*p_args)
+        assert search
+        docs = [doc['int_field'] for doc in list(search)]
+        assert_equal(docs, range(p_args[0] or 0, 10)[:p_args[1]])
+        assert_equal(d.get('requests', []), requests)
+        assert_equal(len(search), len(docs))
+        assert_equal(d.get('requests', []), requests)
+
+def check_prefetched_iteration(p_args, batch_size, a, requests):
+    d = {}
+    si = SolrInterface("http://test.example.com/", http_connection=CountingPaginationMockConnection(d))
+    q = si.query("*").paginate(*p_args)
+    docs = [doc['int_field'] for doc in q.iterate(batch_size=batch_size, prefetch=2)]
+    assert_equal(docs, a)
+    # The last page is cut to fit once the number of results is known
+    assert_equal(sorted(start for start, rows in d.get('requests', [])),
+                 [start for start, rows in requests])
+
+def test_prefetched_iteration():
+    for p_args, batch_size, a, requests in iteration_tests:
+        if batch_size is not None:
+            yield check_prefetched_iteration, p_args, batch_size, a, requests
+
+
+class Row(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+def test_streaming_query():
+    response = conn.query("*").paginate(rows=5).execute(stream=True)
+    assert_equal(response.result.numFound, 10)
+    assert_equal([d['int_field'] for d in response], range(0, 5))
+    response = conn.query("*").paginate(start=5).execute(constructor=Row, stream=True)
+    assert_equal([d.int_field for d in response.result.docs], range(5, 10))
+
+
+def test_lazy_query():
+    response = conn.query("*").paginate(rows=5).execute(lazy=True)
+    assert_equal([d['int_field'] for d in response], range(0, 5))
+    response = conn.query("*").results_as(Row).execute(lazy=True)
+    assert_equal([d.string_field for d in response], [s for _, s in MockResponse.mock_doc_seeds])
+
+
+class CursorMockResponse(MockResponse):
+    def __init__(self, cursor, rows):
+        self.start = 0 if cursor == "*" else int(cursor)
+        self.rows = rows
+
+    def xml_response(self):
+        all_docs = self.mock_docs
+        self.mock_docs = all_docs[self.start:]
+        next_cursor = str(min(self.start + self.rows, len(all_docs)))
+        self.start = 0
+        response = fromstring(super(CursorMockResponse, self).xml_response())
+        response.append(E.str({'name':'nextCursorMark'}, next_cursor))
+        return tostring(response)
+
+class CursorMockConnection(MockConnection):
+    def _handle_request(self, uri_obj, params, method, body, headers):
+        if method == 'GET' and uri_obj.path.endswith('/select/'):
+            self.tracking_dict.setdefault('requests', []).append(params)
+            return self.MockStatus(200), CursorMockResponse(params['cursorMark'][0],
+                                                            int(params['rows'][0])).xml_response()
+
+def check_iter_all(batch_size, requests):
+    d = {}
+    si = SolrInterface("http://test.example.com/", http_connection=CursorMockConnection(d))
+    search = si.query("*").sort_by("-boolean_field")
+    docs = list(search.iter_all(batch_size=batch_size))
+    assert_equal([doc['int_field'] for doc in docs], range(10))
+    # Every page has the same count, remembered once
+    assert_equal(len(search.counts), 1)
+    assert_equal([p['cursorMark'][0] for p in d['requests']], requests)
+    assert_equal(d['requests'][0]['sort'], ['boolean_field desc, int_field asc'])
+    assert 'start' not in d['requests'][0]
+
+def test_iter_all():
+    yield check_iter_all, 3, ['*', '3', '6', '9']
+    yield check_iter_all, 5, ['*', '5', '10']
+    yield check_iter_all, 20, ['*']
+
+def test_iter_all_keeps_unique_key_sort():
+    d = {}
+    si = SolrInterface("http://test.example.com/", http_connection=CursorMockConnection(d))
+    list(si.query("*").sort_by("-int_field").iter_all())
+    assert_equal(d['requests'][0]['sort'], ['int_field desc'])
+    try:
+        list(si.query("*").paginate(start=5).iter_all())
+    except SolrError:
+        pass
+    else:
+        assert False
+
+
+class PartitionMockConnection(MockConnection):
+    """Serves the mock docs, filtered on int_field ranges, with stats
+    and cursors."""
+    def _handle_request(self, uri_obj, params, method, body, headers):
+        if method != 'GET' or not uri_obj.path.endswith('/select/'):
+            return
+        docs = MockResponse.mock_docs
+        for fq in params.get('fq', []):
+            for lower in re.findall(r"int_field:\[(\d+) TO \*\]", fq):
+                docs = [doc for doc in docs if doc['int_field'] >= int(lower)]
+            for upper in re.findall(r"int_field:\{\* TO (\d+)\}", fq):
+                docs = [doc for doc in docs if doc['int_field'] < int(upper)]
+        if params.get('stats') == ['true']:
+            self.tracking_dict['stats_field'] = params['stats.field']
+            values = [doc['int_field'] for doc in docs]
+            response = MockResponse(0, 0)
+            response.extra_response_parts = lambda: [
+                E.lst({'name':'stats'}, E.lst({'name':'stats_fields'},
+                    E.lst({'name':'int_field'},
+                          E.double({'name':'min'}, str(float(min(values)))),
+                          E.double({'name':'max'}, str(float(max(values)))))))]
+            return self.MockStatus(200), response.xml_response()
+        self.tracking_dict.setdefault('filters', set()).add(tuple(params.get('fq', [])))
+        response = CursorMockResponse(params['cursorMark'][0], int(params['rows'][0]))
+        response.mock_docs = docs
+        return self.MockStatus(200), response.xml_response()
+
+def test_partition():
+    d = {}
+    si = SolrInterface("http://test.example.com/", http_connection=PartitionMockConnection(d))
+    searches = si.query("*").partition(4)
+    assert_equal(d['stats_field'], ['int_field'])
+    assert_equal([s.params() for s in searches],
+                 [[('fq', 'int_field:{* TO 2}'), ('q', '*')],
+                  [('fq', 'int_field:[2 TO *] AND int_field:{* TO 4}'), ('q', '*')],
+                  [('fq', 'int_field:[4 TO *] AND int_field:{* TO 6}'), ('q', '*')],
+                  [('fq', 'int_field:[6 TO *]'), ('q', '*')]])
+    # Integer ranges can't be split any finer than one value wide
+    assert_equal(len(si.query("*").partition(20)), 9)
+    try:
+        si.query("*").partition(4, field="string_field")
+    except SolrError:
+        pass
+    else:
+        assert False
+
+class StringKeyPartitionMockConnection(PartitionMockConnection):
+    file_dict = {'schema.xml': schema_string.replace("<uniqueKey>int_field</uniqueKey>",
+                                                     "<uniqueKey>text_field</uniqueKey>")}
+
+def test_partition_string_key():
+    # A string unique key can't be split into ranges, so a field to
+    # partition on has to be given.
+    d = {}
+    si = SolrInterface("http://test.example.com/", http_connection=StringKeyPartitionMockConnection(d))
+    try:
+        si.query("*").partition(4)
+    except SolrError:
+        pass
+    else:
+        assert False
+    assert 'stats_field' not in d
+    assert_equal(len(si.query("*").partition(4, field="int_field")), 4)
+
+def test_export_parallel():
+    d = {}
+    si = SolrInterface("http://test.example.com/", http_connection=PartitionMockConnection(d))
+    docs = list(si.query("*").export_parallel(partitions=3, batch_size=2))
+    assert_equal(sorted(doc['int_field'] for doc in docs), range(10))
+    assert_equal(len(d['filters']), 3)
+
+
+class ExportMockConnection(MockConnection):
+    """Serves the mock docs' int_field values from /export, in JSON."""
+    def _handle_request(self, uri_obj, params, method, body, headers):
+        if method != 'GET' or not uri_obj.path.endswith('/export'):
+            return
+        self.tracking_dict.update(params)
+        docs = [{'int_field': doc['int_field']} for doc in MockResponse.mock_docs]
+        return self.MockStatus(200), json.dumps(
+            {'responseHeader': {'status': 0},
+             'response': {'numFound': len(docs), 'docs': docs}})
+
+def test_export():
+    d = {}
+    si = SolrInterface("http://test.example.com/", http_connection=ExportMockConnection(d))
+    docs = si.query("*").field_limit("int_field").export()
+    assert_equal([doc['int_field'] for doc in docs], range(10))
+    assert_equal(d['fl'], ['int_field'])
+    assert_equal(d['sort'], ['int_field asc'])
+    assert_equal(d['wt'], ['json'])
+    rows = list(si.query("*").export(fields="int_field", constructor=Row))
+    assert_equal([row.int_field for row in rows], range(10))
+    for search in (si.query("*"),
+                   si.query("*").field_limit("int_field", score=True),
+                   si.query("*").field_limit("string_field"),
+                   si.query("*").field_limit("int_field").sort_by("long_field")):
+        try:
+            search.export()
+        except SolrError:
+            pass
+        else:
+            assert False
+
+
 class MLTMockConnection(MockConnection):
     def _handle_request(self, u, params, method, body, headers):
         return self.MockStatus(200), MockResponse(1, 2).xml_response()
@@ -374,3 +696,189 @@ def test_get_file_and_included_files_list_includes_all_required_files():
     assert_in('schema.xml', file_list)
     assert_in('schema_extra_fields.xml', file_list)
     assert_in('schema_extra_types.xml', file_list)
+
+
+class UpdateMockConnection(MockConnection):
+    def _handle_request(self, uri_obj, params, method, body, headers):
+        if method == 'POST' and uri_obj.path.endswith(('/update/', '/update/json')):
+            self.tracking_dict.setdefault('bodies', []).append(body)
+            return self.MockStatus(200), ''
+
+
+class CachingMockConnection(CountingPaginationMockConnection, UpdateMockConnection):
+    def _handle_request(self, uri_obj, params, method, body, headers):
+        if method == 'POST':
+            return UpdateMockConnection._handle_request(
+                self, uri_obj, params, method, body, headers)
+        return CountingPaginationMockConnection._handle_request(
+            self, uri_obj, params, method, body, headers)
+
+def test_count_after_update():
+    d = {}
+    si = SolrInterface("http://test.example.com/", http_connection=CachingMockConnection(d))
+    search = si.query("*")
+    assert_equal(search.count(), 10)
+    assert_equal(search.count(), 10)
+    assert_equal(len(d['requests']), 1)
+    # Updating the index through the interface forgets the counts
+    si.commit()
+    assert not search.count_known()
+    assert_equal(search.count(), 10)
+    assert_equal(len(d['requests']), 2)
+
+def test_query_cache():
+    d = {}
+    cache = QueryCache()
+    si = SolrInterface("http://test.example.com/", http_connection=CachingMockConnection(d),
+                       cache=cache)
+    for i in range(3):
+        assert_equal([doc['int_field'] for doc in si.query("*").paginate(rows=5).execute()],
+                     range(5))
+    assert_equal(len(d['requests']), 1)
+    # Hits are parsed afresh, so results aren't shared
+    response = si.query("*").paginate(rows=5).execute()
+    response.result.docs.pop()
+    assert_equal(len(si.query("*").paginate(rows=5).execute()), 5)
+    si.query("*").paginate(start=5, rows=5).execute()
+    assert_equal(len(d['requests']), 2)
+    # Streamed queries go straight to Solr
+    list(si.query("*").paginate(rows=5).execute(stream=True))
+    assert_equal(len(d['requests']), 3)
+    assert_equal(cache.stats(), {'hits': 4, 'misses': 2, 'evictions': 0,
+                                 'invalidations': 0, 'entries': 2,
+                                 'bytes': cache.bytes})
+    si.add({"int_field":1, "text_field":"a", "string_field":"b"})
+    assert_equal(len(cache), 0)
+    si.query("*").paginate(rows=5).execute()
+    assert_equal(len(d['requests']), 4)
+    for update in (si.commit, si.rollback, lambda: si.delete(queries=si.Q("a"))):
+        update()
+        assert_equal(len(cache), 0)
+        si.query("*").paginate(rows=5).execute()
+    assert_equal(cache.stats()['invalidations'], 4)
+
+
+def test_query_cache_shared():
+    # Interfaces to different cores can share a cache without being
+    # given each other's responses.
+    cache = QueryCache()
+    d1, d2 = {}, {}
+    si1 = SolrInterface("http://test.example.com/core1/", http_connection=CachingMockConnection(d1),
+                        cache=cache)
+    si2 = SolrInterface("http://test.example.com/core2/", http_connection=CachingMockConnection(d2),
+                        cache=cache)
+    for si in (si1, si2, si1, si2):
+        si.query("*").paginate(rows=5).execute()
+    assert_equal(len(d1['requests']), 1)
+    assert_equal(len(d2['requests']), 1)
+    assert_equal(len(cache), 2)
+
+
+class UpdatingMockConnection(CachingMockConnection):
+    """Commits through interface while answering its first query."""
+    interface = None
+    def _handle_request(self, uri_obj, params, method, body, headers):
+        if method == 'GET' and self.interface is not None:
+            interface, self.interface = self.interface, None
+            interface.commit()
+        return CachingMockConnection._handle_request(
+            self, uri_obj, params, method, body, headers)
+
+def test_query_cache_update_in_flight():
+    d = {}
+    cache = QueryCache()
+    conn = UpdatingMockConnection(d)
+    si = SolrInterface("http://test.example.com/", http_connection=conn, cache=cache)
+    conn.interface = si
+    si.query("*").paginate(rows=5).execute()
+    # The response may be from before the commit, so isn't cached
+    assert_equal(len(cache), 0)
+    si.query("*").paginate(rows=5).execute()
+    si.query("*").paginate(rows=5).execute()
+    assert_equal(len(d['requests']), 2)
+    assert_equal(len(cache), 1)
+
+
+class ConditionalMockConnection(PaginationMockConnection):
+    """Serves responses with an ETag, and 304s to requests which have
+    it, unless the index version in tracking_dict changes."""
+    class MockStatus(dict):
+        def __init__(self, status, etag=None):
+            self.status = status
+            if etag is not None:
+                self['etag'] = etag
+
+    def _handle_request(self, uri_obj, params, method, body, headers):
+        etag = '"%s"' % self.tracking_dict.setdefault('version', 1)
+        self.tracking_dict.setdefault('conditions', []).append(
+            (headers or {}).get('If-None-Match'))
+        if (headers or {}).get('If-None-Match') == etag:
+            return self.MockStatus(304), ''
+        status, content = super(ConditionalMockConnection, self)._handle_request(
+            uri_obj, params, method, body, headers)
+        return self.MockStatus(200, etag), content
+
+def test_conditional_get():
+    d = {}
+    cache = ValidatorCache()
+    si = SolrInterface("http://test.example.com/", http_connection=ConditionalMockConnection(d),
+                       validator_cache=cache)
+    parses = []
+    parse_response = si.schema.parse_response
+    si.schema.parse_response = lambda *args: parses.append(args) or parse_response(*args)
+    first = si.query("*").paginate(rows=5).execute(constructor=Row)
+    second = si.query("*").paginate(rows=5).execute()
+    assert_equal(d['conditions'], [None, '"1"'])
+    assert_equal(len(parses), 1)
+    # The reused response is a copy, untouched by the first constructor
+    assert_equal([row.int_field for row in first], range(5))
+    assert_equal([doc['int_field'] for doc in second], range(5))
+    second.result.docs[0]['int_field'] = 100
+    assert_equal(si.query("*").paginate(rows=5).execute()[0]['int_field'], 0)
+    assert_equal(len(parses), 1)
+    # A changed index means a new response
+    d['version'] = 2
+    assert_equal(len(si.query("*").paginate(rows=5).execute()), 5)
+    assert_equal(d['conditions'][-1], '"1"')
+    assert_equal(len(parses), 2)
+    assert_equal(cache.stats(), {'hits': 2, 'misses': 2, 'entries': 1})
+    # Lazy responses reuse the body, but are parsed each time
+    assert_equal(si.query("*").paginate(rows=5).execute(lazy=True)[1]['int_field'], 1)
+    assert_equal(d['conditions'][-1], '"2"')
+
+
+def test_streaming_add():
+    d = {}
+    si = SolrInterface("http://test.example.com/", http_connection=UpdateMockConnection(d))
+    docs = [{"int_field":i, "text_field":"a", "string_field":"b"} for i in range(5)]
+    si.add(docs, chunk=2, stream=True)
+    bodies = d['bodies']
+    assert_equal(len(bodies), 3)
+    si.add(docs, chunk=2)
+    assert_equal(bodies[:3], bodies[3:])
+
+
+def test_json_format_updates():
+    d = {}
+    si = SolrInterface("http://test.example.com/", http_connection=UpdateMockConnection(d))
+    doc = {"int_field":1, "text_field":"a", "string_field":"b"}
+    si.add(doc, format='json')
+    assert urlparse.urlparse(d['url']).path.endswith('/update/json')
+    assert_equal(d['headers']['Content-Type'], "application/json; charset=utf-8")
+    assert_equal(json.loads(d['body']), [{"int_field":"1", "text_field":"a", "string_field":"b"}])
+    si.delete(doc, format='json', commit=True)
+    assert_equal(d['url'], "http://test.example.com/update/json?commit=true")
+    assert_equal(d['body'], '{"delete":{"id": "1"}}')
+    # xml stays the default for an xml interface
+    si.add(doc)
+    assert urlparse.urlparse(d['url']).path.endswith('/update/')
+    assert_equal(d['headers']['Content-Type'], "text/xml; charset=utf-8")
+
+
+def test_json_interface_updates_in_json():
+    d = {}
+    si = SolrInterface("http://test.example.com/", http_connection=UpdateMockConnection(d), format='json')
+    si.add({"int_field":1, "text_field":"a", "string_field":"b"})
+    assert urlparse.urlparse(d['url']).path.endswith('/update/json')
+    si.add({"int_field":1, "text_field":"a", "string_field":"b"}, format='xml')
+    assert urlparse.urlparse(d['url']).path.endswith('/update/')